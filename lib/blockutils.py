@@ -0,0 +1,158 @@
+import errno
+import fcntl
+import mmap
+import os
+import stat
+import struct
+
+# Bytes moved per kernel copy call, small enough to keep the caller responsive
+KERNEL_COPY_CHUNK = 64 * 1048576
+
+# Errors meaning "this copy method is not available for these descriptors"
+_COPY_UNSUPPORTED = (errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP)
+
+# Block device ioctls from <linux/fs.h>, taking a (start, length) pair of uint64
+BLKDISCARD = 0x1277
+BLKSECDISCARD = 0x127d
+BLKZEROOUT = 0x127f
+
+# Returns the device size in bytes as a uint64
+BLKGETSIZE64 = 0x80081272
+
+# Zero-filled blocks by length, compared against with memcmp speed
+_zero_blocks = {}
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def kernel_copy(src_fd, dst_fd, count, offset=0, chunk_size=KERNEL_COPY_CHUNK):
+    """
+    Copies count bytes of src_fd, starting at offset, to the current position of dst_fd
+    without passing them through user space (copy_file_range, then sendfile).
+    Yields the number of bytes moved by each call. Stops early if the kernel refuses
+    every method, leaving the caller to copy the remainder itself.
+    """
+    methods = [_sendfile]
+    if hasattr(os, 'copy_file_range'):
+        methods.insert(0, _copy_file_range)
+    end = offset + count
+    while offset < end and methods:
+        try:
+            n = methods[0](src_fd, dst_fd, offset, min(chunk_size, end - offset))
+        except OSError as e:
+            if e.errno not in _COPY_UNSUPPORTED:
+                raise
+            methods.pop(0)
+            continue
+        if n == 0:
+            break
+        offset += n
+        yield n
+
+
+def is_zero(data):
+    """Returns True if data, any bytes-like object, contains only zero bytes."""
+    zero = _zero_blocks.get(len(data))
+    if zero is None:
+        zero = _zero_blocks[len(data)] = bytes(len(data))
+    # startswith() takes any buffer and compares with memcmp, unlike memoryview equality
+    return zero.startswith(data)
+
+
+def aligned_buffers(count, size):
+    """
+    Allocates count anonymous mmap buffers of size bytes.
+    mmap memory is page aligned, which satisfies O_DIRECT for any logical block size.
+    """
+    return [mmap.mmap(-1, size) for _ in range(count)]
+
+
+def write_all(fd, data):
+    """Writes all of data to fd, looping over short writes."""
+    view = memoryview(data)
+    while len(view):
+        n = os.write(fd, view)
+        view = view[n:]
+
+
+def write_direct(fd, data, sector_size):
+    """
+    Writes data to a descriptor opened with O_DIRECT.
+    A trailing partial sector, which O_DIRECT cannot take, is written after clearing the flag.
+    """
+    view = memoryview(data)
+    aligned = len(view) - len(view) % sector_size
+    write_all(fd, view[:aligned])
+    if aligned < len(view):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+        write_all(fd, view[aligned:])
+
+
+def device_size(fd):
+    """Returns the size in bytes of the block device, or regular file, open as fd."""
+    if stat.S_ISBLK(os.fstat(fd).st_mode):
+        return struct.unpack('Q', fcntl.ioctl(fd, BLKGETSIZE64, bytes(8)))[0]
+    return os.fstat(fd).st_size
+
+
+def _sysfs_queue_dir(device):
+    """Returns the sysfs queue directory of a block device, using the parent disk for partitions."""
+    name = os.path.basename(os.path.realpath(device))
+    path = os.path.realpath(os.path.join('/sys/class/block', name))
+    if os.path.exists(os.path.join(path, 'partition')):
+        path = os.path.dirname(path)
+    return os.path.join(path, 'queue')
+
+
+def queue_limit(device, name):
+    """Reads an integer queue limit such as write_zeroes_max_bytes, returning 0 if unavailable."""
+    try:
+        with open(os.path.join(_sysfs_queue_dir(device), name)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def block_range_ioctl(fd, request, start, length):
+    """Issues BLKDISCARD, BLKSECDISCARD or BLKZEROOUT on a byte range of the device."""
+    fcntl.ioctl(fd, request, struct.pack('QQ', start, length))
+
+
+def read_ranges(device, ranges, sector_size, block_size=1048576):
+    """
+    Reads (start, end) byte ranges of device, bypassing the page cache, and yields memoryviews
+    of their contents in order. Each view is only valid until the next one is requested.
+    O_DIRECT is used when the device supports it, otherwise cached pages are dropped first.
+    """
+    buf = mmap.mmap(-1, block_size)
+    try:
+        fd = os.open(device, os.O_RDONLY | os.O_DIRECT)
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+        fd = os.open(device, os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    try:
+        view = memoryview(buf)
+        for start, end in ranges:
+            pos = start
+            while pos < end:
+                aligned = pos - pos % sector_size
+                span = end - aligned
+                length = min(block_size, span + -span % sector_size)
+                os.lseek(fd, aligned, os.SEEK_SET)
+                n = os.readv(fd, [view[:length]])
+                if n <= pos - aligned:
+                    raise EOFError(f"Unexpected end of device at offset {pos}")
+                stop = min(n, span)
+                yield view[pos - aligned:stop]
+                pos = aligned + stop
+    finally:
+        os.close(fd)
@@ -0,0 +1,235 @@
+"""
+Block map (.bmap) files, in the XML format used by bmaptool.
+
+A bmap lists the ranges of an image that hold data, each with a checksum, so that
+only those ranges need to be written and every one of them can be verified.
+"""
+import hashlib
+import re
+import xml.etree.ElementTree as ET
+
+from blockutils import is_zero
+
+BMAP_VERSION = "2.0"
+BMAP_BLOCK_SIZE = 4096
+BMAP_CHECKSUM_TYPE = "sha256"
+
+BMAP_TEMPLATE = """<?xml version="1.0" ?>
+<bmap version="{version}">
+    <ImageSize> {image_size} </ImageSize>
+    <BlockSize> {block_size} </BlockSize>
+    <BlocksCount> {blocks_count} </BlocksCount>
+    <MappedBlocksCount> {mapped_blocks_count} </MappedBlocksCount>
+    <ChecksumType> {checksum_type} </ChecksumType>
+    <BmapFileChecksum> {file_checksum} </BmapFileChecksum>
+    <BlockMap>
+{ranges}    </BlockMap>
+</bmap>
+"""
+
+_FILE_CHECKSUM_RE = re.compile(rb'(<BmapFileChecksum>\s*)([0-9a-fA-F]+)(\s*</BmapFileChecksum>)')
+
+
+class Bmap:
+    """An image size, block size and list of (first_block, last_block, checksum) mapped ranges."""
+
+    def __init__(self, image_size, block_size, ranges, checksum_type=BMAP_CHECKSUM_TYPE):
+        self.image_size = image_size
+        self.block_size = block_size
+        self.ranges = ranges
+        self.checksum_type = checksum_type
+
+    @property
+    def blocks_count(self):
+        return (self.image_size + self.block_size - 1) // self.block_size
+
+    @property
+    def mapped_blocks_count(self):
+        return sum(last - first + 1 for first, last, _ in self.ranges)
+
+    def byte_ranges(self):
+        """Returns the mapped ranges as (start, end, checksum) byte offsets, clipped to the image size."""
+        return [(first * self.block_size,
+                 min((last + 1) * self.block_size, self.image_size),
+                 checksum)
+                for first, last, checksum in self.ranges]
+
+
+def load_bmap(path):
+    """
+    Parses a bmap file, checking its own checksum when it has one.
+    Raises ValueError if the file is malformed or was modified.
+    """
+    with open(path, 'rb') as f:
+        text = f.read()
+    try:
+        root = ET.fromstring(text)
+        major = int(root.get('version', '1.0').split('.')[0])
+        image_size = int(root.findtext('ImageSize'))
+        block_size = int(root.findtext('BlockSize'))
+        # Version 1 files always use SHA-1
+        checksum_type = (root.findtext('ChecksumType') or 'sha1').strip()
+        ranges = []
+        for element in root.find('BlockMap').findall('Range'):
+            first, _, last = element.text.strip().partition('-')
+            checksum = element.get('chksum') or element.get('sha1')
+            ranges.append((int(first), int(last or first), checksum))
+    except (ET.ParseError, AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid bmap file '{path}': {e}")
+    if checksum_type not in hashlib.algorithms_available:
+        raise ValueError(f"Unsupported bmap checksum type '{checksum_type}'")
+
+    match = _FILE_CHECKSUM_RE.search(text)
+    if major >= 2 and match:
+        expected = match.group(2).decode().lower()
+        zeroed = text[:match.start(2)] + b'0' * len(expected) + text[match.end(2):]
+        if hashlib.new(checksum_type, zeroed).hexdigest() != expected:
+            raise ValueError(f"Bmap file '{path}' does not match its checksum")
+    return Bmap(image_size, block_size, ranges, checksum_type)
+
+
+def save_bmap(path, bmap):
+    """Writes a version 2.0 bmap file, including its own checksum."""
+    checksum_length = hashlib.new(bmap.checksum_type).digest_size * 2
+    ranges = "".join(
+        f'        <Range chksum="{checksum}"> {first}{"" if first == last else f"-{last}"} </Range>\n'
+        for first, last, checksum in bmap.ranges)
+    fields = dict(version=BMAP_VERSION,
+                  image_size=bmap.image_size,
+                  block_size=bmap.block_size,
+                  blocks_count=bmap.blocks_count,
+                  mapped_blocks_count=bmap.mapped_blocks_count,
+                  checksum_type=bmap.checksum_type,
+                  ranges=ranges)
+    text = BMAP_TEMPLATE.format(file_checksum='0' * checksum_length, **fields)
+    file_checksum = hashlib.new(bmap.checksum_type, text.encode()).hexdigest()
+    with open(path, 'w') as f:
+        f.write(BMAP_TEMPLATE.format(file_checksum=file_checksum, **fields))
+
+
+class BmapBuilder:
+    """
+    Builds a bmap from the image data, fed in order in chunks of any size.
+    Blocks containing only zeros are left unmapped.
+    """
+
+    def __init__(self, block_size=BMAP_BLOCK_SIZE, checksum_type=BMAP_CHECKSUM_TYPE):
+        self.block_size = block_size
+        self.checksum_type = checksum_type
+        self.ranges = []
+        self.size = 0
+        self.next_block = 0
+        self.range_first = None
+        self.range_hash = None
+        self.partial = b''
+
+    def _map(self, view):
+        """Adds whole or trailing partial blocks to the current range."""
+        if self.range_first is None:
+            self.range_first = self.next_block
+            self.range_hash = hashlib.new(self.checksum_type)
+        self.range_hash.update(view)
+        self.next_block += (len(view) + self.block_size - 1) // self.block_size
+
+    def _skip(self, blocks):
+        self._end_range()
+        self.next_block += blocks
+
+    def _end_range(self):
+        if self.range_first is not None:
+            self.ranges.append((self.range_first, self.next_block - 1, self.range_hash.hexdigest()))
+            self.range_first = None
+            self.range_hash = None
+
+    def _blocks(self, view):
+        bs = self.block_size
+        if is_zero(view):
+            self._skip(len(view) // bs)
+            return
+        # Hash runs of data blocks with a single update each
+        run_start = None
+        for i in range(0, len(view), bs):
+            if is_zero(view[i:i + bs]):
+                if run_start is not None:
+                    self._map(view[run_start:i])
+                    run_start = None
+                self._skip(1)
+            elif run_start is None:
+                run_start = i
+        if run_start is not None:
+            self._map(view[run_start:])
+
+    def update(self, data):
+        view = memoryview(data)
+        self.size += len(view)
+        if self.partial:
+            needed = self.block_size - len(self.partial)
+            self.partial += bytes(view[:needed])
+            view = view[needed:]
+            if len(self.partial) < self.block_size:
+                return
+            self._blocks(memoryview(self.partial))
+            self.partial = b''
+        whole = len(view) - len(view) % self.block_size
+        if whole:
+            self._blocks(view[:whole])
+        self.partial = bytes(view[whole:])
+
+    def finish(self):
+        """Returns the Bmap of all data fed so far."""
+        if self.partial:
+            if is_zero(self.partial):
+                self._skip(1)
+            else:
+                self._map(memoryview(self.partial))
+            self.partial = b''
+        self._end_range()
+        return Bmap(self.size, self.block_size, self.ranges, self.checksum_type)
+
+
+class BmapFilter:
+    """
+    Splits the image stream into the parts covered by a bmap, checking the checksum of
+    each range once all of its data has been seen. finish() checks that the stream
+    covered the whole image, so that no range is left unwritten and unchecked.
+    """
+
+    def __init__(self, bmap):
+        self.checksum_type = bmap.checksum_type
+        self.image_size = bmap.image_size
+        self.ranges = bmap.byte_ranges()
+        self.index = 0
+        self.range_hash = None
+        self.offset = 0
+
+    def mapped(self, offset, chunk):
+        """
+        Yields (offset, view) for the mapped parts of chunk, which starts at offset in the image.
+        Chunks must be passed in order. Raises ValueError if a range does not match its checksum.
+        """
+        view = memoryview(chunk)
+        end = offset + len(view)
+        self.offset = max(self.offset, end)
+        while self.index < len(self.ranges):
+            start, stop, checksum = self.ranges[self.index]
+            if start >= end:
+                break
+            lo = max(start, offset)
+            hi = min(stop, end)
+            if lo < hi:
+                if self.range_hash is None:
+                    self.range_hash = hashlib.new(self.checksum_type)
+                part = view[lo - offset:hi - offset]
+                self.range_hash.update(part)
+                yield lo, part
+            if stop > end:
+                break
+            if self.range_hash is not None and checksum and self.range_hash.hexdigest() != checksum:
+                raise ValueError(f"Checksum mismatch for image bytes {start}-{stop - 1}")
+            self.range_hash = None
+            self.index += 1
+
+    def finish(self):
+        """Raises ValueError if the stream ended before the end of the image the bmap describes."""
+        if self.index < len(self.ranges) or self.offset < self.image_size:
+            raise ValueError(f"Image ends at byte {self.offset}, but its block map describes {self.image_size} bytes")
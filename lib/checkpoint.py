@@ -0,0 +1,158 @@
+"""
+On-disk checkpoints of long operations on a device.
+
+While wiping or writing, the helpers flush the device every DEFAULT_INTERVAL
+seconds and then record how far they got in a small JSON file under
+CHECKPOINT_DIR, named after the operation and the device's identity. With
+--resume, an interrupted operation continues from that offset, provided the
+file describes the same device and the same parameters.
+
+A device is identified by its size and, where sysfs or udev know them, its
+serial number, WWID and model, plus the start of a partition. Devices with none
+of those are also told apart by their path.
+"""
+import hashlib
+import json
+import os
+import syslog
+import time
+
+from blockutils import device_size
+
+CHECKPOINT_DIR = '/var/lib/driveutility'
+DEFAULT_INTERVAL = 30
+FORMAT_VERSION = 1
+
+
+def _read_sysfs(path):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _udev_serial(disk_path):
+    """Returns ID_SERIAL from the udev database entry of a disk's sysfs directory, if any."""
+    dev = _read_sysfs(os.path.join(disk_path, 'dev'))
+    if not dev:
+        return None
+    try:
+        with open(f'/run/udev/data/b{dev}') as f:
+            for line in f:
+                if line.startswith('E:ID_SERIAL='):
+                    return line.strip().split('=', 1)[1] or None
+    except OSError:
+        pass
+    return None
+
+
+def device_identity(device):
+    """Returns a dict identifying device across runs and reboots."""
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        identity = {'size': device_size(fd)}
+    finally:
+        os.close(fd)
+
+    name = os.path.basename(os.path.realpath(device))
+    path = os.path.realpath(os.path.join('/sys/class/block', name))
+    disk = path
+    if os.path.exists(os.path.join(path, 'partition')):
+        identity['partition_start'] = _read_sysfs(os.path.join(path, 'start'))
+        disk = os.path.dirname(path)
+    for key, relative in (('serial', 'device/serial'), ('wwid', 'wwid'), ('wwid', 'device/wwid'), ('model', 'device/model')):
+        if key not in identity:
+            value = _read_sysfs(os.path.join(disk, relative))
+            if value:
+                identity[key] = value
+    if 'serial' not in identity:
+        serial = _udev_serial(disk)
+        if serial:
+            identity['serial'] = serial
+    if 'serial' not in identity and 'wwid' not in identity:
+        identity['path'] = os.path.realpath(device)
+    return identity
+
+
+class Checkpoint:
+    """
+    The checkpoint file of operation ("wipe" or "write") on device, for the given parameters.
+    Callers keep what they need to resume in state and call save() with the offset up to which
+    the data is known to be on the device, that is after an fsync. due() tells whether interval
+    seconds went by since the last save. Failing to save is logged, and the operation goes on.
+    """
+
+    def __init__(self, operation, device, parameters, directory=CHECKPOINT_DIR, interval=DEFAULT_INTERVAL, clock=time.monotonic):
+        self.operation = operation
+        self.device = device
+        self.identity = device_identity(device)
+        self.parameters = parameters
+        self.interval = interval
+        self.clock = clock
+        self.state = {}
+        self.last_save = clock()
+        self.failed = False
+        key = hashlib.sha256(json.dumps(self.identity, sort_keys=True).encode()).hexdigest()[:16]
+        self.directory = directory
+        self.path = os.path.join(directory, f"{operation}-{key}.json")
+
+    def load(self):
+        """
+        Returns the state saved for this device and these parameters, or None if there is no
+        checkpoint or it was saved for another device or other parameters.
+        """
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            syslog.syslog(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        if saved.get('v') != FORMAT_VERSION or saved.get('operation') != self.operation or saved.get('identity') != self.identity:
+            syslog.syslog(f"Checkpoint {self.path} is for another device, ignoring it")
+            return None
+        if saved.get('parameters') != json.loads(json.dumps(self.parameters)):
+            syslog.syslog(f"Checkpoint {self.path} was saved with other parameters, ignoring it")
+            return None
+        return saved.get('state')
+
+    def due(self):
+        return not self.failed and self.clock() - self.last_save >= self.interval
+
+    def save(self, **fields):
+        """Updates state with fields and writes the checkpoint, replacing the previous one atomically."""
+        self.state.update(fields)
+        self.last_save = self.clock()
+        if self.failed:
+            return
+        data = {
+            'v': FORMAT_VERSION,
+            'operation': self.operation,
+            'device': self.device,
+            'identity': self.identity,
+            'parameters': self.parameters,
+            'state': self.state,
+            'saved': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        temporary = self.path + '.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except OSError as e:
+            syslog.syslog(f"Could not save checkpoint {self.path}, the operation cannot be resumed: {e}")
+            self.failed = True
+
+    def remove(self):
+        """Deletes the checkpoint once the operation is complete."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            syslog.syslog(f"Could not remove checkpoint {self.path}: {e}")
@@ -0,0 +1,173 @@
+"""
+Parallel decoders for multi-frame zstd and multi-block xz images.
+
+Both formats can be split into units that decode independently: zstd frames, and
+xz blocks once they are wrapped in a minimal stream of their own. Units are read
+in order, decoded on a thread pool (liblzma and libzstd release the GIL) and
+handed out in the original order through a read-only file-like object.
+
+Decoding ahead is bounded by the decoded size of the units, which xz indexes and
+most zstd frame headers declare, so that images with very large blocks do not fill
+the memory. Units of unknown size are only decoded a couple at a time.
+"""
+import collections
+import concurrent.futures
+import functools
+import io
+import lzma
+import os
+import struct
+import zlib
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+from sizeprobe import xz_streams, zstd_frames, XZ_HEADER_MAGIC, XZ_FOOTER_MAGIC
+
+# Decoded bytes held ahead of the reader, at least one unit whatever its size
+MAX_PENDING_BYTES = 256 * 1048576
+# Units held ahead of the reader while one of them has an unknown decoded size
+UNKNOWN_SIZE_PENDING = 2
+
+
+def _xz_varint(value):
+    """Encodes an xz multibyte integer."""
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_xz_block(stream_flags, unpadded_size, uncompressed_size, block):
+    """
+    Decodes a single xz block by wrapping it in a stream with a one-record index.
+    block must include the block padding and check field.
+    """
+    header = XZ_HEADER_MAGIC + stream_flags + struct.pack('<I', zlib.crc32(stream_flags))
+    index = b'\x00' + _xz_varint(1) + _xz_varint(unpadded_size) + _xz_varint(uncompressed_size)
+    index += b'\x00' * (-len(index) % 4)
+    index += struct.pack('<I', zlib.crc32(index))
+    backward = struct.pack('<I', len(index) // 4 - 1) + stream_flags
+    footer = struct.pack('<I', zlib.crc32(backward)) + backward + XZ_FOOTER_MAGIC
+    return lzma.LZMADecompressor(format=lzma.FORMAT_XZ).decompress(header + block + index + footer)
+
+
+def decode_zstd_frame(frame):
+    """Decodes a single zstd frame, whether or not it declares its content size."""
+    return zstandard.ZstdDecompressor().decompressobj().decompress(frame)
+
+
+def xz_units(fileobj):
+    """Returns (offset, length, decode, decoded_size) for every block of an xz file."""
+    units = []
+    for _, stream_flags, blocks in xz_streams(fileobj):
+        for offset, unpadded, uncompressed in blocks:
+            decode = functools.partial(decode_xz_block, stream_flags, unpadded, uncompressed)
+            units.append((offset, (unpadded + 3) & ~3, decode, uncompressed))
+    return units
+
+
+def zstd_units(fileobj):
+    """Returns (offset, length, decode, decoded_size) for every frame of a zstd file; decoded_size may be None."""
+    return [(offset, length, decode_zstd_frame, content_size) for offset, length, content_size in zstd_frames(fileobj)]
+
+
+class ParallelDecoder(io.RawIOBase):
+    """
+    Reads compressed units from fileobj in order and decodes them ahead of the reader:
+    up to twice as many units as there are threads, and no more than max_bytes of
+    decoded data unless a single unit is larger.
+    """
+
+    def __init__(self, fileobj, units, threads, max_bytes=MAX_PENDING_BYTES):
+        super().__init__()
+        self.fileobj = fileobj
+        self.units = iter(units)
+        self.next_unit = next(self.units, None)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.pending = collections.deque()
+        self.max_pending = threads * 2
+        self.max_bytes = max_bytes
+        self.pending_bytes = 0
+        self.unknown_pending = 0
+        self.buffer = b''
+        self.pos = 0
+        self._submit()
+
+    def _has_room(self, size):
+        if not self.pending:
+            return True
+        if len(self.pending) >= self.max_pending:
+            return False
+        if size is None or self.unknown_pending:
+            return len(self.pending) < UNKNOWN_SIZE_PENDING
+        return self.pending_bytes + size <= self.max_bytes
+
+    def _submit(self):
+        while self.next_unit is not None and self._has_room(self.next_unit[3]):
+            offset, length, decode, size = self.next_unit
+            self.next_unit = next(self.units, None)
+            self.fileobj.seek(offset)
+            data = self.fileobj.read(length)
+            if len(data) != length:
+                raise EOFError("Compressed image is truncated")
+            if size is None:
+                self.unknown_pending += 1
+            else:
+                self.pending_bytes += size
+            self.pending.append((self.executor.submit(decode, data), size))
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.pos >= len(self.buffer):
+            if not self.pending:
+                return 0
+            future, size = self.pending.popleft()
+            if size is None:
+                self.unknown_pending -= 1
+            else:
+                self.pending_bytes -= size
+            self.buffer = future.result()
+            self.pos = 0
+            self._submit()
+        n = min(len(b), len(self.buffer) - self.pos)
+        b[:n] = memoryview(self.buffer)[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        for future, _ in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+        super().close()
+
+
+def open_parallel_decoder(fileobj, compression_method, threads=None):
+    """
+    Returns a ParallelDecoder for fileobj if the format can be decoded in parallel and
+    the image has more than one independent unit, otherwise None.
+    """
+    threads = threads or os.cpu_count() or 1
+    if threads < 2:
+        return None
+    try:
+        if compression_method == 'xz':
+            units = xz_units(fileobj)
+        elif compression_method == 'zstd' and ZSTD_AVAILABLE:
+            units = zstd_units(fileobj)
+        else:
+            return None
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    finally:
+        fileobj.seek(0)
+    if len(units) < 2:
+        return None
+    return ParallelDecoder(fileobj, units, threads)
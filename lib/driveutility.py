@@ -5,6 +5,7 @@ from subprocess import Popen, PIPE
 import getopt
 import gettext
 import gi
+import json
 import locale
 import os
 import re
@@ -76,12 +77,15 @@ class DriveUtility:
         # --- Common attributes ---
         self.process = None
         self.source_id = None
+        self.details_source_id = None
+        self.progress_details = ""
         self.selected_write_device = None
         self.selected_read_device = None
         self.selected_format_device = None
         self.selected_wipe_device = None
         self.write_progress = None
         self.read_progress = None
+        self.wipe_progress = None
         self.last_used_device_path = None
 
         # --- Write Mode Widgets ---
@@ -778,7 +782,6 @@ class DriveUtility:
     def check_wipe_job(self):
         self.process.poll()
         if self.process.returncode is None:
-            self.pulse_progress(self.wipe_progressbar)
             return True
         else:
             return_code = self.process.returncode
@@ -787,7 +790,7 @@ class DriveUtility:
             return False
 
     def raw_wipe(self, device, wipe_type, passes, final_zero, size):
-        cmd = ['/usr/bin/driveutility-wipe', '-d', device, '-t', wipe_type, '-p', str(passes)]
+        cmd = ['/usr/bin/driveutility-wipe', '-d', device, '-t', wipe_type, '-p', str(passes), '--progress-fd', '2']
         if final_zero:
             cmd.append('-z')
         if size > 0:
@@ -795,14 +798,20 @@ class DriveUtility:
         if os.geteuid() > 0: cmd.insert(0, 'pkexec')
         
         self.process = Popen(cmd, shell=False, stdout=PIPE, stderr=PIPE, preexec_fn=os.setsid)
-        self.pulse_progress(self.wipe_progressbar)
+        self.wipe_progress = 0
+        self.source_id = GLib.io_add_watch(self.process.stdout, GLib.IO_IN | GLib.IO_HUP, self.update_progress, self.wipe_progressbar, "wipe_progress")
+        self.watch_progress_details()
         GLib.timeout_add(500, self.check_wipe_job)
 
     def wipe_job_done(self, rc):
         self.udisks_client.handler_unblock(self.udisk_listener_id)
         self.reset_ui_state()
         if rc == 0:
+            self.set_progress(self.wipe_progressbar, 1.0)
             self.show_wipe_result("emblem-ok-symbolic", _('The disk was wiped successfully.'))
+        elif rc == 5:
+            message = _("The data read back from %s does not match what was written.") % self.selected_wipe_device
+            self.show_wipe_result("dialog-error-symbolic", message)
         elif rc == 127:
             self.show_wipe_result("dialog-error-symbolic", _('Authentication Error.'))
         elif rc == 126:
@@ -861,12 +870,15 @@ class DriveUtility:
     def set_progress(self, progressbar, size):
         progressbar.set_fraction(size)
         str_progress = f"{float(size) * 100:.0f}%"
+        if self.progress_details:
+            str_progress += " — " + self.progress_details
         int_progress = int(float(size) * 100)
         progressbar.set_text(str_progress)
         XApp.set_window_progress_pulse(self.window, False)
         XApp.set_window_progress(self.window, int_progress)
 
     def clear_progress(self, progressbar):
+        self.progress_details = ""
         progressbar.set_fraction(0.0)
         progressbar.set_text("")
         progressbar.hide()
@@ -881,6 +893,11 @@ class DriveUtility:
         if Using_Unity: launcher.set_property("progress_visible", True)
         if condition is GLib.IO_IN:
             line = fd.readline().decode('utf-8')
+            if line.strip() == "verifying":
+                # The helper starts over with the read-back of the written data
+                setattr(self, progress_attr, 0)
+                GLib.idle_add(self.set_progress, progressbar, 0.0)
+                return True
             try:
                 size = float(line.strip())
                 current_progress = getattr(self, progress_attr, 0) or 0
@@ -898,18 +915,48 @@ class DriveUtility:
                 self.source_id = None
             return False
             
+    def update_progress_details(self, fd, condition):
+        # Helpers write JSON progress records to stderr (--progress-fd 2), between any error messages
+        if condition is GLib.IO_IN:
+            line = fd.readline().decode('utf-8', 'replace')
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return True
+            if isinstance(record, dict) and record.get("v") == 1 and record.get("type") == "progress":
+                self.progress_details = self.format_progress_details(record)
+            return True
+        else:
+            if self.details_source_id:
+                GLib.source_remove(self.details_source_id)
+                self.details_source_id = None
+            return False
+
+    def format_progress_details(self, record):
+        details = []
+        rate = record.get("rate") or record.get("average_rate")
+        if rate:
+            details.append(_("%s/s") % GLib.format_size(int(rate)))
+        eta = record.get("eta")
+        if eta:
+            if eta >= 60:
+                details.append(_("%d min left") % round(eta / 60))
+            else:
+                details.append(_("%d s left") % eta)
+        return ", ".join(details)
+
+    def watch_progress_details(self):
+        self.progress_details = ""
+        self.details_source_id = GLib.io_add_watch(self.process.stderr, GLib.IO_IN | GLib.IO_HUP, self.update_progress_details)
+
     def raw_write(self, source, target):
-        _, compression = self.get_opener_by_magic(source)
-        cmd = ['/usr/bin/driveutility-write', '-s', source, '-t', target]
+        cmd = ['/usr/bin/driveutility-write', '-s', source, '-t', target, '--progress-fd', '2']
         if os.geteuid() > 0: cmd.insert(0, 'pkexec')
         self.process = Popen(cmd, shell=False, stdout=PIPE, stderr=PIPE, preexec_fn=os.setsid)
         self.write_progress = 0
-        if compression:
-             self.source_id = None
-             GLib.timeout_add(100, self.check_write_job_pulsing)
-        else:
-             self.source_id = GLib.io_add_watch(self.process.stdout, GLib.IO_IN | GLib.IO_HUP, self.update_progress, self.write_progressbar, "write_progress")
-             GLib.timeout_add(500, self.check_write_job)
+        self.source_id = GLib.io_add_watch(self.process.stdout, GLib.IO_IN | GLib.IO_HUP, self.update_progress, self.write_progressbar, "write_progress")
+        self.watch_progress_details()
+        GLib.timeout_add(500, self.check_write_job)
 
     def check_write_job(self):
         self.process.poll()
@@ -921,13 +968,9 @@ class DriveUtility:
             GLib.idle_add(self.write_job_done, return_code)
             return False
             
-    def check_write_job_pulsing(self):
-        self.pulse_progress(self.write_progressbar)
-        return self.check_write_job()
-        
     def raw_read(self, source, target, compression):
         cmd = ['/usr/bin/driveutility-read', '-s', source, '-t', target,
-            '-u', str(os.geteuid()), '-g', str(os.getgid())]
+            '-u', str(os.geteuid()), '-g', str(os.getgid()), '--progress-fd', '2']
         if compression:
             cmd.extend(['-c', compression])
         if os.geteuid() > 0:
@@ -936,6 +979,7 @@ class DriveUtility:
         self.process = Popen(cmd, shell=False, stdout=PIPE, stderr=PIPE, preexec_fn=os.setsid)
         self.read_progress = 0
         self.source_id = GLib.io_add_watch(self.process.stdout, GLib.IO_IN | GLib.IO_HUP, self.update_progress, self.read_progressbar, "read_progress")
+        self.watch_progress_details()
         GLib.timeout_add(500, self.check_read_job)
 
     def check_read_job(self):
@@ -948,25 +992,6 @@ class DriveUtility:
             GLib.idle_add(self.read_job_done, return_code)
             return False
 
-    def get_opener_by_magic(self, file_path):
-        MAGIC_NUMBERS = {
-            b'\x1f\x8b': 'gzip',
-            b'BZh': 'bzip2',
-            b'\xfd7zXZ\x00': 'xz',
-            b'\x04"M\x18': 'lz4',
-        }
-        if ZSTD_AVAILABLE:
-            MAGIC_NUMBERS[b'(\xb5/\xfd'] = 'zstd'
-        try:
-            with open(file_path, 'rb') as f:
-                header = f.read(16)
-                for magic, name in MAGIC_NUMBERS.items():
-                    if header.startswith(magic):
-                        return open, name
-        except (IOError, FileNotFoundError):
-            return None, None
-        return open, None
-
     def write_job_done(self, rc):
         self.udisks_client.handler_unblock(self.udisk_listener_id)
         self.reset_ui_state()
@@ -980,6 +1005,8 @@ class DriveUtility:
             self.show_write_result("dialog-error-symbolic", _('Not enough space on the destination disk.'))
         elif rc == 4:
             self.show_write_result("dialog-error-symbolic", _('An error occured while writing the image.'))
+        elif rc == 5:
+            self.show_write_result("dialog-error-symbolic", _('The data written to the disk does not match the image.'))
         elif rc == 127:
             self.show_write_result("dialog-error-symbolic", _('Authentication Error.'))
         elif rc == 126:
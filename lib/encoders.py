@@ -0,0 +1,116 @@
+"""
+Block-parallel compression for disk images.
+
+Input is cut into large blocks that are compressed independently on a thread pool
+and written out in order, each block as a complete gzip member, xz stream, bzip2
+stream, lz4 frame or zstd frame. Concatenations of these are valid files for every
+standard decompressor, including the ones driveutility-write uses. Images are
+compressed this way even on a single thread, so that all-zero blocks, which make
+up most of a typical disk, are compressed only once. zstd and lz4 frames carry a
+content checksum, as their command-line tools write by default, so that corrupted
+images fail to decode.
+"""
+import bz2
+import collections
+import concurrent.futures
+import gzip
+import lzma
+
+from blockutils import is_zero
+
+DEFAULT_BLOCK_SIZE = 8 * 1048576
+
+# xz compresses better with blocks of a few dictionary sizes, as xz -T does
+BLOCK_SIZES = {
+    'xz': 24 * 1048576,
+}
+
+# Valid and default compression levels for each format
+LEVELS = {
+    'gzip': (range(1, 10), 9),
+    'bzip2': (range(1, 10), 9),
+    'xz': (range(0, 10), 6),
+    'lz4': (range(0, 17), 0),
+    'zstd': (range(1, 23), 3),
+}
+
+
+def _compress_lz4(data, level):
+    import lz4.frame
+    return lz4.frame.compress(data, compression_level=level, content_checksum=True)
+
+
+def _compress_zstd(data, level):
+    import zstandard
+    return zstandard.ZstdCompressor(level=level, write_checksum=True).compress(data)
+
+
+COMPRESSORS = {
+    'gzip': lambda data, level: gzip.compress(data, compresslevel=level),
+    'bzip2': lambda data, level: bz2.compress(data, compresslevel=level),
+    'xz': lambda data, level: lzma.compress(data, preset=level),
+    'lz4': _compress_lz4,
+    'zstd': _compress_zstd,
+}
+
+
+class ParallelCompressor:
+    """
+    Writable file-like object compressing blocks of block_size bytes on threads workers.
+    At most twice as many blocks as there are threads are held in memory.
+    """
+
+    def __init__(self, fileobj, compression_method, level, threads, block_size=None):
+        self.fileobj = fileobj
+        self.compress = COMPRESSORS[compression_method]
+        self.level = level
+        self.block_size = block_size or BLOCK_SIZES.get(compression_method, DEFAULT_BLOCK_SIZE)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.pending = collections.deque()
+        self.max_pending = threads * 2
+        self.block = bytearray()
+        # Compressed all-zero blocks by length, so empty regions are only compressed once
+        self.zero_blocks = {}
+
+    def _submit(self, data):
+        while len(self.pending) >= self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+        if is_zero(data):
+            if len(data) not in self.zero_blocks:
+                self.zero_blocks[len(data)] = self.compress(data, self.level)
+            future = concurrent.futures.Future()
+            future.set_result(self.zero_blocks[len(data)])
+        else:
+            future = self.executor.submit(self.compress, data, self.level)
+        self.pending.append(future)
+
+    def write(self, data):
+        self.block += data
+        while len(self.block) >= self.block_size:
+            self._submit(bytes(self.block[:self.block_size]))
+            del self.block[:self.block_size]
+        return len(data)
+
+    def flush(self):
+        """Writes out blocks that are already compressed, without cutting the current block short."""
+        while self.pending and self.pending[0].done():
+            self.fileobj.write(self.pending.popleft().result())
+        self.fileobj.flush()
+
+    def close(self):
+        if self.block:
+            self._submit(bytes(self.block))
+            self.block = bytearray()
+        try:
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown(wait=True)
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,351 @@
+"""
+Allocation maps of the filesystems driveutility can create: ext4, FAT32, exFAT and NTFS.
+
+Each parser reads the on-disk allocation structures (block group bitmaps, the
+FAT, the exFAT allocation bitmap or the NTFS $Bitmap file) and returns the byte
+ranges of a partition that hold filesystem data. Anything a parser cannot account
+for, such as space past the end of the filesystem, is reported as allocated, so an
+image made from these ranges only ever drops space the filesystem marks as free.
+"""
+import re
+import struct
+
+EXT4_MAGIC = 0xEF53
+
+# ext4 feature flags used to locate metadata
+EXT4_FEATURE_COMPAT_SPARSE_SUPER2 = 0x200
+EXT4_FEATURE_INCOMPAT_META_BG = 0x10
+EXT4_FEATURE_INCOMPAT_64BIT = 0x80
+EXT4_FEATURE_RO_COMPAT_SPARSE_SUPER = 0x1
+EXT4_FEATURE_RO_COMPAT_GDT_CSUM = 0x10
+EXT4_FEATURE_RO_COMPAT_BIGALLOC = 0x200
+EXT4_FEATURE_RO_COMPAT_METADATA_CSUM = 0x400
+EXT4_BG_BLOCK_UNINIT = 0x2
+
+NTFS_BITMAP_RECORD = 6
+NTFS_ATTR_DATA = 0x80
+NTFS_ATTR_END = 0xFFFFFFFF
+
+EXFAT_ENTRY_BITMAP = 0x81
+EXFAT_ENTRY_END = 0x00
+
+# Runs of free and fully used bytes, and single mixed bytes, of an allocation bitmap
+_BITMAP_RUNS = re.compile(rb'\x00+|\xff+|[\x01-\xfe]')
+_ZERO_RUNS = re.compile(rb'\x00+')
+
+
+def _add_run(runs, first, end):
+    """Appends [first, end) to a sorted list of runs, merging it with the last one if they touch."""
+    if runs and runs[-1][1] >= first:
+        runs[-1][1] = max(runs[-1][1], end)
+    else:
+        runs.append([first, end])
+
+
+def bit_runs(bitmap, count):
+    """Returns the [first, end) runs of set bits among the first count bits of bitmap, LSB first."""
+    runs = []
+    for match in _BITMAP_RUNS.finditer(bitmap):
+        byte = match.group()[0]
+        bit = match.start() * 8
+        if bit >= count:
+            break
+        if byte == 0xFF:
+            _add_run(runs, bit, min(match.end() * 8, count))
+        elif byte:
+            for i in range(8):
+                if byte >> i & 1 and bit + i < count:
+                    _add_run(runs, bit + i, bit + i + 1)
+    return runs
+
+
+def used_entry_runs(table, entry_size, first, count):
+    """Returns the [first, end) runs of non-zero entries among count table entries starting at entry first."""
+    runs = []
+    used = first
+    for match in _ZERO_RUNS.finditer(table, first * entry_size, (first + count) * entry_size):
+        free_first = -(-match.start() // entry_size)
+        free_end = match.end() // entry_size
+        if free_first < free_end:
+            if used < free_first:
+                runs.append([used, free_first])
+            used = free_end
+    if used < first + count:
+        runs.append([used, first + count])
+    return runs
+
+
+def _read(f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) != length:
+        raise ValueError("Unexpected end of device")
+    return data
+
+
+def ext4_ranges(f, start):
+    """Returns (ranges, covered) for an ext2/3/4 filesystem, or None if there is none at start."""
+    sb = _read(f, start + 1024, 1024)
+    if struct.unpack_from('<H', sb, 56)[0] != EXT4_MAGIC:
+        return None
+    first_data_block, log_block_size = struct.unpack_from('<II', sb, 20)
+    blocks_per_group = struct.unpack_from('<I', sb, 32)[0]
+    inodes_per_group = struct.unpack_from('<I', sb, 40)[0]
+    rev_level = struct.unpack_from('<I', sb, 76)[0]
+    inode_size = struct.unpack_from('<H', sb, 88)[0] if rev_level else 128
+    compat, incompat, ro_compat = struct.unpack_from('<III', sb, 92)
+    reserved_gdt_blocks = struct.unpack_from('<H', sb, 0xCE)[0]
+    block_size = 1024 << log_block_size
+    # With bigalloc, each bit of a block bitmap stands for a cluster of blocks
+    cluster_ratio = 1
+    if ro_compat & EXT4_FEATURE_RO_COMPAT_BIGALLOC:
+        cluster_ratio = 1 << (struct.unpack_from('<I', sb, 28)[0] - log_block_size)
+    blocks_count = struct.unpack_from('<I', sb, 4)[0]
+    desc_size = 32
+    if incompat & EXT4_FEATURE_INCOMPAT_64BIT:
+        blocks_count |= struct.unpack_from('<I', sb, 0x150)[0] << 32
+        desc_size = struct.unpack_from('<H', sb, 0xFE)[0]
+    if incompat & EXT4_FEATURE_INCOMPAT_META_BG:
+        # Group descriptors are spread over the disk, leave this filesystem alone
+        return None
+
+    groups = -(-(blocks_count - first_data_block) // blocks_per_group)
+    # Group descriptors follow the block holding the superblock, which is block 1 with 1 KiB
+    # blocks even when bigalloc sets first_data_block to 0
+    superblock_block = 1024 // block_size
+    gdt = _read(f, start + (superblock_block + 1) * block_size, groups * desc_size)
+    gdt_blocks = -(-groups * desc_size // block_size)
+    inode_table_blocks = -(-inodes_per_group * inode_size // block_size)
+    uninit_valid = ro_compat & (EXT4_FEATURE_RO_COMPAT_GDT_CSUM | EXT4_FEATURE_RO_COMPAT_METADATA_CSUM)
+    backup_groups = struct.unpack_from('<II', sb, 0x24C)
+
+    def has_super(group):
+        if group == 0:
+            return True
+        if compat & EXT4_FEATURE_COMPAT_SPARSE_SUPER2:
+            return group in backup_groups
+        if not ro_compat & EXT4_FEATURE_RO_COMPAT_SPARSE_SUPER or group == 1:
+            return True
+        for base in (3, 5, 7):
+            n = base
+            while n < group:
+                n *= base
+            if n == group:
+                return True
+        return False
+
+    blocks = [[0, superblock_block + 1]]
+    metadata = []
+    for group in range(groups):
+        desc = gdt[group * desc_size:(group + 1) * desc_size]
+        block_bitmap, inode_bitmap, inode_table = struct.unpack_from('<III', desc, 0)
+        flags = struct.unpack_from('<H', desc, 0x12)[0]
+        if desc_size >= 64:
+            hi = struct.unpack_from('<III', desc, 0x20)
+            block_bitmap |= hi[0] << 32
+            inode_bitmap |= hi[1] << 32
+            inode_table |= hi[2] << 32
+        # With flex_bg these can live in other groups, including uninitialized ones
+        metadata += [[block_bitmap, block_bitmap + 1],
+                     [inode_bitmap, inode_bitmap + 1],
+                     [inode_table, inode_table + inode_table_blocks]]
+        group_start = first_data_block + group * blocks_per_group
+        group_blocks = min(blocks_per_group, blocks_count - group_start)
+        if uninit_valid and flags & EXT4_BG_BLOCK_UNINIT:
+            # The bitmap was never written: only the superblock backup and descriptors are in use
+            if has_super(group):
+                _add_run(blocks, group_start, group_start + 1 + gdt_blocks + reserved_gdt_blocks)
+            continue
+        bitmap = _read(f, start + block_bitmap * block_size, block_size)
+        for first, end in bit_runs(bitmap, -(-group_blocks // cluster_ratio)):
+            _add_run(blocks, group_start + first * cluster_ratio, group_start + end * cluster_ratio)
+
+    for first, end in metadata:
+        blocks.append([first, end])
+    blocks.sort()
+    ranges = []
+    for first, end in blocks:
+        _add_run(ranges, first * block_size, end * block_size)
+    return ranges, blocks_count * block_size
+
+
+def fat_ranges(f, start):
+    """Returns (ranges, covered) for a FAT16 or FAT32 filesystem, or None if there is none at start."""
+    boot = _read(f, start, 512)
+    if boot[510:512] != b'\x55\xaa' or boot[0] not in (0xEB, 0xE9):
+        return None
+    if b'FAT' not in boot[54:62] and b'FAT' not in boot[82:90]:
+        return None
+    bytes_per_sector, sectors_per_cluster, reserved, fats, root_entries, total16 = struct.unpack_from('<HBHBHH', boot, 11)
+    fat_size16 = struct.unpack_from('<H', boot, 22)[0]
+    total32, fat_size32 = struct.unpack_from('<II', boot, 32)
+    if bytes_per_sector not in (512, 1024, 2048, 4096) or not sectors_per_cluster or not fats:
+        return None
+    fat_size = fat_size16 or fat_size32
+    total = total16 or total32
+    root_sectors = -(-root_entries * 32 // bytes_per_sector)
+    data_start = reserved + fats * fat_size + root_sectors
+    count = (total - data_start) // sectors_per_cluster
+    if count < 4085:
+        # FAT12 packs entries in 12 bits and only exists on tiny volumes
+        return None
+    entry_size = 2 if count < 65525 else 4
+    fat = _read(f, start + reserved * bytes_per_sector, (count + 2) * entry_size)
+
+    cluster_size = sectors_per_cluster * bytes_per_sector
+    heap = data_start * bytes_per_sector
+    ranges = [[0, heap]]
+    for first, end in used_entry_runs(fat, entry_size, 2, count):
+        _add_run(ranges, heap + (first - 2) * cluster_size, heap + (end - 2) * cluster_size)
+    return ranges, heap + count * cluster_size
+
+
+def exfat_ranges(f, start):
+    """Returns (ranges, covered) for an exFAT filesystem, or None if there is none at start."""
+    boot = _read(f, start, 512)
+    if boot[3:11] != b'EXFAT   ':
+        return None
+    fat_offset, _, heap_offset, cluster_count, root_cluster = struct.unpack_from('<IIIII', boot, 80)
+    sector_shift, cluster_shift = boot[108], boot[109]
+    sector_size = 1 << sector_shift
+    cluster_size = 1 << (sector_shift + cluster_shift)
+    heap = heap_offset * sector_size
+    fat = _read(f, start + fat_offset * sector_size, (cluster_count + 2) * 4)
+
+    def read_chain(cluster, length=None):
+        data = bytearray()
+        seen = 0
+        while 2 <= cluster < cluster_count + 2 and seen <= cluster_count:
+            data += _read(f, start + heap + (cluster - 2) * cluster_size, cluster_size)
+            if length is not None and len(data) >= length:
+                break
+            cluster = struct.unpack_from('<I', fat, cluster * 4)[0]
+            seen += 1
+        return bytes(data[:length]) if length is not None else bytes(data)
+
+    root = read_chain(root_cluster)
+    for pos in range(0, len(root), 32):
+        entry_type = root[pos]
+        if entry_type == EXFAT_ENTRY_END:
+            return None
+        if entry_type == EXFAT_ENTRY_BITMAP:
+            first_cluster, length = struct.unpack_from('<IQ', root, pos + 20)
+            break
+    else:
+        return None
+    bitmap = read_chain(first_cluster, length)
+
+    ranges = [[0, heap]]
+    for first, end in bit_runs(bitmap, cluster_count):
+        _add_run(ranges, heap + first * cluster_size, heap + end * cluster_size)
+    return ranges, heap + cluster_count * cluster_size
+
+
+def _ntfs_fixup(record, sector_size):
+    """Applies the update sequence array of an NTFS record in place."""
+    usa_offset, usa_count = struct.unpack_from('<HH', record, 4)
+    usn = record[usa_offset:usa_offset + 2]
+    for i in range(1, usa_count):
+        end = i * sector_size
+        if record[end - 2:end] != usn:
+            raise ValueError("NTFS record is torn")
+        record[end - 2:end] = record[usa_offset + 2 * i:usa_offset + 2 * i + 2]
+
+
+def ntfs_runlist(data):
+    """Decodes an NTFS mapping pairs array into (lcn, length) runs, with lcn None for sparse runs."""
+    runs = []
+    lcn = 0
+    pos = 0
+    while pos < len(data) and data[pos]:
+        length_size = data[pos] & 0x0F
+        offset_size = data[pos] >> 4
+        pos += 1
+        length = int.from_bytes(data[pos:pos + length_size], 'little')
+        pos += length_size
+        if offset_size:
+            lcn += int.from_bytes(data[pos:pos + offset_size], 'little', signed=True)
+            runs.append((lcn, length))
+        else:
+            runs.append((None, length))
+        pos += offset_size
+    return runs
+
+
+def ntfs_ranges(f, start):
+    """Returns (ranges, covered) for an NTFS filesystem, or None if there is none at start."""
+    boot = _read(f, start, 512)
+    if boot[3:11] != b'NTFS    ':
+        return None
+    bytes_per_sector, sectors_per_cluster = struct.unpack_from('<HB', boot, 11)
+    if sectors_per_cluster > 0x80:
+        cluster_size = bytes_per_sector << (256 - sectors_per_cluster)
+    else:
+        cluster_size = bytes_per_sector * sectors_per_cluster
+    total_sectors, mft_lcn = struct.unpack_from('<QQ', boot, 40)
+    record_clusters = struct.unpack_from('<b', boot, 64)[0]
+    record_size = 1 << -record_clusters if record_clusters < 0 else record_clusters * cluster_size
+    cluster_count = total_sectors * bytes_per_sector // cluster_size
+
+    # The first MFT records are always contiguous at the start of $MFT
+    record = bytearray(_read(f, start + mft_lcn * cluster_size + NTFS_BITMAP_RECORD * record_size, record_size))
+    if record[:4] != b'FILE':
+        return None
+    _ntfs_fixup(record, bytes_per_sector)
+    pos = struct.unpack_from('<H', record, 20)[0]
+    bitmap = None
+    while pos + 8 <= len(record):
+        attr_type, attr_length = struct.unpack_from('<II', record, pos)
+        if attr_type == NTFS_ATTR_END or attr_length == 0:
+            break
+        if attr_type == NTFS_ATTR_DATA:
+            if record[pos + 8]:
+                pairs_offset = struct.unpack_from('<H', record, pos + 32)[0]
+                data_size = struct.unpack_from('<Q', record, pos + 48)[0]
+                data = bytearray()
+                for lcn, length in ntfs_runlist(record[pos + pairs_offset:pos + attr_length]):
+                    if lcn is None:
+                        data += bytes(length * cluster_size)
+                    else:
+                        data += _read(f, start + lcn * cluster_size, length * cluster_size)
+                bitmap = bytes(data[:data_size])
+            else:
+                value_length, value_offset = struct.unpack_from('<IH', record, pos + 16)
+                bitmap = bytes(record[pos + value_offset:pos + value_offset + value_length])
+            break
+        pos += attr_length
+    if bitmap is None:
+        return None
+
+    ranges = []
+    for first, end in bit_runs(bitmap, cluster_count):
+        _add_run(ranges, first * cluster_size, end * cluster_size)
+    return ranges, cluster_count * cluster_size
+
+
+PARSERS = (ext4_ranges, fat_ranges, exfat_ranges, ntfs_ranges)
+
+
+def allocated_ranges(f, start, length):
+    """
+    Returns the sorted [start, end) byte ranges, as offsets in f, of the partition at start
+    that hold data according to its filesystem, or None if no supported filesystem is found.
+    """
+    for parser in PARSERS:
+        try:
+            result = parser(f, start)
+        except (OSError, ValueError, IndexError, struct.error):
+            # A layout the parser gets wrong is imaged in full
+            result = None
+        if result is not None:
+            break
+    else:
+        return None
+    ranges, covered = result
+    absolute = []
+    for first, end in ranges:
+        if first < length:
+            _add_run(absolute, start + first, start + min(end, length))
+    if covered < length:
+        _add_run(absolute, start + covered, start + length)
+    return [(first, end) for first, end in absolute]
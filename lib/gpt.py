@@ -0,0 +1,90 @@
+"""
+GUID partition table headers.
+
+A GPT disk has a primary header at LBA 1 and a backup copy of the header and
+partition entries at the very end of the disk. When only the used part of a disk
+is copied, or it is copied to a device of another size, the backup has to be
+rebuilt at the new end and the primary header pointed at it.
+"""
+import struct
+import zlib
+
+GPT_SIGNATURE = b'EFI PART'
+
+# Offsets of the header fields that change when the table is moved
+_HEADER_SIZE = 12
+_HEADER_CRC = 16
+_MY_LBA = 24
+_ALTERNATE_LBA = 32
+_LAST_USABLE_LBA = 48
+_ENTRIES_LBA = 72
+_ENTRIES_COUNT = 80
+_ENTRY_SIZE = 84
+_ENTRIES_CRC = 88
+
+
+def is_gpt_header(sector):
+    return sector[:8] == GPT_SIGNATURE
+
+
+def entries_length(header):
+    """Returns the size in bytes of the partition entry array described by header."""
+    count, entry_size = struct.unpack_from('<II', header, _ENTRIES_COUNT)
+    return count * entry_size
+
+
+def entries_sectors(header, sector_size):
+    return (entries_length(header) + sector_size - 1) // sector_size
+
+
+def entries_lba(header):
+    return struct.unpack_from('<Q', header, _ENTRIES_LBA)[0]
+
+
+def _with_fields(header, my_lba, alternate_lba, last_usable_lba, first_entry_lba):
+    """Returns a copy of a header sector with new locations and a recomputed header CRC."""
+    sector = bytearray(header)
+    size = struct.unpack_from('<I', sector, _HEADER_SIZE)[0]
+    struct.pack_into('<QQ', sector, _MY_LBA, my_lba, alternate_lba)
+    struct.pack_into('<Q', sector, _LAST_USABLE_LBA, last_usable_lba)
+    struct.pack_into('<Q', sector, _ENTRIES_LBA, first_entry_lba)
+    struct.pack_into('<I', sector, _HEADER_CRC, 0)
+    struct.pack_into('<I', sector, _HEADER_CRC, zlib.crc32(bytes(sector[:size])))
+    return bytes(sector)
+
+
+def backup_length(header, sector_size):
+    """Returns the bytes needed at the end of a disk for the backup entries and header."""
+    return (entries_sectors(header, sector_size) + 1) * sector_size
+
+
+def relocate(header, entries, last_lba, sector_size):
+    """
+    Rebuilds a GPT for a disk whose last sector is last_lba.
+    header is the primary header sector and entries the partition entry array read from LBA 2
+    (or wherever the header points). Returns (primary_header, backup_lba, backup) where backup
+    is the entry array followed by the backup header, to be written at backup_lba.
+    Raises ValueError if the header is invalid or a partition does not fit the new size.
+    """
+    if not is_gpt_header(header):
+        raise ValueError("Not a GPT header")
+    length = entries_length(header)
+    entries = bytes(entries[:length])
+    if len(entries) != length:
+        raise ValueError("GPT partition entries are truncated")
+    if zlib.crc32(entries) != struct.unpack_from('<I', header, _ENTRIES_CRC)[0]:
+        raise ValueError("GPT partition entries do not match their checksum")
+
+    backup_entries_lba = last_lba - entries_sectors(header, sector_size)
+    last_usable = backup_entries_lba - 1
+    _, entry_size = struct.unpack_from('<II', header, _ENTRIES_COUNT)
+    for i in range(0, length, entry_size):
+        type_guid = entries[i:i + 16]
+        last = struct.unpack_from('<Q', entries, i + 40)[0]
+        if type_guid != bytes(16) and last > last_usable:
+            raise ValueError(f"GPT partition ending at sector {last} does not fit before sector {last_usable}")
+
+    primary = _with_fields(header, 1, last_lba, last_usable, entries_lba(header))
+    backup_header = _with_fields(header, last_lba, 1, last_usable, backup_entries_lba)
+    padding = bytes(-length % sector_size)
+    return primary, backup_entries_lba, entries + padding + backup_header
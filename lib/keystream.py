@@ -0,0 +1,153 @@
+"""
+Reproducible random data for wipes.
+
+Reading /dev/urandom is much slower than a fast drive can write, so random passes
+use a keystream instead: AES-256-CTR or ChaCha20 from the cryptography package,
+keyed once with a seed from os.urandom. Without cryptography, SHAKE-256 from
+hashlib is used, which is slower but needs nothing beyond the standard library.
+
+The stream is cut into CHUNK_SIZE chunks that are generated independently from
+the seed and the chunk index, so a buffer is filled by several threads at once
+and any part of the stream can be regenerated later from the seed alone, for
+example to verify a wipe without keeping a copy of what was written.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    CRYPTOGRAPHY_AVAILABLE = True
+except ImportError:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+SEED_SIZE = 32
+CHUNK_SIZE = 256 * 1024
+
+# Ciphers produce their keystream by encrypting zeros
+_ZEROS = bytes(CHUNK_SIZE)
+
+
+def has_aes_instructions():
+    """Returns True if the CPU advertises AES instructions, which make AES faster than ChaCha20."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith(('flags', 'Features')) and 'aes' in line.split(':', 1)[-1].split():
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+def default_algorithm():
+    if not CRYPTOGRAPHY_AVAILABLE:
+        return 'shake256'
+    return 'aes-ctr' if has_aes_instructions() else 'chacha20'
+
+
+def _cipher_stream(cipher, start, length, block):
+    """Returns length bytes of keystream from byte start of a chunk, for a cipher whose counter is at the block holding start."""
+    encryptor = cipher.encryptor()
+    skip = start % block
+    return encryptor.update(_ZEROS[:skip + length])[skip:]
+
+
+def _aes_ctr(seed, index, start, length):
+    # The chunk index is the upper half of the 128-bit counter block
+    counter = index.to_bytes(8, 'big') + (start // 16).to_bytes(8, 'big')
+    cipher = Cipher(algorithms.AES(seed), modes.CTR(counter), backend=default_backend())
+    return _cipher_stream(cipher, start, length, 16)
+
+
+def _chacha20(seed, index, start, length):
+    # 32-bit little-endian block counter followed by the 96-bit nonce, which holds the chunk index
+    nonce = (start // 64).to_bytes(4, 'little') + index.to_bytes(12, 'little')
+    cipher = Cipher(algorithms.ChaCha20(seed, nonce), mode=None, backend=default_backend())
+    return _cipher_stream(cipher, start, length, 64)
+
+
+def _shake256(seed, index, start, length):
+    return hashlib.shake_256(seed + index.to_bytes(8, 'little')).digest(start + length)[start:]
+
+
+GENERATORS = {
+    'aes-ctr': _aes_ctr,
+    'chacha20': _chacha20,
+    'shake256': _shake256,
+}
+
+
+class Keystream:
+    """
+    An endless random stream determined by seed, a new one from os.urandom if None.
+    fill() generates any part of it on up to workers threads, or on executor, which several
+    keystreams can share to stay within one CPU budget. Close it, or use it as a context
+    manager, to stop its own threads.
+    """
+
+    def __init__(self, seed=None, algorithm=None, workers=None, executor=None):
+        self.seed = seed if seed is not None else os.urandom(SEED_SIZE)
+        self.algorithm = algorithm or default_algorithm()
+        if self.algorithm not in GENERATORS:
+            raise ValueError(f"Unknown keystream algorithm '{self.algorithm}'")
+        if self.algorithm != 'shake256' and not CRYPTOGRAPHY_AVAILABLE:
+            raise ValueError(f"The '{self.algorithm}' keystream needs the cryptography package")
+        self._generate = GENERATORS[self.algorithm]
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+
+    def _fill_piece(self, view, index, start):
+        view[:] = self._generate(self.seed, index, start, len(view))
+
+    def fill(self, buf, offset):
+        """Fills buf, any writable bytes-like object, with the stream's bytes from offset on."""
+        view = memoryview(buf).cast('B')
+        futures = []
+        position = 0
+        while position < len(view):
+            index, start = divmod(offset + position, CHUNK_SIZE)
+            n = min(CHUNK_SIZE - start, len(view) - position)
+            futures.append(self._executor.submit(self._fill_piece, view[position:position + n], index, start))
+            position += n
+        for future in futures:
+            future.result()
+        view.release()
+
+    def read(self, offset, length):
+        """Returns length bytes of the stream from offset on."""
+        buf = bytearray(length)
+        self.fill(buf, offset)
+        return bytes(buf)
+
+    def reader(self, offset=0):
+        """Returns a file-like object reading the stream from offset on."""
+        return KeystreamReader(self, offset)
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class KeystreamReader(io.RawIOBase):
+    """Reads a Keystream sequentially, so it can feed a Pipeline like any input stream."""
+
+    def __init__(self, keystream, offset=0):
+        self.keystream = keystream
+        self.position = offset
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        self.keystream.fill(b, self.position)
+        self.position += len(b)
+        return len(b)
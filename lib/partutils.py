@@ -0,0 +1,100 @@
+import os
+import stat
+import syslog
+import parted
+
+import fsbitmap
+import gpt
+
+
+def get_source_size(source_path):
+    """
+    Get the size of the source. Handles both regular files and block devices.
+    """
+    try:
+        mode = os.stat(source_path).st_mode
+        if stat.S_ISBLK(mode):
+            syslog.syslog(f"Source '{source_path}' is a block device. Using 'parted' to get size.")
+            device = parted.getDevice(source_path)
+            return float(device.getLength() * device.sectorSize)
+        else:
+            syslog.syslog(f"Source '{source_path}' is a regular file. Using 'os.path.getsize'.")
+            return float(os.path.getsize(source_path))
+    except Exception as e:
+        syslog.syslog(f"Could not determine size of source '{source_path}': {e}")
+        return 0.0
+
+
+def is_block_device(path):
+    try:
+        return stat.S_ISBLK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def used_extent(device_path):
+    """
+    Returns (end, sector_size, gpt_table) for the partition table of a device, where end is
+    the byte offset just past the last partition and gpt_table is (header, entries) read from
+    a GPT disk or None for other tables. Returns None if the device has no partitions or no
+    partition table that parted recognizes.
+    """
+    try:
+        device = parted.getDevice(device_path)
+        disk = parted.newDisk(device)
+    except Exception as e:
+        syslog.syslog(f"No partition table found on '{device_path}': {e}")
+        return None
+    ends = [partition.geometry.end for partition in disk.partitions]
+    if not ends:
+        return None
+    sector_size = device.sectorSize
+    end = (max(ends) + 1) * sector_size
+
+    gpt_table = None
+    if disk.type == 'gpt':
+        with open(device_path, 'rb') as f:
+            f.seek(sector_size)
+            header = f.read(sector_size)
+            if gpt.is_gpt_header(header):
+                f.seek(gpt.entries_lba(header) * sector_size)
+                gpt_table = (header, f.read(gpt.entries_length(header)))
+    return end, sector_size, gpt_table
+
+
+def data_ranges(device_path, length):
+    """
+    Returns the sorted [start, end) byte ranges of the first length bytes of a device that may
+    hold data: the allocated blocks of partitions with a filesystem fsbitmap understands, and
+    everything else, including partition tables and gaps between partitions.
+    """
+    device = parted.getDevice(device_path)
+    try:
+        disk = parted.newDisk(device)
+        partitions = [(partition.geometry.start * device.sectorSize, partition.geometry.length * device.sectorSize)
+                      for partition in disk.partitions
+                      if not partition.type & parted.PARTITION_EXTENDED]
+    except Exception as e:
+        # A filesystem may span the whole device
+        syslog.syslog(f"No partition table found on '{device_path}': {e}")
+        partitions = [(0, length)]
+
+    ranges = []
+    position = 0
+    with open(device_path, 'rb') as f:
+        for start, size in sorted(partitions):
+            if position < start:
+                ranges.append([position, start])
+            allocated = fsbitmap.allocated_ranges(f, start, size)
+            if allocated is None:
+                syslog.syslog(f"No supported filesystem at offset {start} of '{device_path}', reading it all")
+                allocated = [[start, start + size]]
+            for first, end in allocated:
+                if ranges and ranges[-1][1] >= first:
+                    ranges[-1][1] = max(ranges[-1][1], end)
+                else:
+                    ranges.append([first, end])
+            position = max(position, start + size)
+    if position < length:
+        ranges.append([position, length])
+    return [(first, min(end, length)) for first, end in ranges if first < length]
@@ -0,0 +1,199 @@
+"""
+Bounded producer/consumer pipeline shared by the raw helpers.
+
+A decoder thread fills a fixed ring of reusable buffers from a (possibly
+compressing) input stream while the caller consumes them, so CPU-bound
+decompression and device I/O overlap instead of running back to back.
+FanOut extends this to several consumers sharing the same buffers.
+"""
+import queue
+import threading
+
+DEFAULT_DEPTH = 4
+
+# Marker placed on the data queue once the producer has reached end of stream
+_EOF = object()
+
+
+def readinto_full(stream, buf):
+    """
+    Fill buf from stream, looping over short reads.
+    Returns the number of bytes stored, which is less than len(buf) only at end of stream.
+    """
+    view = memoryview(buf)
+    filled = 0
+    readinto = getattr(stream, 'readinto', None)
+    while filled < len(view):
+        if readinto is not None:
+            n = readinto(view[filled:])
+        else:
+            data = stream.read(len(view) - filled)
+            n = len(data)
+            view[filled:filled + n] = data
+        if not n:
+            break
+        filled += n
+    view.release()
+    return filled
+
+
+class Pipeline:
+    """
+    Reads stream into a ring of depth buffers of block_size bytes on a background thread.
+    Iterating yields memoryviews of filled buffers in order; a buffer is handed back to
+    the reader as soon as the next one is requested, so callers must not keep a chunk
+    past the next iteration. If length is given, at most length bytes are read.
+    """
+
+    def __init__(self, stream, block_size, depth=DEFAULT_DEPTH, buffers=None, length=None):
+        self.stream = stream
+        self.block_size = block_size
+        self.remaining = length
+        self._free = queue.Queue()
+        self._full = queue.Queue()
+        self._stop = threading.Event()
+        if buffers is None:
+            buffers = [bytearray(block_size) for _ in range(depth)]
+        for buf in buffers:
+            self._free.put(buf)
+        self._thread = threading.Thread(target=self._produce, name="pipeline-reader")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                buf = self._free.get()
+                if self._stop.is_set():
+                    break
+                wanted = len(buf)
+                if self.remaining is not None:
+                    wanted = min(wanted, self.remaining)
+                    self.remaining -= wanted
+                view = memoryview(buf)[:wanted]
+                n = readinto_full(self.stream, view)
+                view.release()
+                if n:
+                    self._full.put((buf, n))
+                if n < len(buf):
+                    break
+            self._full.put((_EOF, 0))
+        except Exception as e:
+            self._full.put((e, 0))
+
+    def chunks(self):
+        """
+        Yields (buffer, memoryview) pairs in order without recycling them.
+        Each buffer must be handed back with release() once its data has been used.
+        """
+        while True:
+            buf, n = self._full.get()
+            if buf is _EOF:
+                return
+            if isinstance(buf, Exception):
+                raise buf
+            yield buf, memoryview(buf)[:n]
+
+    def release(self, buf):
+        """Returns a buffer obtained from chunks() to the reader."""
+        self._free.put(buf)
+
+    def __iter__(self):
+        for buf, view in self.chunks():
+            try:
+                yield view
+            finally:
+                view.release()
+                self.release(buf)
+
+    def close(self):
+        """Stops the reader thread and waits for it to exit."""
+        self._stop.set()
+        # Wake the reader up if it is waiting for a free buffer
+        self._free.put(bytearray(0))
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class _SharedBuffer:
+    """Counts the consumers still using a pipeline buffer and releases it after the last one."""
+
+    def __init__(self, pipeline, buf, users):
+        self.pipeline = pipeline
+        self.buf = buf
+        self.users = users
+        self.lock = threading.Lock()
+
+    def done(self):
+        with self.lock:
+            self.users -= 1
+            last = self.users == 0
+        if last:
+            self.pipeline.release(self.buf)
+
+
+class FanOut:
+    """
+    Runs each consumer on its own thread and hands every submitted item to all of them,
+    in order. Items refer to a pipeline buffer, which is released once every consumer is
+    done with it, so consumers may fall behind each other by up to the pipeline depth.
+
+    Consumers provide start(), consume(item) and finish(result), all called on the
+    consumer's own thread. A consumer whose start() or consume() raises is isolated: it
+    stops receiving data, its exception is recorded in errors, and the others carry on.
+    finish() is called on every consumer once close() is called.
+    """
+
+    def __init__(self, pipeline, consumers):
+        self.pipeline = pipeline
+        self.errors = {}
+        self._queues = []
+        self._threads = []
+        for consumer in consumers:
+            q = queue.Queue()
+            thread = threading.Thread(target=self._run, args=(consumer, q), name="pipeline-writer")
+            thread.daemon = True
+            thread.start()
+            self._queues.append(q)
+            self._threads.append(thread)
+
+    def _run(self, consumer, q):
+        try:
+            consumer.start()
+        except Exception as e:
+            self.errors[consumer] = e
+        while True:
+            entry = q.get()
+            if entry[0] is _EOF:
+                break
+            item, shared = entry
+            try:
+                if consumer not in self.errors:
+                    consumer.consume(item)
+            except Exception as e:
+                self.errors[consumer] = e
+            finally:
+                shared.done()
+        try:
+            consumer.finish(entry[1] if consumer not in self.errors else None)
+        except Exception as e:
+            self.errors.setdefault(consumer, e)
+
+    def submit(self, buf, item):
+        """Queues item for every consumer; buf goes back to the pipeline when they are all done."""
+        shared = _SharedBuffer(self.pipeline, buf, len(self._queues))
+        for q in self._queues:
+            q.put((item, shared))
+
+    def close(self, result=None):
+        """Lets the consumers finish with result, None meaning the data is incomplete, and waits for them."""
+        for q in self._queues:
+            q.put((_EOF, result))
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,157 @@
+"""
+Progress output shared by the helpers.
+
+Helpers report progress to the GUI as lines on stdout holding a fraction from 0.0
+to 1.0. Printing one per chunk floods the pipe and the GUI main loop, so a line is
+only printed when the whole percentage changes, and at most every DEFAULT_INTERVAL
+seconds.
+
+With --progress-fd, helpers also write JSON records, one per line, to another file
+descriptor. Every record has "v" (PROTOCOL_VERSION) and "type":
+
+  progress  phase, pass, passes, done, total, fraction, rate, average_rate, eta
+  phase     a new phase started: phase, pass, passes, total
+  status    the final status of a target: status ("success", "failed", ...)
+
+All records may carry "target" when a helper works on several devices. Byte counts
+and rates are in bytes and bytes per second, eta in seconds; fields that are not
+known are null. done, total and the rates are those of the current pass, while
+fraction and eta may span several passes. Progress records are written every
+DEFAULT_INTERVAL seconds, even when the percentage does not change.
+"""
+import json
+import os
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.2
+PROTOCOL_VERSION = 1
+
+# Writer threads share stdout with the main thread
+_print_lock = threading.Lock()
+
+# File receiving JSON records, if any
+_channel = None
+
+
+def emit(line):
+    """Prints a line to stdout without interleaving it with lines from other threads."""
+    with _print_lock:
+        print(line)
+
+
+def add_channel_argument(parser):
+    """Adds the --progress-fd option to a helper's argument parser."""
+    parser.add_argument("--progress-fd", help="Also write JSON progress records, one per line, to this file descriptor",
+                        type=int, default=None, metavar="FD")
+
+
+def open_channel(fd):
+    """Writes JSON progress records to file descriptor fd from now on. Raises OSError if fd is not open."""
+    global _channel
+    os.fstat(fd)
+    _channel = os.fdopen(fd, 'w', buffering=1, closefd=False)
+
+
+def record(record_type, **fields):
+    """Writes a JSON record to the progress channel, if one is open."""
+    if _channel is None:
+        return
+    line = json.dumps(dict(v=PROTOCOL_VERSION, type=record_type, **fields))
+    with _print_lock:
+        try:
+            _channel.write(line + "\n")
+        except OSError:
+            # Nobody is listening any more, progress is not worth failing for
+            pass
+
+
+def status(status, target=None):
+    """Records the final status of a target."""
+    fields = {'target': target} if target else {}
+    record('status', status=status, **fields)
+
+
+class ProgressEmitter:
+    """
+    Prints progress fractions, prefixed with prefix, on percent changes and no more often
+    than interval, and writes progress records for the current phase to the channel.
+    """
+
+    def __init__(self, prefix="", interval=DEFAULT_INTERVAL, clock=time.monotonic, target=None):
+        self.prefix = prefix
+        self.interval = interval
+        self.clock = clock
+        self.target = target
+        self.phase = None
+        self.pass_number = None
+        self.passes = None
+        self.total = None
+        self.reset()
+
+    def reset(self):
+        """Starts over from 0.0, for example for a verification pass."""
+        self.last_percent = -1
+        self.last_time = None
+        self.start_time = self.clock()
+        self._reset_rates()
+
+    def _reset_rates(self):
+        self.phase_start = self.clock()
+        self.record_time = None
+        self.record_done = 0
+
+    def _fields(self):
+        fields = {'target': self.target} if self.target else {}
+        fields.update(phase=self.phase, total=self.total)
+        if self.passes:
+            fields.update(passes=self.passes)
+            fields['pass'] = self.pass_number
+        return fields
+
+    def set_phase(self, phase, total=None, pass_number=None, passes=None, restart=True):
+        """
+        Starts a phase, such as "write" or "verify", of total bytes. Progress starts over unless
+        restart is False, for passes that carry on along the same fraction.
+        """
+        self.phase = phase
+        self.total = total
+        if passes is not None:
+            self.pass_number = pass_number
+            self.passes = passes
+        if restart:
+            self.reset()
+        else:
+            self._reset_rates()
+        record('phase', **self._fields())
+
+    def update(self, fraction, done=None, force=False):
+        """Reports fraction, with done bytes if known, printing it only if it is due or force is set."""
+        now = self.clock()
+        if _channel is not None and (force or self.record_time is None or now - self.record_time >= self.interval):
+            self._record(fraction, done, now)
+
+        percent = int(fraction * 100)
+        if percent == self.last_percent and not force:
+            return
+        if not force and self.last_time is not None and now - self.last_time < self.interval:
+            return
+        self.last_percent = percent
+        self.last_time = now
+        emit(f"{self.prefix}{fraction}")
+
+    def _record(self, fraction, done, now):
+        elapsed = now - self.start_time
+        rate = average_rate = eta = None
+        if done is not None:
+            if self.record_time is not None and now > self.record_time:
+                rate = (done - self.record_done) / (now - self.record_time)
+            if now > self.phase_start:
+                average_rate = done / (now - self.phase_start)
+            self.record_done = done
+        if 0 < fraction < 1 and elapsed > 0:
+            eta = elapsed * (1 - fraction) / fraction
+        elif fraction >= 1:
+            eta = 0
+        self.record_time = now
+        record('progress', done=done, fraction=fraction, rate=rate, average_rate=average_rate, eta=eta, **self._fields())
@@ -8,6 +8,8 @@ import sys
 import argparse
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from mountutils import do_umount
+import progress
+from progress import ProgressEmitter
 import syslog
 
 # Supported filesystem types
@@ -67,6 +69,7 @@ def execute(command):
     retcode = call(command)
     if retcode != 0:
         syslog.syslog(f"Command failed with exit code {retcode}: {command}")
+        progress.status("failed")
         sys.exit(5)
     call(["sync"])
 
@@ -115,6 +118,10 @@ def raw_format(device_path, fstype, volume_label, uid, gid):
     }
     partition_type = partition_types[fstype]
 
+    # Formatting has no byte progress, only its phases are reported
+    reporter = ProgressEmitter(target=device_path)
+    reporter.set_phase("partition")
+
     # First erase MBR and partition table, if any
     execute(["dd", "if=/dev/zero", f"of={device_path}", "bs=512", "count=1"])
 
@@ -129,6 +136,7 @@ def raw_format(device_path, fstype, volume_label, uid, gid):
     execute(["wipefs", "-a", partition_path, "--force"])
 
     # Format the FS on the partition
+    reporter.set_phase("format")
     if fstype == "fat32":
         execute(["mkdosfs", "-F", "32", "-n", volume_label, partition_path])
     elif fstype == "exfat":
@@ -139,6 +147,7 @@ def raw_format(device_path, fstype, volume_label, uid, gid):
         execute(["mkfs.ext4", "-E", f"root_owner={uid}:{gid}", "-L", volume_label, partition_path])
 
     # Exit
+    progress.status("success")
     sys.exit(0)
 
 def main():
@@ -155,8 +164,11 @@ def main():
         parser.add_argument("-u", "--uid", help="UID of the user", type=str, required=True)
         parser.add_argument("-g", "--gid", help="GID of the user", type=str, required=True)
         parser.add_argument("label", help="Volume label", type=str, nargs="*")
+        progress.add_channel_argument(parser)
         args = parser.parse_args()
         args.label = " ".join(args.label)
+        if args.progress_fd is not None:
+            progress.open_channel(args.progress_fd)
     except Exception as e:
         print(f"Error parsing arguments: {e}", file=sys.stderr)
         sys.exit(2)
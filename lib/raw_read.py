@@ -3,62 +3,42 @@
 import os
 import sys
 import argparse
-import stat
 import syslog
-import parted
-import gzip
-import bz2
-import lzma
 try:
     import zstandard
     ZSTD_AVAILABLE = True
 except ImportError:
     ZSTD_AVAILABLE = False
-import lz4.frame
+sys.path.append('/usr/lib/driveutility')
+from encoders import ParallelCompressor, COMPRESSORS, LEVELS
+from blockutils import is_zero
+from bmap import BmapBuilder, save_bmap
+from partutils import get_source_size, used_extent, data_ranges
+from pipeline import readinto_full
+import progress
+from progress import ProgressEmitter
+import gpt
 
-def get_source_size(source_path):
-    """
-    Get the size of the source. Handles both regular files and block devices.
-    """
-    try:
-        mode = os.stat(source_path).st_mode
-        if stat.S_ISBLK(mode):
-            syslog.syslog(f"Source '{source_path}' is a block device. Using 'parted' to get size.")
-            device = parted.getDevice(source_path)
-            return float(device.getLength() * device.sectorSize)
-        else:
-            syslog.syslog(f"Source '{source_path}' is a regular file. Using 'os.path.getsize'.")
-            return float(os.path.getsize(source_path))
-    except Exception as e:
-        syslog.syslog(f"Could not determine size of source '{source_path}': {e}")
-        return 0.0
-
-def get_compression_writer(target_path, compression_method):
+def get_compression_writer(target_path, compression_method, level=None, threads=1):
     """
     Returns the appropriate file opening context manager for writing based on the compression method.
+    Compressed images are written in independent blocks, compressed in parallel with more than one thread.
     """
-    if compression_method == 'gzip':
-        return gzip.open(target_path, 'wb')
-    elif compression_method == 'bzip2':
-        return bz2.open(target_path, 'wb')
-    elif compression_method == 'xz':
-        return lzma.open(target_path, 'wb')
-    elif compression_method == 'lz4':
-        return lz4.frame.open(target_path, 'wb')
-    elif compression_method == 'zstd':
-        if not ZSTD_AVAILABLE:
-            raise ImportError("zstandard module not available")
-        # zstandard requires wrapping a file object
-        f = open(target_path, 'wb')
-        cctx = zstandard.ZstdCompressor()
-        return cctx.stream_writer(f)
-    else:
-        return open(target_path, 'wb')
+    if compression_method in LEVELS and level is None:
+        level = LEVELS[compression_method][1]
+    if compression_method == 'zstd' and not ZSTD_AVAILABLE:
+        raise ImportError("zstandard module not available")
+    if compression_method in COMPRESSORS:
+        return ParallelCompressor(open(target_path, 'wb'), compression_method, level, threads)
+    return open(target_path, 'wb')
 
-def raw_read(source, target, compression, uid, gid):
+def raw_read(source, target, compression, uid, gid, level=None, threads=1, bmap=False, used_extent_only=False, allocated_only=False):
     """
     Reads data from a source device and writes it to a target image file, with optional compression.
     """
+    # The block map describes the uncompressed image, so it is named after it as bmaptool expects
+    bmap_path = target + '.bmap' if bmap else None
+
     if compression:
         # Append the correct extension
         ext_map = {'gzip': 'gz', 'bzip2': 'bz2', 'xz': 'xz', 'lz4': 'lz4', 'zstd': 'zst'}
@@ -73,27 +53,101 @@ def raw_read(source, target, compression, uid, gid):
 
         if total_size == 0:
             syslog.syslog(f"Error: Source '{source}' has zero size or is inaccessible.")
+            progress.status("failed")
             print("failed")
             exit(4)
 
+        # Optionally stop at the end of the last partition. A GPT gets its backup table at
+        # the end of the image and its primary header pointed at it, as if the disk ended there.
+        copy_length = None
+        gpt_primary = gpt_backup = None
+        if used_extent_only:
+            extent = used_extent(source)
+            if extent is None:
+                syslog.syslog(f"No partitions found on '{source}', imaging the whole device")
+            else:
+                copy_length, sector_size, gpt_table = extent
+                total_size = float(copy_length)
+                if gpt_table:
+                    header, entries = gpt_table
+                    last_lba = (copy_length + gpt.backup_length(header, sector_size)) // sector_size - 1
+                    gpt_primary, _, gpt_backup = gpt.relocate(header, entries, last_lba, sector_size)
+                    total_size += len(gpt_backup)
+                syslog.syslog(f"Imaging the first {copy_length} bytes of '{source}', up to the end of its last partition")
+
+        # Free space of known filesystems is imaged as zeros without being read
+        allocated = None
+        if allocated_only:
+            allocated = data_ranges(source, copy_length or int(total_size))
+            read_length = sum(end - start for start, end in allocated)
+            syslog.syslog(f"Filesystems of '{source}' have {read_length} bytes allocated, free space will not be read")
+
+        def read_allocated(input_file, offset, n, index):
+            """Reads n bytes at offset, with zeros wherever no allocated range from index on covers them."""
+            parts = []
+            while index < len(allocated) and allocated[index][0] < offset + n:
+                start, end = allocated[index]
+                parts.append((max(start, offset), min(end, offset + n)))
+                index += 1
+            if parts == [(offset, offset + n)]:
+                input_file.seek(offset)
+                return input_file.read(n)
+            buffer = bytearray(n)
+            for start, end in parts:
+                input_file.seek(start)
+                readinto_full(input_file, memoryview(buffer)[start - offset:end - offset])
+            return buffer
+
+        def read_chunks(input_file):
+            remaining = copy_length
+            if allocated is not None:
+                remaining = copy_length or int(total_size)
+            offset = 0
+            index = 0
+            while remaining is None or remaining > 0:
+                n = bs if remaining is None else min(bs, remaining)
+                if allocated is None:
+                    buffer = input_file.read(n)
+                else:
+                    # Ranges ending before this chunk are no longer needed
+                    while index < len(allocated) and allocated[index][1] <= offset:
+                        index += 1
+                    buffer = read_allocated(input_file, offset, n, index)
+                if not buffer:
+                    break
+                if gpt_primary and offset <= sector_size < offset + len(buffer):
+                    buffer = bytearray(buffer)
+                    buffer[sector_size - offset:2 * sector_size - offset] = gpt_primary
+                offset += len(buffer)
+                if remaining is not None:
+                    remaining -= len(buffer)
+                yield buffer
+            if gpt_backup:
+                yield gpt_backup
+
         with open(source, 'rb') as input_file, \
-             get_compression_writer(target, compression) as output_file:
+             get_compression_writer(target, compression, level, threads) as output_file:
             
             size = 0
             increment = total_size / 100 if total_size > 0 else 0
             read_since_flush = 0
+            bmap_builder = BmapBuilder() if bmap else None
+            reporter = ProgressEmitter()
+            reporter.set_phase("read", int(total_size))
 
-            while True:
-                buffer = input_file.read(bs)
-                if not buffer:
-                    break
-                
-                output_file.write(buffer)
+            for buffer in read_chunks(input_file):
+                if not compression and is_zero(buffer):
+                    # Leave a hole in the image instead of writing zeros
+                    output_file.seek(len(buffer), os.SEEK_CUR)
+                else:
+                    output_file.write(buffer)
+                if bmap_builder:
+                    bmap_builder.update(buffer)
                 size += len(buffer)
                 read_since_flush += len(buffer)
 
                 if total_size > 0:
-                    print(size / total_size)
+                    reporter.update(size / total_size, size)
 
                 # Flushing is important for progress monitoring
                 if increment > 0 and read_since_flush >= increment:
@@ -104,23 +158,34 @@ def raw_read(source, target, compression, uid, gid):
             
             if hasattr(output_file, 'flush'):
                 output_file.flush()
+            if not compression:
+                # Give the image its full length if it ends with a hole
+                output_file.truncate(size)
 
         # Final size comparison
         if abs(size - total_size) < bs:
+            created = [target]
+            if bmap_builder:
+                save_bmap(bmap_path, bmap_builder.finish())
+                syslog.syslog(f"Created block map '{bmap_path}'")
+                created.append(bmap_path)
+            progress.status("success")
             print("1.0")
             syslog.syslog(f"Successfully created image of '{source}' at '{target}'.")
             
             # Change file ownership if uid and gid are provided
             if uid != -1 and gid != -1:
-                try:
-                    os.chown(target, uid, gid)
-                    syslog.syslog(f"Changed ownership of '{target}' to {uid}:{gid}")
-                except Exception as e:
-                    syslog.syslog(f"Failed to change ownership of '{target}': {e}")
+                for path in created:
+                    try:
+                        os.chown(path, uid, gid)
+                        syslog.syslog(f"Changed ownership of '{path}' to {uid}:{gid}")
+                    except Exception as e:
+                        syslog.syslog(f"Failed to change ownership of '{path}': {e}")
 
             exit(0)
         else:
             syslog.syslog(f"Image creation failed: total size {total_size}, written size {size}")
+            progress.status("failed")
             print("failed")
             exit(4)
 
@@ -128,6 +193,7 @@ def raw_read(source, target, compression, uid, gid):
         syslog.syslog(f"An exception occurred: {e}")
         # Print the exception to stderr for easier debugging
         print(f"Error: {e}", file=sys.stderr)
+        progress.status("failed")
         print("failed")
         exit(4)
 
@@ -150,6 +216,12 @@ def main():
     parser.add_argument("-c", "--compression", help=compression_help, type=str, choices=compression_choices)
     parser.add_argument("-u", "--uid", help="User ID to own the target file", type=int, default=-1)
     parser.add_argument("-g", "--gid", help="Group ID to own the target file", type=int, default=-1)
+    parser.add_argument("-l", "--level", help="Compression level (default depends on the compression method)", type=int, default=None)
+    parser.add_argument("-b", "--bmap", help="Also create a block map (.bmap) of the image for bmaptool and driveutility-write", action="store_true")
+    parser.add_argument("-e", "--used-extent", help="Only image the device up to the end of its last partition", action="store_true")
+    parser.add_argument("-a", "--allocated-only", help="Only read blocks that the ext4, FAT, exFAT or NTFS filesystems on the device use; free space is imaged as zeros", action="store_true")
+    parser.add_argument("-j", "--threads", help="Number of compression threads (default: number of CPUs); all-zero blocks are compressed only once, whatever the number", type=int, default=os.cpu_count() or 1)
+    progress.add_channel_argument(parser)
     
     try:
         args = parser.parse_args()
@@ -159,7 +231,21 @@ def main():
              base, _ = os.path.splitext(args.target)
              args.target = base
 
-        raw_read(args.source, args.target, args.compression, args.uid, args.gid)
+        if args.level is not None:
+            if not args.compression:
+                parser.error("--level requires --compression")
+            levels = LEVELS[args.compression][0]
+            if args.level not in levels:
+                parser.error(f"{args.compression} compression level must be between {levels[0]} and {levels[-1]}")
+        if args.threads < 1:
+            parser.error("--threads must be at least 1")
+        if args.progress_fd is not None:
+            try:
+                progress.open_channel(args.progress_fd)
+            except OSError as e:
+                parser.error(f"--progress-fd: {e}")
+
+        raw_read(args.source, args.target, args.compression, args.uid, args.gid, args.level, args.threads, args.bmap, args.used_extent, args.allocated_only)
     except Exception as e:
         print(e, file=sys.stderr)
         sys.exit(2)
@@ -1,79 +1,284 @@
 #!/usr/bin/python3
 
 import argparse
+import errno
+import json
+import math
 import os
-import queue
+import random
+import re
 import stat
-import subprocess
 import sys
-import threading
 import syslog
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the shared library path
 sys.path.append('/usr/lib/driveutility')
 from mountutils import do_umount
+from blockutils import device_size, aligned_buffers, write_all, write_direct, queue_limit, block_range_ioctl, read_ranges, is_zero, BLKDISCARD, BLKSECDISCARD, BLKZEROOUT
+from pipeline import Pipeline, DEFAULT_DEPTH
+from keystream import Keystream
+from scheduler import TokenBucket
+from checkpoint import Checkpoint, CHECKPOINT_DIR
+import progress
+from progress import ProgressEmitter, emit
+
+WIPE_TYPES = ('zero', 'random', 'zeroout', 'discard', 'secure-discard')
+
+# Wipe types the device carries out itself: the ioctl, and the queue limit that is 0 if it is not supported
+OFFLOAD_TYPES = {
+    'zeroout': (BLKZEROOUT, 'write_zeroes_max_bytes'),
+    'discard': (BLKDISCARD, 'discard_granularity'),
+    'secure-discard': (BLKSECDISCARD, 'discard_granularity'),
+}
 
-WIPE_SOURCES = {
-    'zero': '/dev/zero',
-    'random': '/dev/urandom',
+# Bytes per offloaded request, so that progress can be reported while the device works
+OFFLOAD_CHUNK = 1024 ** 3
+
+VERIFY_MODES = ('sample', 'full')
+
+# Blocks read back by a sampled verification, and the bytes in each
+DEFAULT_SAMPLES = 1000
+SAMPLE_SIZE = 64 * 1024
+
+# Mismatching offsets listed in a wipe report
+MAX_REPORTED_MISMATCHES = 100
+
+# Well-known pass sequences for --sequence
+SEQUENCE_PRESETS = {
+    # DoD 5220.22-M
+    'dod': '0x00,0xff,random',
+    # DoD 5220.22-M ECE
+    'dod7': '0x00,0xff,random,random,0x00,0xff,random',
+    # German VSITR
+    'vsitr': '0x00,0xff,0x00,0xff,0x00,0xff,0xaa',
 }
 
-def reader_thread(pipe, q):
-    """Reads lines from a pipe and puts them into a queue."""
+# Exit status for each final device status
+EXIT_CODES = {"success": 0, "failed": 1, "mismatch": 5}
+
+# Size suffixes accepted by --block-size, as dd takes them
+SIZE_SUFFIXES = {'': 1, 'c': 1, 'w': 2, 'b': 512, 'K': 1024, 'kB': 1000, 'M': 1024 ** 2, 'MB': 1000 ** 2, 'G': 1024 ** 3, 'GB': 1000 ** 3}
+
+def parse_size(text):
+    """Returns the number of bytes of a dd size such as 4096, 64K or 1M, or None if it cannot be parsed."""
+    match = re.match(r'^(\d+)([A-Za-z]*)$', text)
+    if not match or match.group(2) not in SIZE_SUFFIXES:
+        return None
+    return int(match.group(1)) * SIZE_SUFFIXES[match.group(2)]
+
+def parse_sequence(text):
+    """
+    Returns the patterns of a pass sequence such as 0x00,0xFF,random,0x55AA, or of a preset
+    from SEQUENCE_PRESETS, or None if it cannot be parsed. Patterns are wipe types or fixed
+    patterns of whole bytes in hex, which are returned in lower case.
+    """
+    text = SEQUENCE_PRESETS.get(text.strip().lower(), text)
+    patterns = []
+    for item in text.split(','):
+        item = item.strip().lower()
+        if item in WIPE_TYPES or re.match(r'^0x(?:[0-9a-f]{2})+$', item):
+            patterns.append(item)
+        else:
+            return None
+    return patterns
+
+def fixed_pattern(pattern):
+    """Returns the bytes repeated by a fixed pattern such as 'zero' or '0x55aa', or None for other patterns."""
+    if pattern == 'zero':
+        return b'\0'
+    if pattern.startswith('0x'):
+        return bytes.fromhex(pattern[2:])
+    return None
+
+def pattern_buffer(pattern, size):
+    """Returns an aligned buffer of size bytes, a multiple of len(pattern), filled with repeats of pattern."""
+    buf = aligned_buffers(1, size)[0]
+    # Anonymous mappings start out zeroed
+    if pattern.count(0) != len(pattern):
+        buf[:] = pattern * (size // len(pattern))
+    return buf
+
+def open_device(device):
+    """
+    Opens device for writing, bypassing the page cache with O_DIRECT where the device allows it.
+    Returns (fd, direct).
+    """
+    try:
+        return os.open(device, os.O_WRONLY | os.O_DIRECT), True
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+        syslog.syslog(f"Direct I/O is not supported on '{device}', writing through the page cache")
+        return os.open(device, os.O_WRONLY), False
+
+def wipe_pass(device, length, block_size, sector_size, stream=None, on_progress=None, start=0, budget=None, pattern=None,
+              checkpoint=None):
+    """
+    Overwrites bytes start to length of device with data read from stream or, if stream is
+    None, with pattern, a buffer from pattern_buffer() written over and over (zeros if None),
+    and flushes them to the device. A fixed pattern is written from offset 0, so start must be
+    a multiple of its length. on_progress(done) is called after every block with the offset
+    reached. Every block is taken from budget, a TokenBucket, if given. Whenever checkpoint is
+    due, the device is flushed and the offset reached saved to it. Returns the number of bytes
+    written.
+    """
+    fd, direct = open_device(device)
     try:
-        with pipe:
-            for line in iter(pipe.readline, ''):
-                sys.stderr.write(line)
-                sys.stderr.flush()
-                q.put(line)
-    finally:
-        q.put(None) # Signal that reading is complete
-
-def execute(command):
-    """
-    Executes a command, showing its stderr in real-time while capturing it for analysis.
-    This function correctly handles the 'No space left on device' case for 'dd'.
-    """
-    syslog.syslog("Executing: " + " ".join(command))
-    
-    process = subprocess.Popen(command, 
-                               stdout=subprocess.DEVNULL, 
-                               stderr=subprocess.PIPE,
-                               universal_newlines=True, 
-                               bufsize=1, 
-                               universal_newlines=True)
-
-    q = queue.Queue()
-    thread = threading.Thread(target=reader_thread, args=[process.stderr, q])
-    thread.daemon = True
-    thread.start()
-
-    return_code = process.wait()
-    thread.join()
-
-    stderr_lines = []
-    while not q.empty():
-        line = q.get_nowait()
-        if line is None:
-            continue
-        stderr_lines.append(line)
-            
-    stderr_output = "".join(stderr_lines)
+        os.lseek(fd, start, os.SEEK_SET)
+
+        def write(view):
+            if budget:
+                budget.consume(len(view))
+            if direct:
+                write_direct(fd, view, sector_size)
+            else:
+                write_all(fd, view)
 
-    if return_code != 0:
-        if "No space left on device" in stderr_output:
-            syslog.syslog(f"dd finished with an expected 'No space' message.")
+        def written(done):
+            if checkpoint and checkpoint.due():
+                os.fsync(fd)
+                checkpoint.save(offset=done)
+            if on_progress:
+                on_progress(done)
+
+        done = start
+        if stream is None:
+            # The same buffer is written over and over, nothing is allocated per block
+            if pattern is None:
+                pattern = aligned_buffers(1, block_size)[0]
+            view = memoryview(pattern)
+            while done < length:
+                n = min(len(view), length - done)
+                write(view[:n])
+                done += n
+                written(done)
         else:
-            syslog.syslog(f"Command failed with exit code {return_code}: {' '.join(command)}")
-            syslog.syslog(f"Stderr: {stderr_output.strip()}")
-            print("\nfailed")
-            sys.exit(1)
+            # Random data is generated on the pipeline thread, itself spreading the work over
+            # the keystream's workers, while the previous block is written
+            buffers = aligned_buffers(DEFAULT_DEPTH, block_size)
+            with Pipeline(stream, block_size, buffers=buffers, length=length - start) as pipeline:
+                for view in pipeline:
+                    write(view)
+                    done += len(view)
+                    written(done)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return done - start
+
+def offload_supported(device, wipe_type):
+    """Returns True if the queue limits of device say that it supports the ioctl of wipe_type."""
+    return queue_limit(device, OFFLOAD_TYPES[wipe_type][1]) > 0
+
+def offload_pass(device, length, wipe_type, sector_size, on_progress=None):
+    """
+    Has the device wipe the whole logical blocks in its first length bytes with the ioctl of
+    wipe_type, OFFLOAD_CHUNK bytes at a time. on_progress(done) is called after every request.
+    Returns the number of bytes wiped, which falls short of length if the device turns out not
+    to support the request, or if length ends within a logical block.
+    """
+    request = OFFLOAD_TYPES[wipe_type][0]
+    end = length - length % sector_size
+    done = 0
+    fd = os.open(device, os.O_WRONLY)
+    try:
+        while done < end:
+            n = min(OFFLOAD_CHUNK, end - done)
+            try:
+                block_range_ioctl(fd, request, done, n)
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY):
+                    raise
+                syslog.syslog(f"'{wipe_type}' is not supported by {device} from offset {done}: {e}")
+                break
+            done += n
+            if on_progress:
+                on_progress(done)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return done
+
+def sample_ranges(length, samples, sample_size, sector_size, rng=None):
+    """
+    Returns sorted (start, end) ranges of samples blocks of sample_size bytes within the first
+    length bytes: one at a random offset, aligned to sector_size, in each of samples equal
+    stretches, so that they are spread over the whole device. If the samples would cover it
+    all, the whole range is returned.
+    """
+    if rng is None:
+        rng = random.SystemRandom()
+    if samples * sample_size >= length:
+        return [(0, length)]
+    ranges = []
+    for i in range(samples):
+        low = length * i // samples
+        high = length * (i + 1) // samples - sample_size
+        start = rng.randint(low, high)
+        start -= start % sector_size
+        if ranges and start < ranges[-1][1]:
+            start = ranges[-1][1]
+        ranges.append((start, min(start + sample_size, length)))
+    return ranges
 
-    subprocess.call(["sync"])
+def verify_wipe(device, ranges, sector_size, keystream=None, on_progress=None, budget=None, pattern=None):
+    """
+    Reads (start, end) byte ranges of device back, bypassing the page cache, and compares them
+    with what the last pass wrote: the keystream, regenerated from its seed, or the bytes of a
+    fixed pattern repeated from offset 0, zeros if both are None. on_progress(done) is called
+    after every block with the bytes read.
+    Reads are taken from budget, a TokenBucket, if given. Returns the offsets of the blocks
+    that differ.
+    """
+    mismatches = []
+    done = 0
+    views = read_ranges(device, ranges, sector_size)
+    for start, end in ranges:
+        position = start
+        while position < end:
+            view = next(views)
+            if budget:
+                budget.consume(len(view))
+            if keystream is not None:
+                matches = keystream.read(position, len(view)).startswith(view)
+            elif pattern is None or pattern.count(0) == len(pattern):
+                matches = is_zero(view)
+            else:
+                phase = position % len(pattern)
+                expected = pattern * ((phase + len(view)) // len(pattern) + 1)
+                matches = expected[phase:phase + len(view)].startswith(view)
+            if not matches:
+                mismatches.append(position)
+            position += len(view)
+            done += len(view)
+            if on_progress:
+                on_progress(done)
+    views.close()
+    return mismatches
 
-def raw_wipe(device, passes, wipe_type, final_zero, size_mb, block_size):
-    """Overwrites a device with the specified pattern."""
-    if wipe_type not in WIPE_SOURCES:
+def write_report(path, report):
+    """Writes the record of a wipe as JSON to path."""
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    syslog.syslog(f"Wipe report written to {path}")
+
+def raw_wipe(device, passes, wipe_type, final_zero, size_mb, block_size, verify=None, samples=DEFAULT_SAMPLES,
+             report=None, prefix="", budget=None, executor=None, sequence=None, resume=False, checkpoint_dir=None):
+    """
+    Overwrites a device with the specified pattern, block_size bytes at a time, then reads it
+    back if verify is 'sample' or 'full'. sequence, a list of patterns from parse_sequence(),
+    replaces wipe_type, passes and final_zero. Returns "success", or "mismatch" if the data read
+    back is not what the last pass wrote. A record of the wipe is stored in the report dict.
+    Progress lines are prefixed with prefix. I/O is taken from budget, a TokenBucket, and
+    random data generated on executor, when several devices share them.
+    If checkpoint_dir is given, progress is checkpointed there, and with resume a wipe of the
+    same device with the same patterns continues from its last checkpoint.
+    """
+    if wipe_type not in WIPE_TYPES:
         syslog.syslog(f"Error: Invalid wipe type '{wipe_type}'")
         print("failed")
         sys.exit(1)
@@ -81,34 +286,206 @@ def raw_wipe(device, passes, wipe_type, final_zero, size_mb, block_size):
     syslog.syslog(f"Unmounting {device}")
     do_umount(device)
 
-    count = size_mb if size_mb is not None else None
-    source_path = WIPE_SOURCES[wipe_type]
-
-    for i in range(1, passes + 1):
-        print(f"\n--- Pass {i}/{passes}: Wiping with '{wipe_type}' ---")
-        
-        dd_command = [
-            'dd', f'if={source_path}', f'of={device}',
-            f'bs={block_size}', 'status=progress'
-        ]
-        if count is not None:
-            dd_command.append(f'count={count}')
-        
-        execute(dd_command)
-
-    if wipe_type == 'random' and final_zero:
-        print("\n--- Final Pass: Wiping with 'zero' ---")
-        
-        dd_command = [
-            'dd', f'if={WIPE_SOURCES["zero"]}', f'of={device}',
-            f'bs={block_size}', 'status=progress'
-        ]
-        if count is not None:
-            dd_command.append(f'count={count}')
-            
-        execute(dd_command)
+    # Bytes written per pass: the whole device, or its first size_mb megabytes.
+    # Writes stop exactly at the end of the device rather than running into it.
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        total = device_size(fd)
+    finally:
+        os.close(fd)
+    if size_mb is not None:
+        total = min(total, size_mb * 1024 ** 2)
+
+    # Direct I/O needs whole logical blocks
+    sector_size = queue_limit(device, 'logical_block_size') or 512
+    block_size = max(sector_size, block_size + -block_size % sector_size)
+
+    if sequence:
+        patterns = list(sequence)
+    else:
+        patterns = [wipe_type] * passes
+        if wipe_type == 'random' and final_zero:
+            patterns.append('zero')
+    # Fixed patterns are written from buffers filled once and reused by every pass. Blocks
+    # hold whole repeats of the pattern, so that each write continues where the last stopped.
+    buffers = {}
+    for pattern in patterns:
+        fixed = fixed_pattern(pattern)
+        if fixed is not None and fixed not in buffers:
+            unit = sector_size * len(fixed) // math.gcd(sector_size, len(fixed))
+            buffers[fixed] = pattern_buffer(fixed, block_size + -block_size % unit)
+    reporter = ProgressEmitter(prefix, target=device)
+    if report is None:
+        report = {}
+    report.update({
+        'device': device,
+        'size': total,
+        'block_size': block_size,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'passes': [],
+    })
+    # (seed, algorithm) of the last random pass, to regenerate its data
+    last_seed = None
 
+    checkpoint = None
+    first_pass = first_offset = 0
+    resumed_records = []
+    if checkpoint_dir:
+        checkpoint = Checkpoint('wipe', device, {'patterns': patterns, 'size': total, 'block_size': block_size}, checkpoint_dir)
+        state = checkpoint.load() if resume else None
+        if state:
+            first_pass, first_offset = state['pass_index'], state['offset']
+            resumed_records = state['records']
+            report['passes'] = resumed_records[:first_pass]
+            report['resumed'] = {'pass': first_pass + 1, 'offset': first_offset}
+            syslog.syslog(f"Resuming the wipe of {device} at pass {first_pass + 1}, offset {first_offset}")
+        elif resume:
+            syslog.syslog(f"No checkpoint matches this wipe of {device}, starting from the beginning")
+
+    for i, pattern in enumerate(patterns):
+        if i < first_pass:
+            continue
+        start = first_offset if i == first_pass else 0
+        syslog.syslog(f"Pass {i + 1}/{len(patterns)}: wiping {total} bytes of {device} with '{pattern}'")
+        reporter.set_phase("write", total, i + 1, len(patterns), restart=(i == first_pass))
+
+        def on_progress(done):
+            # One progress bar covers all passes
+            reporter.update((i + done / total) / len(patterns), done)
+
+        record = {'pass': i + 1, 'pattern': pattern}
+        report['passes'].append(record)
+        last_seed = None
+        if pattern == 'random':
+            # A fresh seed for every pass, unless it is resumed
+            seed = algorithm = None
+            if start and i < len(resumed_records):
+                seed, algorithm = bytes.fromhex(resumed_records[i]['seed']), resumed_records[i]['algorithm']
+            keystream = Keystream(seed, algorithm, executor=executor)
+            record.update(algorithm=keystream.algorithm, seed=keystream.seed.hex())
+        if checkpoint:
+            # Offloaded passes are quick, they start over rather than keep an offset
+            checkpoint.save(pass_index=i, offset=0 if pattern in OFFLOAD_TYPES else start, records=report['passes'])
+        if pattern in OFFLOAD_TYPES:
+            wiped = 0
+            if offload_supported(device, pattern):
+                wiped = offload_pass(device, total, pattern, sector_size, on_progress if total else None)
+            else:
+                syslog.syslog(f"The queue limits of {device} do not allow '{pattern}'")
+            if wiped < total:
+                # Whatever the device could not wipe itself is overwritten with zeros
+                syslog.syslog(f"Overwriting bytes {wiped} to {total} of {device} with zeros")
+                wipe_pass(device, total, block_size, sector_size, None, on_progress if total else None, start=wiped, budget=budget,
+                          pattern=buffers.get(b'\0'))
+            record['offloaded'] = wiped
+        elif pattern == 'random':
+            with keystream:
+                syslog.syslog(f"Generating random data with {keystream.algorithm}")
+                wipe_pass(device, total, block_size, sector_size, keystream.reader(start), on_progress if total else None,
+                          start=start, budget=budget, checkpoint=checkpoint)
+                last_seed = (keystream.seed, keystream.algorithm)
+        else:
+            wipe_pass(device, total, block_size, sector_size, None, on_progress if total else None, start=start, budget=budget,
+                      pattern=buffers[fixed_pattern(pattern)], checkpoint=checkpoint)
+
+    reporter.update(1.0, total, force=True)
     syslog.syslog(f"Wipe completed for {device}")
+    if checkpoint:
+        checkpoint.remove()
+
+    status = "success"
+    if verify:
+        last = patterns[-1]
+        if last in ('discard', 'secure-discard'):
+            # What discarded blocks read back as is up to the device
+            syslog.syslog(f"'{last}' wipes cannot be verified, skipping verification of {device}")
+            report['verification'] = {'mode': verify, 'result': 'skipped'}
+        else:
+            sample_size = max(sector_size, SAMPLE_SIZE + -SAMPLE_SIZE % sector_size)
+            ranges = [(0, total)] if verify == 'full' else sample_ranges(total, samples, sample_size, sector_size)
+            checked = sum(end - start for start, end in ranges)
+            syslog.syslog(f"Verifying {checked} bytes of {device} in {len(ranges)} ranges")
+            emit(f"{prefix}verifying")
+            reporter.set_phase("verify", checked)
+
+            def on_verify_progress(done):
+                reporter.update(done / checked, done)
+
+            keystream = Keystream(*last_seed, executor=executor) if last_seed else None
+            try:
+                mismatches = verify_wipe(device, ranges, sector_size, keystream, on_verify_progress if checked else None, budget,
+                                         fixed_pattern(last))
+            finally:
+                if keystream:
+                    keystream.close()
+            reporter.update(1.0, checked, force=True)
+            report['verification'] = {
+                'mode': verify,
+                'ranges': len(ranges),
+                'bytes_checked': checked,
+                'mismatches': len(mismatches),
+                'mismatch_offsets': mismatches[:MAX_REPORTED_MISMATCHES],
+                'result': 'failed' if mismatches else 'passed',
+            }
+            if mismatches:
+                syslog.syslog(f"Error: {len(mismatches)} blocks read back from {device} differ from the wipe pattern, the first at offset {mismatches[0]}")
+                status = "mismatch"
+            else:
+                syslog.syslog(f"Verification of {device} succeeded")
+
+    report['finished'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    report['status'] = status
+    return status
+
+def wipe_devices(devices, rate=None, threads=None, **options):
+    """
+    Wipes several devices at once, each on its own thread, passing options on to raw_wipe.
+    The devices share one pool of threads generating random data, so that they do not
+    starve each other of CPU, and a budget of rate bytes per second if rate is given.
+    With several devices, progress lines are prefixed with the device path.
+    Returns (statuses, reports) by device; a device whose wipe raised is "failed".
+    """
+    budget = TokenBucket(rate) if rate else None
+    executor = ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1)
+    statuses = {}
+    reports = {}
+
+    def run(device):
+        reports[device] = {'device': device}
+        try:
+            statuses[device] = raw_wipe(device, report=reports[device], budget=budget, executor=executor,
+                                        prefix=f"{device} " if len(devices) > 1 else "", **options)
+        except Exception as e:
+            syslog.syslog(f"An unexpected exception occurred during wipe of {device}: {str(e)}")
+
+    workers = [threading.Thread(target=run, args=(device,), name=f"wipe-{device}") for device in devices]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    executor.shutdown()
+    for device in devices:
+        reports[device].setdefault('status', "failed")
+    return {device: statuses.get(device, "failed") for device in devices}, reports
+
+def exit_with_status(statuses):
+    """
+    Prints the final status of every device and exits.
+    A single device keeps the plain protocol ("success" on success, otherwise the error word);
+    several devices get a summary of one "<device> <status>" line each. The exit status is
+    that of the failed devices if they all failed the same way, otherwise 1.
+    """
+    for device, status in statuses.items():
+        progress.status(status, device if len(statuses) > 1 else None)
+    if len(statuses) == 1:
+        status, = statuses.values()
+        emit("\nsuccess" if status == "success" else status)
+    else:
+        emit("")
+        for device, status in statuses.items():
+            emit(f"{device} {status}")
+    codes = {EXIT_CODES[status] for status in statuses.values()} - {0}
+    sys.exit(codes.pop() if len(codes) == 1 else 1 if codes else 0)
 
 def main():
     try:
@@ -117,46 +494,89 @@ def main():
             prog="driveutility-wipe",
             epilog="Example: driveutility-wipe -d /dev/sdb -p 3 -t random"
         )
-        parser.add_argument('-d', '--device', help="Block device path to wipe (e.g., /dev/sdb)", type=str, required=True)
+        parser.add_argument('-d', '--device', help="Block device path to wipe (e.g., /dev/sdb); several devices are wiped at the same time", type=str, nargs='+', required=True)
         parser.add_argument('-p', '--passes', help="Number of overwrite passes (default: 1)", type=int, default=1)
-        parser.add_argument('-t', '--type', help="Wipe pattern: 'zero' or 'random' (default: 'zero')", type=str, choices=list(WIPE_SOURCES), default='zero')
+        parser.add_argument('-t', '--type', help="Wipe pattern: 'zero' or 'random', or 'zeroout', 'discard' or 'secure-discard' to have the device wipe itself (default: 'zero')", type=str, choices=WIPE_TYPES, default='zero')
         parser.add_argument('-z', '--final-zero', help="For random wipes, add a final zero-fill pass", action='store_true')
         parser.add_argument('-s', '--size', help="Size in MB to wipe (default: entire device)", type=int, default=None)
-        parser.add_argument('-b', '--block-size', help="Block size for dd (default: 1M)", type=str, default='1M')
+        parser.add_argument('-b', '--block-size', help="Size of each write, such as 4M (default: 1M)", type=str, default='1M')
+        parser.add_argument('--sequence', help=f"Comma-separated patterns, one per pass, such as 0x00,0xFF,random,0x55AA, or a preset ({', '.join(SEQUENCE_PRESETS)}); replaces --type, --passes and --final-zero",
+                            type=str, default=None)
+        parser.add_argument('-V', '--verify', help="Read the device back after the last pass: 'sample' reads spread-out blocks, 'full' everything (default: sample)",
+                            nargs='?', const='sample', choices=VERIFY_MODES, default=None)
+        parser.add_argument('--samples', help=f"Number of blocks read by a sampled verification (default: {DEFAULT_SAMPLES})", type=int, default=DEFAULT_SAMPLES)
+        parser.add_argument('-r', '--report', help="Write a JSON record of the wipe and its verification to this file", type=str, default=None)
+        parser.add_argument('--resume', help="Continue an interrupted wipe of the same devices with the same options from its last checkpoint", action='store_true')
+        parser.add_argument('--rate', help="Limit reading and writing to this many MB/s, shared by all devices (default: unlimited)", type=int, default=None)
+        parser.add_argument('--threads', help="Threads generating random data, shared by all devices (default: one per CPU)", type=int, default=None)
+        progress.add_channel_argument(parser)
         args = parser.parse_args()
+        block_size = parse_size(args.block_size)
+        if not block_size:
+            parser.error(f"invalid block size '{args.block_size}'")
+        if args.samples < 1:
+            parser.error("--samples must be at least 1")
+        sequence = None
+        if args.sequence is not None:
+            sequence = parse_sequence(args.sequence)
+            if not sequence:
+                parser.error(f"invalid pass sequence '{args.sequence}'")
+            if args.type != 'zero' or args.passes != 1 or args.final_zero:
+                parser.error("--sequence cannot be combined with --type, --passes or --final-zero")
+        if len(set(args.device)) != len(args.device):
+            parser.error("a device is given more than once")
+        if args.rate is not None and args.rate < 1:
+            parser.error("--rate must be at least 1")
+        if args.threads is not None and args.threads < 1:
+            parser.error("--threads must be at least 1")
+        if args.progress_fd is not None:
+            try:
+                progress.open_channel(args.progress_fd)
+            except OSError as e:
+                parser.error(f"--progress-fd: {e}")
     except Exception as e:
         print(e, file=sys.stderr)
         sys.exit(2)
 
-    try:
-        mode = os.stat(args.device).st_mode
-        if not stat.S_ISBLK(mode):
-            print(f"Error: The specified path '{args.device}' is not a block device.", file=sys.stderr)
+    for device in args.device:
+        try:
+            mode = os.stat(device).st_mode
+            if not stat.S_ISBLK(mode):
+                print(f"Error: The specified path '{device}' is not a block device.", file=sys.stderr)
+                sys.exit(1)
+        except FileNotFoundError:
+            print(f"Error: The specified device '{device}' does not exist.", file=sys.stderr)
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error: Could not access device '{device}': {e}", file=sys.stderr)
             sys.exit(1)
-    except FileNotFoundError:
-        print(f"Error: The specified device '{args.device}' does not exist.", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error: Could not access device '{args.device}': {e}", file=sys.stderr)
-        sys.exit(1)
 
-    try:
-        raw_wipe(
-            device=args.device,
-            passes=args.passes,
-            wipe_type=args.type,
-            final_zero=args.final_zero,
-            size_mb=args.size,
-            block_size=args.block_size
-        )
-        print("\nsuccess")
-        sys.exit(0)
-    except SystemExit as e:
-        sys.exit(e.code)
-    except Exception as e:
-        syslog.syslog(f"An unexpected exception occurred during wipe: {str(e)}")
-        print("failed", file=sys.stderr)
-        sys.exit(1)
+    statuses, reports = wipe_devices(
+        args.device,
+        rate=args.rate * 1024 ** 2 if args.rate else None,
+        threads=args.threads,
+        passes=args.passes,
+        wipe_type=args.type,
+        final_zero=args.final_zero,
+        size_mb=args.size,
+        block_size=block_size,
+        verify=args.verify,
+        samples=args.samples,
+        sequence=sequence,
+        resume=args.resume,
+        checkpoint_dir=CHECKPOINT_DIR
+    )
+    if args.report:
+        try:
+            if len(args.device) == 1:
+                write_report(args.report, reports[args.device[0]])
+            else:
+                write_report(args.report, {'wipes': [reports[device] for device in args.device]})
+        except OSError as e:
+            syslog.syslog(f"Could not write the wipe report to {args.report}: {e}")
+            print(f"Error: Could not write the wipe report to '{args.report}': {e}", file=sys.stderr)
+            statuses = {device: "failed" for device in args.device}
+    exit_with_status(statuses)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -3,9 +3,21 @@
 import os
 import sys
 import argparse
+import errno
+import hashlib
 import stat
 sys.path.append('/usr/lib/driveutility')
 from mountutils import do_umount
+from pipeline import Pipeline, FanOut, DEFAULT_DEPTH
+import progress
+from progress import ProgressEmitter, emit
+from blockutils import kernel_copy, aligned_buffers, write_direct, is_zero, queue_limit, block_range_ioctl, read_ranges, BLKZEROOUT
+from sizeprobe import probe_uncompressed_size
+from decoders import open_parallel_decoder
+from bmap import load_bmap, BmapFilter
+from partutils import get_source_size, is_block_device, used_extent
+from checkpoint import Checkpoint, CHECKPOINT_DIR, device_identity
+import gpt
 import parted
 import syslog
 import gzip
@@ -17,6 +29,16 @@ try:
 except ImportError:
     ZSTD_AVAILABLE = False
 import lz4.frame
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+# Hash algorithms available to verify the written data
+VERIFY_ALGORITHMS = ['blake2b', 'sha256']
+if XXHASH_AVAILABLE:
+    VERIFY_ALGORITHMS.append('xxhash')
 
 # Magic numbers used to identify file types by their headers
 MAGIC_NUMBERS = {
@@ -27,7 +49,7 @@ MAGIC_NUMBERS = {
 }
 
 if ZSTD_AVAILABLE:
-    MAGIC_NUMBERS[b'(\xb5/\xfd'] = ('zstd', zstandard.ZstdDecompressor().stream_reader)
+    MAGIC_NUMBERS[b'(\xb5/\xfd'] = ('zstd', lambda fileobj, mode: zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True))
 
 def get_opener_by_magic(file_path):
     """
@@ -49,82 +71,485 @@ def get_opener_by_magic(file_path):
     syslog.syslog(f"No compression detected for '{file_path}'. Treating as raw image.")
     return open, None
 
-def raw_write(source, target):
-    opener, compression_method = get_opener_by_magic(source)
+def new_hash(algorithm):
+    """Returns a hash object for one of VERIFY_ALGORITHMS."""
+    if algorithm == 'xxhash':
+        return xxhash.xxh64()
+    return hashlib.new(algorithm)
+
+def verify_target(target, ranges, sector_size, expected, algorithm, report_progress=None):
+    """
+    Reads the written ranges back from the target, bypassing the page cache, and compares
+    their hash with the one computed while writing. Progress is reported as for the write.
+    """
+    if report_progress is None:
+        report_progress = ProgressEmitter().update
+    total = sum(end - start for start, end in ranges)
+    done = 0
+    hasher = new_hash(algorithm)
+    for view in read_ranges(target, ranges, sector_size):
+        hasher.update(view)
+        done += len(view)
+        if total:
+            report_progress(done / total, done)
+    return hasher.hexdigest() == expected
+
+# Exit status for each final target status
+EXIT_CODES = {"success": 0, "nospace": 3, "failed": 4, "mismatch": 5}
+
+class TargetWriter:
+    """
+    Writes the decoded image to one target device.
+    With several targets, every writer runs on its own thread and consumes the same decoded
+    buffers, so the image is decoded once and a failing device does not stop the others.
+    Output lines are prefixed with the target path when prefix is set.
+    With a checkpoint, the target is flushed and the offset written recorded whenever one is
+    due; data before resume_offset was written by an earlier, interrupted run and is skipped.
+    """
+
+    def __init__(self, target, direct=False, skip_zeros=False, assume_zeroed=False, incremental=False, prefix=False):
+        self.target = target
+        self.direct = direct
+        self.skip_zeros = skip_zeros
+        self.assume_zeroed = assume_zeroed
+        self.incremental = incremental
+        self.prefix = f"{target} " if prefix else ""
+        self.status = None
+        self.output_file = None
+        self.target_fd = None
+        self.zeroed_end = 0
+        self.zero_out = False
+        self.gpt_table = None
+        self.size = 0
+        self.unchanged = 0
+        self.checkpoint = None
+        self.resume_offset = 0
+        self.progress = ProgressEmitter(self.prefix, target=target)
+
+    def open(self, source_size, size_exact):
+        """Unmounts the target, checks that the image fits and opens the device for writing."""
+        do_umount(self.target)
+        device = parted.getDevice(self.target)
+        self.sector_size = device.sectorSize
+        device_size = self.device_size = device.getLength() * device.sectorSize
+        if source_size and device_size < source_size:
+            syslog.syslog(f"Error: Not enough space on target '{self.target}'. Required: {source_size}, Available: {device_size}")
+            self.status = "nospace"
+            return
+
+        if self.direct:
+            # Bypass the page cache: data goes straight from aligned buffers to the device
+            try:
+                self.output_file = open(os.open(self.target, os.O_WRONLY | os.O_DIRECT), 'wb', buffering=0)
+                syslog.syslog(f"Using direct I/O on '{self.target}' with a logical block size of {self.sector_size} bytes")
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                syslog.syslog(f"Direct I/O is not supported on '{self.target}', writing through the page cache")
+                self.direct = False
+        if not self.direct:
+            # Not truncated, so that incremental and resumed writes to a regular file keep its data
+            self.output_file = open(os.open(self.target, os.O_WRONLY), 'wb')
+
+        # Zero blocks of the image can be skipped if the target already reads as zeros there,
+        # either because a previous wipe is trusted or because the device zeroes ranges itself.
+        if self.assume_zeroed:
+            syslog.syslog(f"Assuming '{self.target}' is already zeroed, zero blocks will not be written")
+            self.zeroed_end = device_size
+        elif self.skip_zeros:
+            if queue_limit(self.target, 'write_zeroes_max_bytes') > 0:
+                self.zeroed_end = source_size if size_exact else device_size
+                self.zeroed_end -= self.zeroed_end % self.sector_size
+                self.zero_out = True
+            else:
+                syslog.syslog(f"'{self.target}' cannot zero ranges in hardware, zero blocks will be written")
+        # Decoding overlaps with writing, so it is part of the write phase
+        self.progress.set_phase("write", source_size if size_exact else None)
+
+    def report_progress(self, fraction, done=None):
+        self.progress.update(fraction, done)
+
+    def start(self):
+        if self.zero_out and self.resume_offset < self.zeroed_end:
+            syslog.syslog(f"Zeroing bytes {self.resume_offset} to {self.zeroed_end} of '{self.target}' with BLKZEROOUT")
+            block_range_ioctl(self.output_file.fileno(), BLKZEROOUT, self.resume_offset, self.zeroed_end - self.resume_offset)
+        if self.incremental:
+            # Compare against what is on the device, not against stale cached pages
+            self.target_fd = os.open(self.target, os.O_RDONLY)
+            os.posix_fadvise(self.target_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    def write_at(self, offset, data):
+        if self.target_fd is not None:
+            current = os.pread(self.target_fd, len(data), offset)
+            if len(current) == len(data) and current.startswith(data):
+                self.unchanged += len(data)
+                return
+        self.output_file.seek(offset)
+        if self.direct:
+            write_direct(self.output_file.fileno(), data, self.sector_size)
+        else:
+            self.output_file.write(data)
+
+    def consume(self, item):
+        """Writes one chunk, given as (segments, end, fraction) with (offset, view, zero) segments."""
+        segments, end, fraction = item
+        for offset, view, zero in segments:
+            if offset + len(view) <= self.resume_offset:
+                continue
+            if offset < self.resume_offset:
+                view = view[self.resume_offset - offset:]
+                offset = self.resume_offset
+            if not (zero and offset + len(view) <= self.zeroed_end):
+                self.write_at(offset, view)
+        self.size = end
+        self.save_checkpoint(end)
+        self.report_progress(fraction, end)
+
+    def load_checkpoint(self, directory, parameters, resume):
+        """Starts checkpointing to directory and, with resume, continues from a matching checkpoint."""
+        self.checkpoint = Checkpoint('write', self.target, parameters, directory)
+        state = self.checkpoint.load() if resume else None
+        if state:
+            self.resume_offset = state['offset'] - state['offset'] % self.sector_size
+            syslog.syslog(f"Resuming the write to '{self.target}' at offset {self.resume_offset}")
+        elif resume:
+            syslog.syslog(f"No checkpoint matches this write to '{self.target}', starting from the beginning")
+
+    def save_checkpoint(self, offset):
+        """Flushes the target and records that it holds the image up to offset, if a checkpoint is due."""
+        if self.checkpoint and self.checkpoint.due() and offset > self.resume_offset:
+            self.output_file.flush()
+            os.fsync(self.output_file.fileno())
+            self.checkpoint.save(offset=offset)
+
+    def finish(self, result):
+        """
+        Flushes the device and, if the write completed, verifies it.
+        result is (algorithm, expected_hash, ranges), or None if the write was aborted.
+        """
+        try:
+            if result is not None:
+                self.progress.set_phase("fsync")
+                self.output_file.flush()
+                os.fsync(self.output_file.fileno())
+        finally:
+            if self.target_fd is not None:
+                os.close(self.target_fd)
+            self.output_file.close()
+        if result is None:
+            self.status = "failed"
+            return
+        if self.checkpoint:
+            self.checkpoint.remove()
+
+        syslog.syslog(f"Write to '{self.target}' finished. Total bytes written: {self.size}")
+        if self.incremental:
+            syslog.syslog(f"Incremental write: {self.unchanged} bytes were already up to date on '{self.target}' and were not rewritten")
+
+        algorithm, expected, ranges = result
+        if algorithm:
+            syslog.syslog(f"Verifying '{self.target}' against the {algorithm} hash of the image")
+            emit(f"{self.prefix}verifying")
+            self.progress.set_phase("verify", sum(end - start for start, end in ranges))
+            if not verify_target(self.target, ranges, self.sector_size, expected, algorithm, self.report_progress):
+                syslog.syslog(f"Error: Data read back from '{self.target}' does not match the image")
+                self.status = "mismatch"
+                return
+            syslog.syslog(f"Verification of '{self.target}' succeeded")
+        if self.gpt_table:
+            self.write_gpt()
+        self.status = "success"
+
+    def write_gpt(self):
+        """
+        Points the copied GPT at the end of this target and writes the backup table there.
+        This is done after verification, which compares the data as it was copied.
+        """
+        header, entries = self.gpt_table
+        last_lba = self.device_size // self.sector_size - 1
+        primary, backup_lba, backup = gpt.relocate(header, entries, last_lba, self.sector_size)
+        fd = os.open(self.target, os.O_WRONLY)
+        try:
+            os.pwrite(fd, primary, self.sector_size)
+            os.pwrite(fd, backup, backup_lba * self.sector_size)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        syslog.syslog(f"Moved the backup GPT of '{self.target}' to sector {last_lba}")
+
+def exit_with_status(writers):
+    """
+    Prints the final status of every target and exits.
+    A single target keeps the plain protocol ("1.0" on success, otherwise the error word);
+    several targets get one "<target> <status>" line each. The exit status is that of the
+    failed targets if they all failed the same way, otherwise 4.
+    """
+    for writer in writers:
+        status = writer.status or "failed"
+        progress.status(status, writer.target)
+        if writer.prefix:
+            emit(f"{writer.prefix}{status}")
+        else:
+            emit("1.0" if status == "success" else status)
+    codes = {EXIT_CODES[writer.status or "failed"] for writer in writers} - {0}
+    exit(codes.pop() if len(codes) == 1 else 4 if codes else 0)
+
+def write_parameters(source, clone, bmap_path, used_extent_only, skip_zeros, assume_zeroed, incremental):
+    """Returns what a checkpoint of a write depends on: the source, as it is now, and the options that change what is written."""
+    if clone:
+        source_identity = device_identity(source)
+    else:
+        st = os.stat(source)
+        source_identity = {'path': os.path.realpath(source), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+    return {
+        'source': source_identity,
+        'bmap': os.path.realpath(bmap_path) if bmap_path else None,
+        'used_extent': used_extent_only,
+        'skip_zeros': skip_zeros,
+        'assume_zeroed': assume_zeroed,
+        'incremental': incremental,
+    }
+
+def raw_write(source, targets, direct=False, skip_zeros=False, assume_zeroed=False, bmap_path=None, verify=None, incremental=False, used_extent_only=False,
+              resume=False, checkpoint_dir=None):
+    # A block device source is cloned as is, whatever its first bytes look like
+    clone = is_block_device(source)
+    if clone:
+        opener, compression_method = open, None
+    else:
+        opener, compression_method = get_opener_by_magic(source)
 
     if opener is None:
+        progress.status("failed")
         print("failed")
         exit(4)
 
-    if compression_method:
-        syslog.syslog(f"Writing compressed ({compression_method}) image '{source}' to '{target}'")
+    if clone:
+        syslog.syslog(f"Cloning device '{source}' to {', '.join(targets)}")
+    elif compression_method:
+        syslog.syslog(f"Writing compressed ({compression_method}) image '{source}' to {', '.join(targets)}")
     else:
-        syslog.syslog(f"Writing raw image '{source}' to '{target}'")
-        
+        syslog.syslog(f"Writing raw image '{source}' to {', '.join(targets)}")
+
+    writers = [TargetWriter(target, direct, skip_zeros, assume_zeroed, incremental, prefix=len(targets) > 1)
+               for target in targets]
     try:
-        do_umount(target)
         bs = 1048576 # 1MB block size
         size = 0
         
         # Check available space on target device
-        # This is a best-effort check for uncompressed files only.
-        # For compressed files, we cannot know the uncompressed size beforehand.
-        if not compression_method:
-            source_size = os.path.getsize(source)
+        # Compressed images are probed for their uncompressed size. Some formats only give
+        # a lower bound (gzip) or nothing at all (bzip2), which still rules out images that
+        # cannot possibly fit.
+        if compression_method:
+            source_size, size_exact = probe_uncompressed_size(source, compression_method)
+            if source_size is None:
+                syslog.syslog(f"Uncompressed size of '{source}' is unknown, skipping the space check.")
+            else:
+                syslog.syslog(f"Uncompressed size of '{source}' is {'' if size_exact else 'at least '}{source_size} bytes")
+            # Some decoders stop quietly at the end of a truncated image, which the declared size reveals
+            declared_size = source_size if size_exact else None
+        else:
+            source_size, size_exact = int(get_source_size(source)), True
             if source_size == 0:
                 syslog.syslog(f"Error: Source '{source}' has zero size or is inaccessible.")
-                print("failed")
-                exit(4)
-            
-            device = parted.getDevice(target)
-            device_size = device.getLength() * device.sectorSize
-            if device_size < source_size:
-                syslog.syslog(f"Error: Not enough space on target '{target}'. Required: {source_size}, Available: {device_size}")
-                print("nospace")
-                exit(3)
+                exit_with_status(writers)
+
+        # A device can be copied only up to the end of its last partition. A GPT then needs
+        # room for its backup at the end of each target, where it is rebuilt after the copy.
+        copy_length = None
+        gpt_table = None
+        gpt_backup_length = 0
+        if clone and used_extent_only:
+            extent = used_extent(source)
+            if extent is None:
+                syslog.syslog(f"No partitions found on '{source}', copying the whole device")
+            else:
+                copy_length, source_sector_size, gpt_table = extent
+                source_size = copy_length
+                if gpt_table:
+                    gpt_backup_length = gpt.backup_length(gpt_table[0], source_sector_size)
+                syslog.syslog(f"Copying the first {copy_length} bytes of '{source}', up to the end of its last partition")
+
+        # A block map records the exact image size, whatever the compression
+        bmap_filter = None
+        if bmap_path:
+            bmap = load_bmap(bmap_path)
+            if not size_exact:
+                source_size, size_exact = bmap.image_size, True
+            bmap_filter = BmapFilter(bmap)
+            syslog.syslog(f"Using block map '{bmap_path}': {bmap.mapped_blocks_count} of {bmap.blocks_count} blocks are mapped")
+
+        # Space needed on each target, once the image size is as exact as it gets
+        required_size = source_size + gpt_backup_length if source_size else source_size
+
+        if checkpoint_dir:
+            parameters = write_parameters(source, clone, bmap_path, used_extent_only, skip_zeros, assume_zeroed, incremental)
+
+        # A target that cannot be opened is left out, the others are still written
+        for writer in writers:
+            try:
+                writer.open(required_size, size_exact)
+            except Exception as e:
+                syslog.syslog(f"Error: Cannot open target '{writer.target}': {e}")
+                writer.status = "failed"
+            if checkpoint_dir and writer.status is None:
+                writer.load_checkpoint(checkpoint_dir, parameters, resume)
+            if gpt_table and writer.status is None:
+                if writer.sector_size == source_sector_size:
+                    writer.gpt_table = gpt_table
+                else:
+                    syslog.syslog(f"Warning: '{writer.target}' has another sector size than '{source}', its GPT is not moved")
+        active = [writer for writer in writers if writer.status is None]
+        if not active:
+            exit_with_status(writers)
         
-        # For compressed files, progress reporting based on output size is the only option.
+        # Decompressors read from an already open file so that, when the uncompressed size
+        # is not known exactly, progress can be measured by how far into the compressed
+        # file they are.
+        source_file = open(source, 'rb')
         if compression_method:
-            syslog.syslog("Progress reporting is not available for compressed images.")
-
-        input_stream = opener(source, 'rb')
-
-        with input_stream, open(target, 'wb') as output_file:
-            while True:
-                buffer = input_stream.read(bs)
-                if not buffer:
-                    break
-                output_file.write(buffer)
-                size += len(buffer)
-            
-            output_file.flush()
-            os.fsync(output_file.fileno())
-
-        syslog.syslog(f"Write finished. Total bytes written: {size}")
-        print("1.0") # Assume success if no exceptions were thrown
-        exit(0)
-            
+            # Images made of several zstd frames or xz blocks are decoded on all cores
+            input_stream = open_parallel_decoder(source_file, compression_method)
+            if input_stream is None:
+                input_stream = opener(source_file, 'rb')
+            else:
+                syslog.syslog(f"Decoding {compression_method} image in parallel")
+        else:
+            input_stream = source_file
+        if size_exact:
+            source_length = source_size
+        else:
+            source_length = os.fstat(source_file.fileno()).st_size
+
+        def source_fraction():
+            if not size_exact:
+                # The pipeline thread owns the file object, read the descriptor offset instead
+                done = os.lseek(source_file.fileno(), 0, os.SEEK_CUR)
+            else:
+                done = size
+            return min(done / source_length, 1.0) if source_length else 0.0
+
+        # Direct I/O needs aligned buffers, which all targets can share
+        buffers = aligned_buffers(DEFAULT_DEPTH, bs) if direct else None
+
+        with source_file, input_stream:
+            # A resumed write of an uncompressed image starts reading where the earliest target
+            # stopped. Compressed images are decoded from the start, as is anything hashed.
+            resume_offset = min(writer.resume_offset for writer in active)
+            if resume_offset and not compression_method and not bmap_filter and not verify:
+                input_stream.seek(resume_offset)
+                size = resume_offset
+
+            # Data copied by the kernel cannot be hashed or compared on the way
+            writer = active[0]
+            # Device sources are read through the pipeline so that reads overlap with writes
+            if len(active) == 1 and not clone and not compression_method and not direct and not writer.zeroed_end and not bmap_filter and not verify and not incremental:
+                # Raw images can be copied by the kernel without going through user space
+                writer.output_file.seek(size)
+                for n in kernel_copy(input_stream.fileno(), writer.output_file.fileno(), source_size - size, offset=size):
+                    size += n
+                    writer.save_checkpoint(size)
+                    writer.report_progress(source_fraction(), size)
+                if size < source_size:
+                    syslog.syslog(f"Kernel copy stopped at {size} bytes, continuing with buffered copy")
+                input_stream.seek(size)
+                writer.output_file.seek(size)
+
+            # Hash of everything written, compared with a read-back of the devices afterwards
+            hasher = new_hash(verify) if verify else None
+            written_ranges = []
+            # Zero detection is only worth its cost if some target can skip zero blocks
+            check_zeros = any(writer.zeroed_end for writer in active)
+
+            # Decompression runs on the pipeline's reader thread and every target is written
+            # on a thread of its own, so decoding overlaps with the writes and happens once
+            with Pipeline(input_stream, bs, buffers=buffers, length=copy_length - size if copy_length else None) as pipeline:
+                fanout = FanOut(pipeline, active)
+                result = None
+                try:
+                    for buf, chunk in pipeline.chunks():
+                        if bmap_filter:
+                            # Only mapped ranges are written, each one checked against its checksum
+                            segments = []
+                            for offset, part in bmap_filter.mapped(size, chunk):
+                                if hasher:
+                                    hasher.update(part)
+                                    if written_ranges and written_ranges[-1][1] == offset:
+                                        written_ranges[-1][1] = offset + len(part)
+                                    else:
+                                        written_ranges.append([offset, offset + len(part)])
+                                segments.append((offset, part, False))
+                        else:
+                            if hasher:
+                                hasher.update(chunk)
+                            segments = [(size, chunk, check_zeros and is_zero(chunk))]
+                        size += len(chunk)
+                        fanout.submit(buf, (segments, size, source_fraction()))
+                    if bmap_filter:
+                        # Ranges past the end of a short source would be neither written nor checked
+                        bmap_filter.finish()
+                    if compression_method and declared_size is not None and size != declared_size:
+                        raise ValueError(f"Decoded {size} bytes from '{source}', but the image declares {declared_size}")
+                    if verify and not bmap_filter:
+                        written_ranges = [[0, size]]
+                    result = (verify, hasher.hexdigest() if hasher else None, written_ranges)
+                finally:
+                    fanout.close(result)
+
+        for writer, e in fanout.errors.items():
+            syslog.syslog(f"Error: Writing to '{writer.target}' failed: {e}")
+            writer.status = "failed"
+
     except Exception as e:
         syslog.syslog(f"An exception occurred: {e}")
         print(f"Error: {e}", file=sys.stderr)
-        print("failed")
-        exit(4)
+        for writer in writers:
+            if writer.status is None:
+                writer.status = "failed"
+
+    exit_with_status(writers)
 
 def main():
     parser = argparse.ArgumentParser(description="Write a disk image to a device. Automatically detects compression.",
                                      prog="driveutility-write",
-                                     epilog="Example: driveutility-write -s /foo/image.zst -t /dev/sdj")
-    parser.add_argument("-s", "--source", help="Source image file path (can be raw or compressed)", type=str, required=True)
-    parser.add_argument("-t", "--target", help="Target device path", type=str, required=True)
+                                     epilog="Example: driveutility-write -s /foo/image.zst -t /dev/sdj /dev/sdk")
+    parser.add_argument("-s", "--source", help="Source image file path (can be raw or compressed) or block device to clone", type=str, required=True)
+    parser.add_argument("-t", "--target", help="Target device path; several devices can be given to write them all at once", type=str, nargs="+", required=True)
+    parser.add_argument("--direct", help="Write with O_DIRECT, bypassing the page cache", action="store_true")
+    parser.add_argument("--skip-zeros", help="Zero the target with BLKZEROOUT first, then skip zero blocks of the image", action="store_true")
+    parser.add_argument("--assume-zeroed", help="Skip zero blocks of the image, trusting that the target was already wiped with zeros", action="store_true")
+    parser.add_argument("-b", "--bmap", help="Block map (.bmap) file: only write the mapped ranges and verify their checksums", type=str, default=None)
+    parser.add_argument("-i", "--incremental", help="Compare the image with the target block by block and only write the blocks that differ", action="store_true")
+    parser.add_argument("-V", "--verify", help=f"Read the data back after writing and compare hashes (algorithm: {', '.join(VERIFY_ALGORITHMS)}; default: blake2b)",
+                        nargs="?", const="blake2b", choices=VERIFY_ALGORITHMS, default=None)
+    parser.add_argument("-e", "--used-extent", help="When cloning a block device, only copy it up to the end of its last partition", action="store_true")
+    parser.add_argument("--resume", help="Continue an interrupted write of the same image to the same targets from its last checkpoint", action="store_true")
+    progress.add_channel_argument(parser)
     
     try:
         args = parser.parse_args()
+        if args.incremental and args.skip_zeros:
+            parser.error("--incremental cannot be combined with --skip-zeros, which erases the target first")
+        if len(set(args.target)) != len(args.target):
+            parser.error("each target can only be given once")
+        if os.path.realpath(args.source) in map(os.path.realpath, args.target):
+            parser.error("the source cannot also be a target")
+        if args.used_extent and not is_block_device(args.source):
+            parser.error("--used-extent requires a block device as source")
+        if args.progress_fd is not None:
+            try:
+                progress.open_channel(args.progress_fd)
+            except OSError as e:
+                parser.error(f"--progress-fd: {e}")
         if not os.path.exists(args.source):
             syslog.syslog(f"Source file not found: {args.source}")
+            progress.status("failed")
             print("failed")
             exit(4)
 
-        raw_write(args.source, args.target)
+        raw_write(args.source, args.target, args.direct, args.skip_zeros, args.assume_zeroed, args.bmap, args.verify, args.incremental, args.used_extent,
+                  args.resume, CHECKPOINT_DIR)
     except Exception as e:
         print(e, file=sys.stderr)
         sys.exit(2)
@@ -0,0 +1,33 @@
+"""
+Sharing resources between helpers working on several devices at once.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limits the bytes per second that several threads move together to rate.
+    consume(n) takes n bytes from the budget, which refills at rate and holds at most burst
+    bytes (one second's worth by default), and sleeps while the budget is overdrawn. Threads
+    that overdraw it wait in turn, so the budget is shared evenly between them.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            self.sleep(wait)
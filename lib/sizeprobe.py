@@ -0,0 +1,206 @@
+"""
+Uncompressed size discovery for compressed disk images.
+
+Only container metadata (trailers, indexes and frame headers) is read, nothing is
+decompressed, so probing a multi-GB image takes milliseconds.
+"""
+import os
+import struct
+
+XZ_HEADER_MAGIC = b'\xfd7zXZ\x00'
+XZ_FOOTER_MAGIC = b'YZ'
+ZSTD_MAGIC = 0xFD2FB528
+LZ4_MAGIC = 0x184D2204
+
+
+def _is_skippable(magic):
+    """zstd and lz4 share the 0x184D2A50-0x184D2A5F range for skippable frames."""
+    return magic & 0xFFFFFFF0 == 0x184D2A50
+
+
+def _read_exact(f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) != length:
+        raise ValueError("Unexpected end of file")
+    return data
+
+
+def _read_varint(data, pos):
+    """Decodes an xz multibyte integer, returning the value and the next position."""
+    value = 0
+    for i in range(9):
+        byte = data[pos + i]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, pos + i + 1
+    raise ValueError("Invalid xz multibyte integer")
+
+
+def gzip_size(f):
+    """
+    Returns the ISIZE field of the last gzip member.
+    ISIZE is the member size modulo 2^32, so it is only a lower bound of the real size:
+    it wraps for members over 4 GiB and ignores earlier members of multi-member files.
+    """
+    f.seek(-4, os.SEEK_END)
+    return struct.unpack('<I', f.read(4))[0]
+
+
+def xz_streams(f):
+    """
+    Parses the index of every stream in an xz file, walking backwards from the end.
+    Returns a list of (stream_offset, stream_flags, blocks) in file order, where blocks is a
+    list of (block_offset, unpadded_size, uncompressed_size).
+    """
+    streams = []
+    end = f.seek(0, os.SEEK_END)
+    while end > 0:
+        # Skip stream padding, which is made of null bytes in multiples of four
+        footer = _read_exact(f, end - 12, 12)
+        if footer[-4:] == b'\x00' * 4:
+            end -= 4
+            continue
+        if footer[10:] != XZ_FOOTER_MAGIC:
+            raise ValueError("Invalid xz stream footer")
+        backward_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+        stream_flags = footer[8:10]
+        index_offset = end - 12 - backward_size
+        index = _read_exact(f, index_offset, backward_size)
+        if index[0] != 0:
+            raise ValueError("Invalid xz index indicator")
+        count, pos = _read_varint(index, 1)
+        records = []
+        for _ in range(count):
+            unpadded, pos = _read_varint(index, pos)
+            uncompressed, pos = _read_varint(index, pos)
+            records.append((unpadded, uncompressed))
+        blocks_size = sum((unpadded + 3) & ~3 for unpadded, _ in records)
+        stream_offset = index_offset - blocks_size - 12
+        if stream_offset < 0 or _read_exact(f, stream_offset, 6) != XZ_HEADER_MAGIC:
+            raise ValueError("Invalid xz stream header")
+        blocks = []
+        offset = stream_offset + 12
+        for unpadded, uncompressed in records:
+            blocks.append((offset, unpadded, uncompressed))
+            offset += (unpadded + 3) & ~3
+        streams.insert(0, (stream_offset, stream_flags, blocks))
+        end = stream_offset
+    return streams
+
+
+def xz_size(f):
+    """Returns the uncompressed size of an xz file from its stream indexes."""
+    return sum(uncompressed
+               for _, _, blocks in xz_streams(f)
+               for _, _, uncompressed in blocks)
+
+
+def zstd_frames(f):
+    """
+    Walks the frames of a zstd file using frame and block headers only.
+    Returns a list of (frame_offset, frame_length, content_size), where content_size is None
+    if the frame header does not declare it. Skippable frames are left out.
+    """
+    frames = []
+    end = f.seek(0, os.SEEK_END)
+    offset = 0
+    while offset < end:
+        magic = struct.unpack('<I', _read_exact(f, offset, 4))[0]
+        if _is_skippable(magic):
+            offset += 8 + struct.unpack('<I', _read_exact(f, offset + 4, 4))[0]
+            continue
+        if magic != ZSTD_MAGIC:
+            raise ValueError("Invalid zstd frame magic")
+        descriptor = _read_exact(f, offset + 4, 1)[0]
+        fcs_flag = descriptor >> 6
+        single_segment = descriptor & 0x20
+        has_checksum = descriptor & 0x04
+        dict_id_size = (0, 1, 2, 4)[descriptor & 0x03]
+        fcs_size = (1 if single_segment else 0, 2, 4, 8)[fcs_flag]
+        pos = offset + 5 + (0 if single_segment else 1) + dict_id_size
+        content_size = None
+        if fcs_size:
+            raw = _read_exact(f, pos, fcs_size)
+            content_size = int.from_bytes(raw, 'little')
+            if fcs_size == 2:
+                content_size += 256
+        pos += fcs_size
+        while True:
+            header = int.from_bytes(_read_exact(f, pos, 3), 'little')
+            last = header & 1
+            block_type = (header >> 1) & 3
+            block_size = header >> 3
+            # RLE blocks store a single byte regardless of their regenerated size
+            pos += 3 + (1 if block_type == 1 else block_size)
+            if last:
+                break
+        if has_checksum:
+            pos += 4
+        frames.append((offset, pos - offset, content_size))
+        offset = pos
+    return frames
+
+
+def zstd_size(f):
+    """Returns the uncompressed size of a zstd file, or None if a frame omits its content size."""
+    sizes = [content_size for _, _, content_size in zstd_frames(f)]
+    if any(size is None for size in sizes):
+        return None
+    return sum(sizes)
+
+
+def lz4_size(f):
+    """Returns the uncompressed size of an lz4 frame file, or None if a frame omits its content size."""
+    total = 0
+    end = f.seek(0, os.SEEK_END)
+    offset = 0
+    while offset < end:
+        magic = struct.unpack('<I', _read_exact(f, offset, 4))[0]
+        if _is_skippable(magic):
+            offset += 8 + struct.unpack('<I', _read_exact(f, offset + 4, 4))[0]
+            continue
+        if magic != LZ4_MAGIC:
+            raise ValueError("Invalid lz4 frame magic")
+        flags = _read_exact(f, offset + 4, 1)[0]
+        if not flags & 0x08:
+            return None
+        total += struct.unpack('<Q', _read_exact(f, offset + 6, 8))[0]
+        block_checksum = 4 if flags & 0x10 else 0
+        # FLG, BD, the content size, an optional dictionary ID and the header checksum
+        pos = offset + 4 + 2 + 8 + (4 if flags & 0x01 else 0) + 1
+        while True:
+            block_size = struct.unpack('<I', _read_exact(f, pos, 4))[0] & 0x7FFFFFFF
+            pos += 4
+            if block_size == 0:
+                break
+            pos += block_size + block_checksum
+        if flags & 0x04:
+            pos += 4
+        offset = pos
+    return total
+
+
+def probe_uncompressed_size(path, compression_method):
+    """
+    Returns (size, exact) for a compressed image without decompressing it.
+    When exact is False, size is only a lower bound of the uncompressed size.
+    Returns (None, False) if the format does not record a size or the file cannot be parsed.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if compression_method == 'gzip':
+                return gzip_size(f), False
+            elif compression_method == 'xz':
+                return xz_size(f), True
+            elif compression_method == 'zstd':
+                size = zstd_size(f)
+            elif compression_method == 'lz4':
+                size = lz4_size(f)
+            else:
+                size = None
+    except (OSError, ValueError, IndexError, struct.error):
+        return None, False
+    if size is None:
+        return None, False
+    return size, True
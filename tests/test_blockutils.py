@@ -0,0 +1,130 @@
+"""
+Tests for blockutils module.
+"""
+import errno
+import os
+import pytest
+from unittest.mock import patch
+
+import blockutils
+
+
+class TestKernelCopy:
+    """Tests for kernel_copy function."""
+
+    def test_copies_between_files(self, temp_dir):
+        """Test that data is copied and chunked as requested."""
+        src_path = os.path.join(temp_dir, 'src')
+        dst_path = os.path.join(temp_dir, 'dst')
+        data = os.urandom(10000)
+        with open(src_path, 'wb') as f:
+            f.write(data)
+        with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+            moved = list(blockutils.kernel_copy(src.fileno(), dst.fileno(), len(data), chunk_size=4096))
+        assert sum(moved) == len(data)
+        assert len(moved) == 3
+        with open(dst_path, 'rb') as f:
+            assert f.read() == data
+
+    def test_stops_when_kernel_refuses(self):
+        """Test that unsupported descriptors end the copy without raising."""
+        refused = OSError(errno.EINVAL, "Invalid argument")
+        with patch.object(blockutils, '_copy_file_range', side_effect=refused):
+            with patch.object(blockutils, '_sendfile', side_effect=refused):
+                assert list(blockutils.kernel_copy(3, 4, 100)) == []
+
+    def test_propagates_real_errors(self):
+        """Test that I/O errors are not mistaken for missing support."""
+        with patch.object(blockutils, '_copy_file_range', side_effect=OSError(errno.EIO, "I/O error")):
+            with patch.object(blockutils, '_sendfile', side_effect=OSError(errno.EIO, "I/O error")):
+                with pytest.raises(OSError):
+                    list(blockutils.kernel_copy(3, 4, 100))
+
+
+class TestWriteDirect:
+    """Tests for aligned writes."""
+
+    def test_aligned_buffers_are_page_aligned_sizes(self):
+        """Test that the pool hands out writable buffers of the requested size."""
+        buffers = blockutils.aligned_buffers(2, 8192)
+        assert len(buffers) == 2
+        assert all(len(buf) == 8192 for buf in buffers)
+        buffers[0][:4] = b'abcd'
+
+    def test_write_direct_writes_unaligned_tail(self, temp_dir):
+        """Test that a trailing partial sector is still written."""
+        path = os.path.join(temp_dir, 'out')
+        data = b'a' * 1024 + b'tail'
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+        try:
+            blockutils.write_direct(fd, data, 512)
+        finally:
+            os.close(fd)
+        with open(path, 'rb') as f:
+            assert f.read() == data
+
+    def test_write_all_loops_over_short_writes(self):
+        """Test that short writes are retried with the remainder."""
+        written = []
+
+        def short_write(fd, view):
+            written.append(bytes(view[:2]))
+            return min(2, len(view))
+
+        with patch('os.write', side_effect=short_write):
+            blockutils.write_all(1, b'abcde')
+        assert b''.join(written) == b'abcde'
+
+
+class TestIsZero:
+    """Tests for is_zero function."""
+
+    @pytest.mark.parametrize("factory", [bytes, bytearray, lambda n: memoryview(bytearray(n))])
+    def test_zero_buffers(self, factory):
+        """Test that zero-filled buffers of any type are detected."""
+        assert blockutils.is_zero(factory(4096)) is True
+
+    def test_non_zero_buffer(self):
+        """Test that a single non-zero byte is noticed."""
+        data = bytearray(4096)
+        data[-1] = 1
+        assert blockutils.is_zero(data) is False
+        assert blockutils.is_zero(memoryview(data)) is False
+
+
+class TestQueueLimit:
+    """Tests for sysfs queue limit lookup."""
+
+    def test_reads_integer_limit(self, temp_dir):
+        """Test that the limit file is parsed as an integer."""
+        with open(os.path.join(temp_dir, 'write_zeroes_max_bytes'), 'w') as f:
+            f.write('33554432\n')
+        with patch.object(blockutils, '_sysfs_queue_dir', return_value=temp_dir):
+            assert blockutils.queue_limit('/dev/sdb', 'write_zeroes_max_bytes') == 33554432
+
+    def test_missing_limit_is_zero(self, temp_dir):
+        """Test that unavailable limits read as unsupported."""
+        with patch.object(blockutils, '_sysfs_queue_dir', return_value=temp_dir):
+            assert blockutils.queue_limit('/dev/sdb', 'discard_max_bytes') == 0
+
+
+class TestReadRanges:
+    """Tests for read_ranges function."""
+
+    def test_reads_unaligned_ranges(self, temp_dir):
+        """Test that ranges not aligned to sectors come back exactly."""
+        path = os.path.join(temp_dir, 'device')
+        data = os.urandom(10000)
+        with open(path, 'wb') as f:
+            f.write(data)
+        ranges = [(0, 700), (1000, 5000), (9990, 10000)]
+        out = b''.join(bytes(view) for view in blockutils.read_ranges(path, ranges, 512, block_size=2048))
+        assert out == data[0:700] + data[1000:5000] + data[9990:10000]
+
+    def test_short_device_raises(self, temp_dir):
+        """Test that reading past the end of the device is an error."""
+        path = os.path.join(temp_dir, 'device')
+        with open(path, 'wb') as f:
+            f.write(bytes(1024))
+        with pytest.raises(EOFError):
+            list(blockutils.read_ranges(path, [(0, 4096)], 512))
@@ -0,0 +1,119 @@
+"""
+Tests for bmap module.
+"""
+import hashlib
+import os
+import pytest
+
+import bmap
+
+
+BS = bmap.BMAP_BLOCK_SIZE
+
+
+def sample_image():
+    """Two data blocks, two zero blocks, one data block and a partial zero tail."""
+    return os.urandom(2 * BS) + bytes(2 * BS) + os.urandom(BS) + bytes(100)
+
+
+def build(data, chunk_size):
+    builder = bmap.BmapBuilder()
+    for i in range(0, len(data), chunk_size):
+        builder.update(data[i:i + chunk_size])
+    return builder.finish()
+
+
+class TestBmapBuilder:
+    """Tests for BmapBuilder class."""
+
+    @pytest.mark.parametrize("chunk_size", [1000, BS, 3 * BS + 7, 1048576])
+    def test_ranges_do_not_depend_on_chunking(self, chunk_size):
+        """Test that zero blocks split ranges wherever chunk boundaries fall."""
+        data = sample_image()
+        result = build(data, chunk_size)
+        assert result.image_size == len(data)
+        assert [(first, last) for first, last, _ in result.ranges] == [(0, 1), (4, 4)]
+        assert result.ranges[0][2] == hashlib.sha256(data[:2 * BS]).hexdigest()
+        assert result.ranges[1][2] == hashlib.sha256(data[4 * BS:5 * BS]).hexdigest()
+
+    def test_partial_last_block_is_mapped(self):
+        """Test that a non-zero partial block is hashed over its real length."""
+        data = bytes(BS) + b'tail'
+        result = build(data, BS)
+        assert result.ranges == [(1, 1, hashlib.sha256(b'tail').hexdigest())]
+        assert result.byte_ranges() == [(BS, BS + 4, result.ranges[0][2])]
+
+
+class TestBmapFile:
+    """Tests for saving and loading bmap files."""
+
+    def test_round_trip(self, temp_dir):
+        """Test that a saved bmap loads back identically."""
+        path = os.path.join(temp_dir, 'image.bmap')
+        original = build(sample_image(), 1048576)
+        bmap.save_bmap(path, original)
+        loaded = bmap.load_bmap(path)
+        assert loaded.image_size == original.image_size
+        assert loaded.block_size == BS
+        assert loaded.ranges == original.ranges
+        assert loaded.blocks_count == 6
+        assert loaded.mapped_blocks_count == 3
+
+    def test_modified_file_is_rejected(self, temp_dir):
+        """Test that the bmap file checksum catches edits."""
+        path = os.path.join(temp_dir, 'image.bmap')
+        bmap.save_bmap(path, build(sample_image(), 1048576))
+        with open(path) as f:
+            text = f.read()
+        with open(path, 'w') as f:
+            f.write(text.replace('> 4 <', '> 3 <'))
+        with pytest.raises(ValueError):
+            bmap.load_bmap(path)
+
+    def test_malformed_file_is_rejected(self, temp_dir):
+        """Test that non-bmap files raise ValueError."""
+        path = os.path.join(temp_dir, 'image.bmap')
+        with open(path, 'w') as f:
+            f.write('<bmap version="2.0"><ImageSize>x</ImageSize></bmap>')
+        with pytest.raises(ValueError):
+            bmap.load_bmap(path)
+
+
+class TestBmapFilter:
+    """Tests for BmapFilter class."""
+
+    def test_yields_only_mapped_parts(self):
+        """Test that unmapped ranges are left out and offsets are absolute."""
+        data = sample_image()
+        bmap_filter = bmap.BmapFilter(build(data, BS))
+        parts = []
+        for offset in range(0, len(data), 3000):
+            for start, part in bmap_filter.mapped(offset, data[offset:offset + 3000]):
+                parts.append((start, bytes(part)))
+        assert b''.join(part for _, part in parts) == data[:2 * BS] + data[4 * BS:5 * BS]
+        assert parts[0][0] == 0
+        assert min(start for start, _ in parts if start >= 2 * BS) == 4 * BS
+
+    def test_checksum_mismatch_raises(self):
+        """Test that corrupted image data is detected."""
+        data = sample_image()
+        bmap_filter = bmap.BmapFilter(build(data, BS))
+        corrupted = b'X' + data[1:]
+        with pytest.raises(ValueError):
+            list(bmap_filter.mapped(0, corrupted))
+
+    def test_finish_accepts_whole_image(self):
+        """Test that finish() passes once the stream reached the end of the image."""
+        data = sample_image()
+        bmap_filter = bmap.BmapFilter(build(data, BS))
+        list(bmap_filter.mapped(0, data))
+        bmap_filter.finish()
+
+    @pytest.mark.parametrize("length", [BS, 4 * BS + 10, 5 * BS])
+    def test_finish_rejects_short_image(self, length):
+        """Test that a stream ending before the image does, even within unmapped space, is detected."""
+        data = sample_image()
+        bmap_filter = bmap.BmapFilter(build(data, BS))
+        list(bmap_filter.mapped(0, data[:length]))
+        with pytest.raises(ValueError):
+            bmap_filter.finish()
@@ -0,0 +1,92 @@
+"""
+Tests for checkpoint module.
+"""
+import json
+import os
+
+import checkpoint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_device(temp_dir, size=8192):
+    path = os.path.join(temp_dir, 'device.img')
+    with open(path, 'wb') as f:
+        f.write(bytes(size))
+    return path
+
+
+class TestDeviceIdentity:
+    """Tests for device_identity function."""
+
+    def test_regular_file(self, temp_dir):
+        """Test that a device without serial is identified by size and path."""
+        path = make_device(temp_dir)
+        assert checkpoint.device_identity(path) == {'size': 8192, 'path': os.path.realpath(path)}
+
+
+class TestCheckpoint:
+    """Tests for Checkpoint class."""
+
+    def test_save_and_load(self, temp_dir):
+        """Test that saved state is loaded back for the same device and parameters."""
+        device = make_device(temp_dir)
+        directory = os.path.join(temp_dir, 'state')
+        saved = checkpoint.Checkpoint('wipe', device, {'patterns': ['zero']}, directory)
+        saved.save(pass_index=1, offset=4096)
+        saved.save(offset=8192)
+        assert os.listdir(directory) == [os.path.basename(saved.path)]
+        loaded = checkpoint.Checkpoint('wipe', device, {'patterns': ['zero']}, directory)
+        assert loaded.path == saved.path
+        assert loaded.load() == {'pass_index': 1, 'offset': 8192}
+        loaded.remove()
+        assert loaded.load() is None
+
+    def test_other_parameters_or_device(self, temp_dir):
+        """Test that checkpoints of other parameters or another device are ignored."""
+        device = make_device(temp_dir)
+        directory = os.path.join(temp_dir, 'state')
+        checkpoint.Checkpoint('wipe', device, {'patterns': ['zero']}, directory).save(offset=4096)
+        assert checkpoint.Checkpoint('wipe', device, {'patterns': ['random']}, directory).load() is None
+        with open(device, 'ab') as f:
+            f.write(bytes(512))
+        assert checkpoint.Checkpoint('wipe', device, {'patterns': ['zero']}, directory).load() is None
+
+    def test_tampered_identity(self, temp_dir):
+        """Test that a checkpoint file whose identity does not match is ignored."""
+        device = make_device(temp_dir)
+        directory = os.path.join(temp_dir, 'state')
+        saved = checkpoint.Checkpoint('write', device, {}, directory)
+        saved.save(offset=1)
+        with open(saved.path) as f:
+            data = json.load(f)
+        data['identity']['serial'] = 'OTHER'
+        with open(saved.path, 'w') as f:
+            json.dump(data, f)
+        assert checkpoint.Checkpoint('write', device, {}, directory).load() is None
+
+    def test_due(self, temp_dir):
+        """Test that checkpoints are due once per interval."""
+        clock = FakeClock()
+        saved = checkpoint.Checkpoint('wipe', make_device(temp_dir), {}, temp_dir, interval=30, clock=clock)
+        assert not saved.due()
+        clock.now = 30
+        assert saved.due()
+        saved.save(offset=0)
+        assert not saved.due()
+
+    def test_save_failure_is_not_fatal(self, temp_dir):
+        """Test that an unwritable directory disables checkpoints without raising."""
+        blocker = os.path.join(temp_dir, 'file')
+        with open(blocker, 'w'):
+            pass
+        saved = checkpoint.Checkpoint('wipe', make_device(temp_dir), {}, os.path.join(blocker, 'state'), interval=0)
+        saved.save(offset=0)
+        assert saved.failed
+        assert not saved.due()
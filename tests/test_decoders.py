@@ -0,0 +1,83 @@
+"""
+Tests for decoders module.
+"""
+import io
+import lzma
+import os
+import subprocess
+import shutil
+import pytest
+
+import decoders
+
+
+class TestDecodeXzBlock:
+    """Tests for decoding xz blocks independently."""
+
+    def test_each_stream_block_decodes_alone(self):
+        """Test that blocks from concatenated streams decode without their original stream."""
+        parts = [os.urandom(1000), b'\x00' * 5000, b'abc' * 700]
+        data = b''.join(lzma.compress(p) for p in parts)
+        f = io.BytesIO(data)
+        units = decoders.xz_units(f)
+        assert len(units) == 3
+        for (offset, length, decode, size), part in zip(units, parts):
+            assert size == len(part)
+            assert decode(data[offset:offset + length]) == part
+
+    @pytest.mark.skipif(shutil.which('xz') is None, reason="xz not installed")
+    def test_multi_block_stream(self, temp_dir):
+        """Test a single stream split into blocks by xz --block-size."""
+        payload = os.urandom(50000) * 4
+        path = os.path.join(temp_dir, 'image')
+        with open(path, 'wb') as f:
+            f.write(payload)
+        subprocess.check_call(['xz', '-k', '--block-size=65536', path])
+        with open(path + '.xz', 'rb') as f:
+            assert len(decoders.xz_units(f)) > 1
+            with decoders.open_parallel_decoder(f, 'xz', threads=2) as decoder:
+                assert decoder.read() == payload
+
+
+class TestParallelDecoder:
+    """Tests for ParallelDecoder class."""
+
+    def test_output_order_is_preserved(self):
+        """Test that decoded units come out in file order."""
+        parts = [bytes([i]) * (1000 * (i + 1)) for i in range(6)]
+        f = io.BytesIO(b''.join(lzma.compress(p) for p in parts))
+        decoder = decoders.open_parallel_decoder(f, 'xz', threads=3)
+        assert decoder is not None
+        with decoder:
+            assert decoder.read() == b''.join(parts)
+
+    def test_single_unit_is_not_parallelized(self):
+        """Test that single-block images use the regular decoder."""
+        f = io.BytesIO(lzma.compress(b'abc'))
+        assert decoders.open_parallel_decoder(f, 'xz', threads=4) is None
+        assert f.tell() == 0
+
+    def test_single_thread_is_not_parallelized(self):
+        """Test that one thread falls back to the regular decoder."""
+        f = io.BytesIO(lzma.compress(b'a') + lzma.compress(b'b'))
+        assert decoders.open_parallel_decoder(f, 'xz', threads=1) is None
+
+    def test_read_ahead_limited_by_decoded_bytes(self):
+        """Test that units are decoded ahead only up to max_bytes, but always at least one."""
+        parts = [bytes([i]) * (1000 * (i + 1)) for i in range(6)]
+        f = io.BytesIO(b''.join(lzma.compress(p) for p in parts))
+        decoder = decoders.ParallelDecoder(f, decoders.xz_units(f), threads=8, max_bytes=3000)
+        with decoder:
+            assert [size for _, size in decoder.pending] == [1000, 2000]
+            assert decoder.read(1000) == parts[0]
+            assert [size for _, size in decoder.pending] == [2000]
+            assert decoder.read() == b''.join(parts[1:])
+
+    def test_unknown_sizes_limit_units(self):
+        """Test that units of unknown decoded size are only decoded a couple at a time."""
+        parts = [bytes([i]) * 100 for i in range(6)]
+        f = io.BytesIO(b''.join(lzma.compress(p) for p in parts))
+        units = [unit[:3] + (None,) for unit in decoders.xz_units(f)]
+        with decoders.ParallelDecoder(f, units, threads=8) as decoder:
+            assert len(decoder.pending) == decoders.UNKNOWN_SIZE_PENDING
+            assert decoder.read() == b''.join(parts)
@@ -0,0 +1,106 @@
+"""
+Tests for encoders module.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import os
+import pytest
+
+import encoders
+
+
+class KeepOpenBytesIO(io.BytesIO):
+    """BytesIO that keeps its contents readable after close()."""
+
+    def close(self):
+        self.closed_by_writer = True
+
+
+DECOMPRESSORS = {
+    'gzip': gzip.decompress,
+    'bzip2': bz2.decompress,
+    'xz': lzma.decompress,
+}
+
+
+class TestParallelCompressor:
+    """Tests for ParallelCompressor class."""
+
+    @pytest.mark.parametrize("method", sorted(DECOMPRESSORS))
+    def test_round_trip_across_blocks(self, method):
+        """Test that concatenated blocks decompress to the original data."""
+        data = os.urandom(3000) + b'\x00' * 5000 + os.urandom(2500)
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, method, encoders.LEVELS[method][1], threads=3, block_size=1024) as writer:
+            for i in range(0, len(data), 700):
+                writer.write(data[i:i + 700])
+            writer.flush()
+        assert out.closed_by_writer
+        assert DECOMPRESSORS[method](out.getvalue()) == data
+
+    def test_gzip_output_is_multi_member(self):
+        """Test that each block becomes its own gzip member."""
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, 'gzip', 6, threads=2, block_size=100) as writer:
+            writer.write(b'a' * 250)
+        assert out.getvalue().count(b'\x1f\x8b\x08') == 3
+
+    def test_empty_input(self):
+        """Test that no data produces no blocks."""
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, 'xz', 6, threads=2):
+            pass
+        assert out.getvalue() == b''
+
+    def test_zero_blocks_are_compressed_once(self):
+        """Test that repeated zero blocks reuse a single compressed copy."""
+        calls = []
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, 'gzip', 6, threads=2, block_size=100) as writer:
+            original = writer.compress
+            writer.compress = lambda data, level: calls.append(data) or original(data, level)
+            writer.write(b'\x00' * 400 + b'x' * 100)
+        assert len(calls) == 2
+        assert gzip.decompress(out.getvalue()) == b'\x00' * 400 + b'x' * 100
+
+    def test_single_thread_skips_zero_blocks(self):
+        """Test that one thread still compresses zero blocks only once."""
+        calls = []
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, 'xz', 0, threads=1, block_size=100) as writer:
+            original = writer.compress
+            writer.compress = lambda data, level: calls.append(data) or original(data, level)
+            writer.write(b'\x00' * 500)
+        assert len(calls) == 1
+        assert lzma.decompress(out.getvalue()) == b'\x00' * 500
+
+    def test_zstd_frames(self):
+        """Test that zstd blocks become frames that decode back to the original data."""
+        zstandard = pytest.importorskip('zstandard')
+        data = os.urandom(3000) + b'\x00' * 5000
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, 'zstd', 3, threads=2, block_size=1024) as writer:
+            writer.write(data)
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(out.getvalue()), read_across_frames=True)
+        assert reader.read() == data
+        assert out.getvalue().count(b'(\xb5/\xfd') >= 8
+
+    @pytest.mark.parametrize("method", ['lz4', 'zstd'])
+    def test_frames_carry_checksums(self, method):
+        """Test that a flipped byte in a zstd or lz4 block fails to decode instead of giving wrong data."""
+        module = pytest.importorskip('lz4.frame' if method == 'lz4' else 'zstandard')
+        data = os.urandom(4000)
+        out = KeepOpenBytesIO()
+        with encoders.ParallelCompressor(out, method, encoders.LEVELS[method][1], threads=2, block_size=1024) as writer:
+            writer.write(data)
+        corrupted = bytearray(out.getvalue())
+        corrupted[len(corrupted) // 2] ^= 0x01
+        # Read across all frames, as driveutility-write does
+        if method == 'lz4':
+            reader = module.open(io.BytesIO(bytes(corrupted)), 'rb')
+        else:
+            reader = module.ZstdDecompressor().stream_reader(io.BytesIO(bytes(corrupted)), read_across_frames=True)
+        with pytest.raises(Exception):
+            reader.read()
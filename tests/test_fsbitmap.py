@@ -0,0 +1,190 @@
+"""
+Tests for fsbitmap module.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import pytest
+
+import fsbitmap
+
+
+def write_at(path, offset, data):
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def sparse_file(temp_dir, size):
+    path = os.path.join(temp_dir, 'volume.img')
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    return path
+
+
+def masked_copy(path, ranges, size):
+    """Copies a volume keeping only the given ranges, as driveutility-read --allocated-only does."""
+    out = bytearray(size)
+    with open(path, 'rb') as f:
+        for start, end in ranges:
+            f.seek(start)
+            out[start:end] = f.read(end - start)
+    return bytes(out)
+
+
+class TestRuns:
+    """Tests for bit_runs and used_entry_runs functions."""
+
+    def test_bit_runs(self):
+        """Test full, empty and mixed bytes, least significant bit first."""
+        bitmap = b'\xff\xff\x00\x05\x80\x01\xff'
+        assert fsbitmap.bit_runs(bitmap, 56) == [[0, 16], [24, 25], [26, 27], [39, 41], [48, 56]]
+
+    def test_bit_runs_clipped_to_count(self):
+        """Test that bits past count are ignored."""
+        assert fsbitmap.bit_runs(b'\xff\xff', 12) == [[0, 12]]
+
+    def test_used_entry_runs(self):
+        """Test that zero entries split runs even when their bytes touch other zero bytes."""
+        table = struct.pack('<8I', 0x0FFFFFF8, 0x0FFFFFFF, 3, 0x0FFFFFFF, 0, 0, 0x100, 0)
+        assert fsbitmap.used_entry_runs(table, 4, 2, 6) == [[2, 4], [6, 7]]
+
+
+class TestFat:
+    """Tests for fat_ranges function."""
+
+    def test_fat32(self, temp_dir):
+        """Test a FAT32 volume with two files among free clusters."""
+        count = 70000
+        fat_sectors = -(-(count + 2) * 4 // 512)
+        reserved = 32
+        data_start = reserved + 2 * fat_sectors
+        total = data_start + count
+        path = sparse_file(temp_dir, total * 512)
+        boot = bytearray(512)
+        boot[0] = 0xEB
+        struct.pack_into('<HBHBHH', boot, 11, 512, 1, reserved, 2, 0, 0)
+        struct.pack_into('<II', boot, 32, total, fat_sectors)
+        boot[82:90] = b'FAT32   '
+        boot[510:512] = b'\x55\xaa'
+        write_at(path, 0, boot)
+        fat = bytearray((count + 2) * 4)
+        for cluster in (2, 3, 4, 1000, 1001):
+            struct.pack_into('<I', fat, cluster * 4, 0x0FFFFFFF)
+        write_at(path, reserved * 512, fat)
+
+        with open(path, 'rb') as f:
+            ranges = fsbitmap.allocated_ranges(f, 0, total * 512)
+        heap = data_start * 512
+        assert ranges == [(0, heap + 3 * 512), (heap + 998 * 512, heap + 1000 * 512)]
+
+    def test_not_fat(self, temp_dir):
+        """Test that a blank volume is not recognized."""
+        path = sparse_file(temp_dir, 1048576)
+        with open(path, 'rb') as f:
+            assert fsbitmap.fat_ranges(f, 0) is None
+
+
+class TestExfat:
+    """Tests for exfat_ranges function."""
+
+    def test_allocation_bitmap(self, temp_dir):
+        """Test that clusters come from the allocation bitmap found in the root directory."""
+        path = sparse_file(temp_dir, 70000)
+        boot = bytearray(512)
+        boot[3:11] = b'EXFAT   '
+        struct.pack_into('<IIIII', boot, 80, 24, 8, 32, 100, 4)
+        boot[108], boot[109] = 9, 0
+        write_at(path, 0, boot)
+        fat = bytearray(102 * 4)
+        struct.pack_into('<I', fat, 2 * 4, 0xFFFFFFFF)
+        struct.pack_into('<I', fat, 4 * 4, 0xFFFFFFFF)
+        write_at(path, 24 * 512, fat)
+        heap = 32 * 512
+        bitmap = bytearray(13)
+        bitmap[0] = 0b101
+        bitmap[1] = 0b11
+        write_at(path, heap, bitmap)
+        root = bytearray(64)
+        root[0] = fsbitmap.EXFAT_ENTRY_BITMAP
+        struct.pack_into('<IQ', root, 20, 2, 13)
+        write_at(path, heap + 2 * 512, root)
+
+        with open(path, 'rb') as f:
+            ranges = fsbitmap.allocated_ranges(f, 0, 70000)
+        assert ranges == [(0, heap + 512), (heap + 1024, heap + 1536),
+                          (heap + 8 * 512, heap + 10 * 512), (heap + 100 * 512, 70000)]
+
+
+class TestNtfs:
+    """Tests for ntfs_ranges and ntfs_runlist functions."""
+
+    def test_runlist(self):
+        """Test relative offsets, negative offsets and sparse runs."""
+        data = bytes([0x21, 0x10, 0x00, 0x01, 0x11, 0x05, 0xF0, 0x01, 0x03, 0x00])
+        assert fsbitmap.ntfs_runlist(data) == [(256, 16), (240, 5), (None, 3)]
+
+    def test_bitmap_file(self, temp_dir):
+        """Test that clusters come from the non-resident $Bitmap of MFT record 6."""
+        cluster = 4096
+        path = sparse_file(temp_dir, 64 * cluster + 512)
+        boot = bytearray(512)
+        boot[3:11] = b'NTFS    '
+        struct.pack_into('<HB', boot, 11, 512, 8)
+        struct.pack_into('<QQ', boot, 40, 64 * 8, 4)
+        struct.pack_into('<b', boot, 64, -10)
+        write_at(path, 0, boot)
+
+        record = bytearray(1024)
+        record[0:4] = b'FILE'
+        struct.pack_into('<HH', record, 4, 48, 3)
+        struct.pack_into('<H', record, 20, 56)
+        struct.pack_into('<IIB', record, 56, fsbitmap.NTFS_ATTR_DATA, 80, 1)
+        struct.pack_into('<H', record, 56 + 32, 64)
+        struct.pack_into('<Q', record, 56 + 48, 8)
+        record[56 + 64:56 + 67] = bytes([0x11, 0x01, 20])
+        struct.pack_into('<I', record, 136, fsbitmap.NTFS_ATTR_END)
+        # Update sequence number 7, the real sector ends are stored in the array
+        struct.pack_into('<HHH', record, 48, 7, 0, 0)
+        record[510:512] = record[1022:1024] = struct.pack('<H', 7)
+        write_at(path, 4 * cluster + 6 * 1024, record)
+        write_at(path, 20 * cluster, bytes([0xFF, 0x00, 0x0F, 0x00, 0x00, 0x00, 0x00, 0x80]))
+
+        with open(path, 'rb') as f:
+            ranges = fsbitmap.allocated_ranges(f, 0, 64 * cluster + 512)
+        assert ranges == [(0, 8 * cluster), (16 * cluster, 20 * cluster), (63 * cluster, 64 * cluster + 512)]
+
+
+@pytest.mark.skipif(not shutil.which('mkfs.ext4') or not shutil.which('debugfs'), reason="e2fsprogs not installed")
+class TestExt4:
+    """Tests for ext4_ranges function."""
+
+    @pytest.mark.parametrize("size,options", [
+        (64 * 1048576, []),
+        (64 * 1048576, ['-O', 'bigalloc', '-C', '16384']),
+        (256 * 1048576, ['-O', 'bigalloc', '-C', '65536']),
+    ])
+    def test_file_survives_masking(self, temp_dir, size, options):
+        """Test that a file can be read back from an image holding only the allocated ranges, also with bigalloc clusters."""
+        path = sparse_file(temp_dir, size)
+        content = os.urandom(3000000)
+        source = os.path.join(temp_dir, 'file.bin')
+        with open(source, 'wb') as f:
+            f.write(content)
+        subprocess.run(['mkfs.ext4', '-q', '-F'] + options + [path], check=True, stderr=subprocess.DEVNULL)
+        subprocess.run(['debugfs', '-w', '-R', f'write {source} file.bin', path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        with open(path, 'rb') as f:
+            ranges = fsbitmap.allocated_ranges(f, 0, size)
+        assert sum(end - start for start, end in ranges) < size // 4
+        masked = os.path.join(temp_dir, 'masked.img')
+        with open(masked, 'wb') as f:
+            f.write(masked_copy(path, ranges, size))
+        dumped = os.path.join(temp_dir, 'dumped.bin')
+        subprocess.run(['debugfs', '-R', f'dump file.bin {dumped}', masked],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(dumped, 'rb') as f:
+            assert f.read() == content
+        subprocess.run(['e2fsck', '-fn', masked], check=True, stdout=subprocess.DEVNULL)
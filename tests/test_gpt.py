@@ -0,0 +1,78 @@
+"""
+Tests for gpt module.
+"""
+import struct
+import zlib
+import pytest
+
+import gpt
+
+
+SECTOR = 512
+
+
+def make_gpt(last_lba, partition_last):
+    """Builds a primary header sector and a 128-entry array with one partition."""
+    entries = bytearray(128 * 128)
+    entries[0:16] = b'\x01' * 16
+    struct.pack_into('<QQ', entries, 32, 2048, partition_last)
+    header = bytearray(SECTOR)
+    struct.pack_into('<8sII', header, 0, gpt.GPT_SIGNATURE, 0x10000, 92)
+    struct.pack_into('<QQQQ', header, 24, 1, last_lba, 34, last_lba - 33)
+    struct.pack_into('<QIII', header, 72, 2, 128, 128, zlib.crc32(entries))
+    struct.pack_into('<I', header, 16, zlib.crc32(bytes(header[:92])))
+    return bytes(header), bytes(entries)
+
+
+def field(header, fmt, offset):
+    return struct.unpack_from(fmt, header, offset)[0]
+
+
+def header_crc_ok(header):
+    size = field(header, '<I', 12)
+    zeroed = header[:16] + bytes(4) + header[20:size]
+    return zlib.crc32(zeroed) == field(header, '<I', 16)
+
+
+class TestRelocate:
+    """Tests for relocate function."""
+
+    def test_moves_backup_to_new_end(self):
+        """Test that headers point at the new last sector and keep valid checksums."""
+        header, entries = make_gpt(last_lba=1000000, partition_last=8191)
+        primary, backup_lba, backup = gpt.relocate(header, entries, 8300, SECTOR)
+        assert backup_lba == 8300 - 32
+        assert len(backup) == 33 * SECTOR
+        assert backup[:len(entries)] == entries
+        backup_header = backup[-SECTOR:]
+        assert field(primary, '<Q', 24) == 1
+        assert field(primary, '<Q', 32) == 8300
+        assert field(primary, '<Q', 48) == 8300 - 33
+        assert field(primary, '<Q', 72) == 2
+        assert field(backup_header, '<Q', 24) == 8300
+        assert field(backup_header, '<Q', 32) == 1
+        assert field(backup_header, '<Q', 72) == backup_lba
+        assert header_crc_ok(primary)
+        assert header_crc_ok(backup_header)
+
+    def test_backup_length(self):
+        """Test the space needed for the backup table."""
+        header, _ = make_gpt(last_lba=1000000, partition_last=8191)
+        assert gpt.backup_length(header, SECTOR) == 33 * SECTOR
+
+    def test_partition_past_new_end_is_rejected(self):
+        """Test that a table cannot be moved in front of a partition."""
+        header, entries = make_gpt(last_lba=1000000, partition_last=8191)
+        with pytest.raises(ValueError):
+            gpt.relocate(header, entries, 8200, SECTOR)
+
+    def test_corrupt_entries_are_rejected(self):
+        """Test that entries not matching the header checksum are refused."""
+        header, entries = make_gpt(last_lba=1000000, partition_last=8191)
+        with pytest.raises(ValueError):
+            gpt.relocate(header, b'\x02' + entries[1:], 9000, SECTOR)
+
+    def test_not_a_gpt(self):
+        """Test that a sector without the GPT signature is refused."""
+        with pytest.raises(ValueError):
+            gpt.relocate(bytes(SECTOR), bytes(128 * 128), 9000, SECTOR)
@@ -0,0 +1,60 @@
+"""
+Tests for keystream module.
+"""
+import pytest
+
+import keystream
+
+ALGORITHMS = ['shake256']
+if keystream.CRYPTOGRAPHY_AVAILABLE:
+    ALGORITHMS += ['aes-ctr', 'chacha20']
+
+SEED = bytes(range(32))
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+class TestKeystream:
+    """Tests for Keystream class."""
+
+    def test_random_access(self, algorithm):
+        """Test that any part of the stream, across chunks and at odd offsets, matches a sequential read."""
+        length = 2 * keystream.CHUNK_SIZE + 1000
+        with keystream.Keystream(SEED, algorithm, workers=3) as stream:
+            whole = stream.read(0, length)
+            for offset, n in [(0, 10), (17, 100), (keystream.CHUNK_SIZE - 5, 10), (1000, 2 * keystream.CHUNK_SIZE)]:
+                assert stream.read(offset, n) == whole[offset:offset + n]
+        assert len(whole) == length
+
+    def test_replay(self, algorithm):
+        """Test that the same seed replays the stream and another seed does not."""
+        with keystream.Keystream(SEED, algorithm) as first, keystream.Keystream(SEED, algorithm) as second:
+            expected = first.read(4096, 8192)
+            assert second.read(4096, 8192) == expected
+        with keystream.Keystream(algorithm=algorithm) as fresh:
+            assert len(fresh.seed) == keystream.SEED_SIZE
+            assert fresh.read(4096, 8192) != expected
+
+    def test_reader(self, algorithm):
+        """Test that the reader continues where the previous read stopped."""
+        with keystream.Keystream(SEED, algorithm) as stream:
+            reader = stream.reader(100)
+            buf = bytearray(5000)
+            assert reader.readinto(buf) == 5000
+            assert reader.read(300) == stream.read(5100, 300)
+            assert bytes(buf) == stream.read(100, 5000)
+
+
+class TestAlgorithms:
+    """Tests for algorithm selection."""
+
+    def test_unknown_algorithm(self):
+        """Test that unknown algorithms are rejected."""
+        with pytest.raises(ValueError):
+            keystream.Keystream(SEED, 'rot13')
+
+    def test_default_without_cryptography(self, monkeypatch):
+        """Test that SHAKE-256 is used when cryptography is missing."""
+        monkeypatch.setattr(keystream, 'CRYPTOGRAPHY_AVAILABLE', False)
+        assert keystream.default_algorithm() == 'shake256'
+        with pytest.raises(ValueError):
+            keystream.Keystream(SEED, 'aes-ctr')
@@ -0,0 +1,142 @@
+"""
+Tests for pipeline module.
+"""
+import io
+import pytest
+
+import pipeline
+
+
+class ShortReader(io.RawIOBase):
+    """Stream that returns at most 3 bytes per read, like a slow decompressor."""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self.data.read(min(3, len(b)))
+        b[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class FailingReader(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        raise IOError("corrupt stream")
+
+
+class TestReadintoFull:
+    """Tests for readinto_full function."""
+
+    def test_fills_buffer_across_short_reads(self):
+        """Test that short reads are looped until the buffer is full."""
+        buf = bytearray(10)
+        n = pipeline.readinto_full(ShortReader(b'0123456789abc'), buf)
+        assert n == 10
+        assert bytes(buf) == b'0123456789'
+
+    def test_falls_back_to_read(self):
+        """Test streams without readinto."""
+        class ReadOnly:
+            def __init__(self):
+                self.data = io.BytesIO(b'abcdef')
+
+            def read(self, n):
+                return self.data.read(n)
+
+        buf = bytearray(8)
+        assert pipeline.readinto_full(ReadOnly(), buf) == 6
+        assert bytes(buf[:6]) == b'abcdef'
+
+
+class TestPipeline:
+    """Tests for Pipeline class."""
+
+    def test_preserves_order_and_content(self):
+        """Test that chunks come out in order and reassemble the input."""
+        data = bytes(range(256)) * 100
+        with pipeline.Pipeline(ShortReader(data), 1000, depth=2) as p:
+            out = b''.join(bytes(chunk) for chunk in p)
+        assert out == data
+
+    def test_empty_stream(self):
+        """Test that an empty stream yields nothing."""
+        with pipeline.Pipeline(io.BytesIO(b''), 16) as p:
+            assert list(p) == []
+
+    def test_reader_error_is_raised_in_consumer(self):
+        """Test that exceptions on the reader thread surface in the consumer."""
+        with pipeline.Pipeline(FailingReader(), 16) as p:
+            with pytest.raises(IOError):
+                for _ in p:
+                    pass
+
+    def test_length_limits_reading(self):
+        """Test that only length bytes are read from a longer stream."""
+        with pipeline.Pipeline(io.BytesIO(b'x' * 1000), 64, length=300) as p:
+            assert sum(len(chunk) for chunk in p) == 300
+
+    def test_close_while_reader_is_blocked(self):
+        """Test that closing early does not hang on a full ring."""
+        p = pipeline.Pipeline(io.BytesIO(b'x' * 1000), 10, depth=2)
+        for _ in p:
+            break
+        p.close()
+
+
+class Collector:
+    """Consumer that keeps a copy of every item, optionally failing on one of them."""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.data = []
+        self.result = 'unset'
+
+    def start(self):
+        pass
+
+    def consume(self, item):
+        if len(self.data) == self.fail_at:
+            raise IOError("device went away")
+        self.data.append(bytes(item))
+
+    def finish(self, result):
+        self.result = result
+
+
+class TestFanOut:
+    """Tests for FanOut class."""
+
+    def test_every_consumer_gets_every_chunk(self):
+        """Test that all consumers see the whole stream in order, decoded once."""
+        data = bytes(range(256)) * 100
+        consumers = [Collector() for _ in range(3)]
+        with pipeline.Pipeline(ShortReader(data), 1000, depth=2) as p:
+            fanout = pipeline.FanOut(p, consumers)
+            for buf, chunk in p.chunks():
+                fanout.submit(buf, chunk)
+            fanout.close('done')
+        for consumer in consumers:
+            assert b''.join(consumer.data) == data
+            assert consumer.result == 'done'
+        assert fanout.errors == {}
+
+    def test_failing_consumer_is_isolated(self):
+        """Test that one failing consumer does not stall or abort the others."""
+        data = b'x' * 10000
+        good, bad = Collector(), Collector(fail_at=2)
+        with pipeline.Pipeline(io.BytesIO(data), 100, depth=2) as p:
+            fanout = pipeline.FanOut(p, [good, bad])
+            for buf, chunk in p.chunks():
+                fanout.submit(buf, chunk)
+            fanout.close('done')
+        assert b''.join(good.data) == data
+        assert good.result == 'done'
+        assert len(bad.data) == 2
+        assert bad.result is None
+        assert list(fanout.errors) == [bad]
@@ -0,0 +1,109 @@
+"""
+Tests for progress module.
+"""
+import json
+import os
+
+import progress
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressEmitter:
+    """Tests for ProgressEmitter class."""
+
+    def test_only_prints_percent_changes(self, capsys):
+        """Test that many updates within the same percent print one line."""
+        clock = FakeClock()
+        emitter = progress.ProgressEmitter(clock=clock)
+        for i in range(1000):
+            clock.now += 1
+            emitter.update(i / 100000)
+        assert capsys.readouterr().out.split() == ['0.0']
+
+    def test_rate_limited(self, capsys):
+        """Test that fast percent changes are printed at most once per interval."""
+        clock = FakeClock()
+        emitter = progress.ProgressEmitter(interval=0.2, clock=clock)
+        for i in range(100):
+            clock.now += 0.01
+            emitter.update(i / 100)
+        lines = capsys.readouterr().out.split()
+        assert 4 <= len(lines) <= 6
+        assert lines[0] == '0.0'
+
+    def test_force_and_reset(self, capsys):
+        """Test that forced updates always print and reset allows 0.0 again."""
+        clock = FakeClock()
+        emitter = progress.ProgressEmitter(prefix='/dev/sdx ', clock=clock)
+        emitter.update(0.5)
+        emitter.update(1.0, force=True)
+        emitter.reset()
+        emitter.update(0.0)
+        assert capsys.readouterr().out.splitlines() == ['/dev/sdx 0.5', '/dev/sdx 1.0', '/dev/sdx 0.0']
+
+
+class TestChannel:
+    """Tests for the JSON progress channel."""
+
+    def test_records(self, temp_dir, capsys):
+        """Test phase, progress and status records with rates and ETA."""
+        path = os.path.join(temp_dir, 'progress.jsonl')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+        try:
+            progress.open_channel(fd)
+            clock = FakeClock()
+            emitter = progress.ProgressEmitter(clock=clock, target='/dev/sdx')
+            emitter.set_phase("write", 1000, 1, 2)
+            clock.now = 1.0
+            emitter.update(0.25, 250)
+            clock.now = 2.0
+            emitter.update(0.5, 500)
+            progress.status("success", '/dev/sdx')
+        finally:
+            progress._channel = None
+            os.close(fd)
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        assert [r['type'] for r in records] == ['phase', 'progress', 'progress', 'status']
+        assert all(r['v'] == progress.PROTOCOL_VERSION for r in records)
+        assert records[0]['phase'] == 'write' and records[0]['pass'] == 1 and records[0]['passes'] == 2
+        assert records[2]['done'] == 500 and records[2]['total'] == 1000
+        assert records[2]['rate'] == 250
+        assert records[2]['average_rate'] == 250
+        assert records[2]['eta'] == 2.0
+        assert records[3]['status'] == 'success'
+        assert capsys.readouterr().out.split() == ['0.25', '0.5']
+
+    def test_pass_without_restart(self, temp_dir, capsys):
+        """Test that a pass which does not restart keeps the fraction and ETA but starts its rates over."""
+        path = os.path.join(temp_dir, 'progress.jsonl')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+        try:
+            progress.open_channel(fd)
+            clock = FakeClock()
+            emitter = progress.ProgressEmitter(clock=clock)
+            emitter.set_phase("write", 1000, 1, 2)
+            clock.now = 1.0
+            emitter.update(0.5, 1000)
+            emitter.set_phase("write", 1000, 2, 2, restart=False)
+            emitter.update(0.5, 0)
+            clock.now = 2.0
+            emitter.update(0.75, 500)
+        finally:
+            progress._channel = None
+            os.close(fd)
+        with open(path) as f:
+            records = [json.loads(line) for line in f if json.loads(line)['type'] == 'progress']
+        assert records[-1]['pass'] == 2
+        assert records[-1]['rate'] == 500
+        assert records[-1]['average_rate'] == 500
+        assert abs(records[-1]['eta'] - 2 / 3) < 1e-9
+        # 50% was already printed during the first pass
+        assert capsys.readouterr().out.split() == ['0.5', '0.75']
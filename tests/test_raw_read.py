@@ -0,0 +1,100 @@
+"""
+Tests for raw_read module.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+import pytest
+
+pytest.importorskip('parted')
+import raw_read
+import gpt
+
+MIB = 1024 ** 2
+SECTOR = 512
+
+
+def make_gpt_disk(path, last_lba, partition_first, partition_last):
+    """Writes a disk file with a protective MBR, a GPT with one partition and its backup at the end."""
+    entries = bytearray(128 * 128)
+    entries[0:16] = b'\x01' * 16
+    struct.pack_into('<QQ', entries, 32, partition_first, partition_last)
+    header = bytearray(SECTOR)
+    struct.pack_into('<8sII', header, 0, gpt.GPT_SIGNATURE, 0x10000, 92)
+    struct.pack_into('<QQQQ', header, 24, 1, last_lba, 34, last_lba - 33)
+    struct.pack_into('<QIII', header, 72, 2, 128, 128, zlib.crc32(entries))
+    primary, backup_lba, backup = gpt.relocate(bytes(header), bytes(entries), last_lba, SECTOR)
+
+    mbr = bytearray(SECTOR)
+    struct.pack_into('<B3sB3sII', mbr, 446, 0, b'\x00\x02\x00', 0xee, b'\xff\xff\xff', 1, min(last_lba, 0xffffffff))
+    mbr[510:512] = b'\x55\xaa'
+    data = os.urandom((partition_last - partition_first + 1) * SECTOR)
+    with open(path, 'wb') as f:
+        f.truncate((last_lba + 1) * SECTOR)
+        f.write(mbr + primary + entries)
+        f.seek(partition_first * SECTOR)
+        f.write(data)
+        f.seek(backup_lba * SECTOR)
+        f.write(backup)
+    return bytes(entries), data
+
+
+def field(header, fmt, offset):
+    return struct.unpack_from(fmt, header, offset)[0]
+
+
+def header_crc_ok(header):
+    size = field(header, '<I', 12)
+    return zlib.crc32(header[:16] + bytes(4) + header[20:size]) == field(header, '<I', 16)
+
+
+def image_used_extent(temp_dir):
+    """Images a 32 MiB GPT disk whose only partition ends at 2 MiB, returning the image path, entries and data."""
+    source = os.path.join(temp_dir, 'disk')
+    entries, data = make_gpt_disk(source, last_lba=32 * MIB // SECTOR - 1, partition_first=2048, partition_last=4095)
+    target = os.path.join(temp_dir, 'image')
+    with pytest.raises(SystemExit) as exit_info:
+        raw_read.raw_read(source, target, None, -1, -1, used_extent_only=True)
+    assert exit_info.value.code == 0
+    return target, entries, data
+
+
+class TestUsedExtent:
+    """Tests for imaging a device up to the end of its last partition."""
+
+    def test_gpt_is_relocated(self, temp_dir, capsys):
+        """Test that the image ends with a backup GPT and the primary header points at it."""
+        target, entries, data = image_used_extent(temp_dir)
+        assert capsys.readouterr().out.split()[-1] == '1.0'
+
+        with open(target, 'rb') as f:
+            image = f.read()
+        last_lba = 4096 + 32
+        assert len(image) == (last_lba + 1) * SECTOR
+        assert image[2048 * SECTOR:4096 * SECTOR] == data
+
+        primary = image[SECTOR:2 * SECTOR]
+        assert header_crc_ok(primary)
+        assert field(primary, '<Q', 24) == 1
+        assert field(primary, '<Q', 32) == last_lba
+        assert field(primary, '<Q', 48) == last_lba - 33
+        assert image[2 * SECTOR:2 * SECTOR + len(entries)] == entries
+
+        backup = image[-SECTOR:]
+        assert header_crc_ok(backup)
+        assert field(backup, '<Q', 24) == last_lba
+        assert field(backup, '<Q', 32) == 1
+        backup_entries_lba = field(backup, '<Q', 72)
+        assert backup_entries_lba == last_lba - 32
+        backup_entries = image[backup_entries_lba * SECTOR:backup_entries_lba * SECTOR + len(entries)]
+        assert backup_entries == entries
+        assert zlib.crc32(backup_entries) == field(backup, '<I', 88)
+
+    @pytest.mark.skipif(shutil.which('sgdisk') is None, reason="sgdisk not installed")
+    def test_sgdisk_accepts_image(self, temp_dir, capsys):
+        """Test that sgdisk finds no problem with the relocated GPT."""
+        target, _, _ = image_used_extent(temp_dir)
+        output = subprocess.run(['sgdisk', '-v', target], stdout=subprocess.PIPE, universal_newlines=True).stdout
+        assert 'No problems found' in output
@@ -0,0 +1,383 @@
+"""
+Tests for raw_wipe module.
+"""
+import errno
+import functools
+import json
+import os
+import pytest
+from unittest.mock import patch
+
+import raw_wipe
+from checkpoint import Checkpoint
+from keystream import Keystream
+
+MIB = 1024 ** 2
+
+
+def make_file(temp_dir, size, fill=b'\xff'):
+    path = os.path.join(temp_dir, 'device.img')
+    with open(path, 'wb') as f:
+        f.write(fill * size)
+    return path
+
+
+class TestParseSize:
+    """Tests for parse_size function."""
+
+    def test_suffixes(self):
+        """Test plain numbers and dd suffixes."""
+        assert raw_wipe.parse_size('4096') == 4096
+        assert raw_wipe.parse_size('64K') == 64 * 1024
+        assert raw_wipe.parse_size('1M') == MIB
+        assert raw_wipe.parse_size('1MB') == 1000 ** 2
+
+    def test_invalid(self):
+        """Test that unknown suffixes and garbage are rejected."""
+        assert raw_wipe.parse_size('1X') is None
+        assert raw_wipe.parse_size('M') is None
+        assert raw_wipe.parse_size('-1') is None
+
+
+class TestWipePass:
+    """Tests for wipe_pass function."""
+
+    def test_zero_pass(self, temp_dir):
+        """Test that a zero pass overwrites exactly length bytes and reports progress per block."""
+        path = make_file(temp_dir, 3 * 4096 + 512)
+        reported = []
+        done = raw_wipe.wipe_pass(path, 3 * 4096 + 512, 4096, 512, on_progress=reported.append)
+        assert done == 3 * 4096 + 512
+        assert reported == [4096, 8192, 12288, 12800]
+        with open(path, 'rb') as f:
+            assert f.read() == bytes(3 * 4096 + 512)
+
+    def test_random_pass_stops_at_length(self, temp_dir):
+        """Test that a random pass writes length bytes and leaves the rest alone."""
+        path = make_file(temp_dir, 64 * 1024)
+        with Keystream(algorithm='shake256') as keystream:
+            done = raw_wipe.wipe_pass(path, 40 * 1024, 16 * 1024, 512, stream=keystream.reader())
+            expected = keystream.read(0, 40 * 1024)
+        assert done == 40 * 1024
+        with open(path, 'rb') as f:
+            data = f.read()
+        assert len(data) == 64 * 1024
+        assert data[:40 * 1024] == expected
+        assert data[40 * 1024:] == b'\xff' * 24 * 1024
+
+
+class TestOffloadPass:
+    """Tests for offload_pass function."""
+
+    def test_requests_in_chunks(self, temp_dir):
+        """Test that whole logical blocks are wiped with one request per chunk."""
+        path = make_file(temp_dir, 4096)
+        reported = []
+        with patch.object(raw_wipe, 'OFFLOAD_CHUNK', 1024):
+            with patch.object(raw_wipe, 'block_range_ioctl') as mock_ioctl:
+                done = raw_wipe.offload_pass(path, 3000, 'zeroout', 512, reported.append)
+        assert done == 2560
+        assert [c[0][1:] for c in mock_ioctl.call_args_list] == [
+            (raw_wipe.BLKZEROOUT, 0, 1024), (raw_wipe.BLKZEROOUT, 1024, 1024), (raw_wipe.BLKZEROOUT, 2048, 512)]
+        assert reported == [1024, 2048, 2560]
+
+    def test_stops_when_unsupported(self, temp_dir):
+        """Test that a request the device refuses ends the pass early."""
+        path = make_file(temp_dir, 4096)
+        refused = [None, OSError(errno.EOPNOTSUPP, "Operation not supported")]
+        with patch.object(raw_wipe, 'OFFLOAD_CHUNK', 1024):
+            with patch.object(raw_wipe, 'block_range_ioctl', side_effect=refused):
+                assert raw_wipe.offload_pass(path, 4096, 'secure-discard', 512) == 1024
+
+    def test_propagates_io_errors(self, temp_dir):
+        """Test that real errors are not mistaken for missing support."""
+        path = make_file(temp_dir, 4096)
+        with patch.object(raw_wipe, 'block_range_ioctl', side_effect=OSError(errno.EIO, "I/O error")):
+            with pytest.raises(OSError):
+                raw_wipe.offload_pass(path, 4096, 'discard', 512)
+
+
+class TestRawWipe:
+    """Tests for raw_wipe function."""
+
+    def test_random_with_final_zero(self, temp_dir, capsys):
+        """Test that all passes run, the last zeroes the device and progress spans the passes."""
+        path = make_file(temp_dir, 2 * MIB)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'wipe_pass', wraps=raw_wipe.wipe_pass) as mock_pass:
+                raw_wipe.raw_wipe(path, 2, 'random', True, None, 256 * 1024)
+        streams = [call[0][4] for call in mock_pass.call_args_list]
+        assert len(streams) == 3
+        assert streams[2] is None and all(streams[:2])
+        with open(path, 'rb') as f:
+            assert f.read() == bytes(2 * MIB)
+        fractions = [float(line) for line in capsys.readouterr().out.split()]
+        assert fractions == sorted(fractions)
+        assert fractions[-1] == 1.0
+
+    def test_size_limit(self, temp_dir, capsys):
+        """Test that --size limits the wipe to the first megabytes."""
+        path = make_file(temp_dir, 3 * MIB)
+        with patch.object(raw_wipe, 'do_umount'):
+            raw_wipe.raw_wipe(path, 1, 'zero', False, 1, MIB)
+        with open(path, 'rb') as f:
+            data = f.read()
+        assert data[:MIB] == bytes(MIB)
+        assert data[MIB:] == b'\xff' * 2 * MIB
+
+    def test_block_size_rounded_to_sectors(self, temp_dir, capsys):
+        """Test that odd block sizes are rounded up to whole logical blocks."""
+        path = make_file(temp_dir, 8192)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'wipe_pass') as mock_pass:
+                raw_wipe.raw_wipe(path, 1, 'zero', False, None, 1000)
+        assert mock_pass.call_args[0][2] == 1024
+
+    def test_offload_falls_back_to_zeros(self, temp_dir, capsys):
+        """Test that what the device does not wipe itself is overwritten with zeros."""
+        path = make_file(temp_dir, 8192)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'offload_supported', return_value=True):
+                with patch.object(raw_wipe, 'offload_pass', return_value=4096):
+                    raw_wipe.raw_wipe(path, 1, 'discard', False, None, MIB)
+        with open(path, 'rb') as f:
+            data = f.read()
+        # The first half was left to the (mocked) device
+        assert data == b'\xff' * 4096 + bytes(4096)
+
+    def test_offload_unsupported(self, temp_dir, capsys):
+        """Test that a device without the queue limit is zeroed in software."""
+        path = make_file(temp_dir, 8192)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'offload_pass') as mock_offload:
+                raw_wipe.raw_wipe(path, 1, 'zeroout', False, None, MIB)
+        assert not mock_offload.called
+        with open(path, 'rb') as f:
+            assert f.read() == bytes(8192)
+
+
+class TestSampleRanges:
+    """Tests for sample_ranges function."""
+
+    def test_spread_and_aligned(self):
+        """Test that one aligned sample falls in each stretch of the device."""
+        ranges = raw_wipe.sample_ranges(100 * MIB, 10, 64 * 1024, 4096)
+        assert len(ranges) == 10
+        for i, (start, end) in enumerate(ranges):
+            assert start % 4096 == 0
+            assert end - start == 64 * 1024
+            assert 10 * MIB * i - 4096 < start < 10 * MIB * (i + 1)
+        assert ranges == sorted(ranges)
+        assert all(a[1] <= b[0] for a, b in zip(ranges, ranges[1:]))
+
+    def test_covering_samples_read_everything(self):
+        """Test that samples larger than the device become a full read."""
+        assert raw_wipe.sample_ranges(MIB, 100, 64 * 1024, 512) == [(0, MIB)]
+
+
+class TestVerify:
+    """Tests for verification of wipes."""
+
+    def test_verify_zeros(self, temp_dir):
+        """Test that blocks that are not zero are reported by offset."""
+        path = make_file(temp_dir, 3 * MIB, fill=b'\0')
+        with open(path, 'r+b') as f:
+            f.seek(MIB + 10)
+            f.write(b'x')
+        assert raw_wipe.verify_wipe(path, [(0, 3 * MIB)], 512) == [MIB]
+        assert raw_wipe.verify_wipe(path, [(0, 4096), (2 * MIB, 2 * MIB + 4096)], 512) == []
+
+    def test_random_wipe_verified_from_seed(self, temp_dir, capsys):
+        """Test that a random wipe is verified against its regenerated keystream and reported."""
+        path = make_file(temp_dir, 2 * MIB)
+        report = {}
+        with patch.object(raw_wipe, 'do_umount'):
+            status = raw_wipe.raw_wipe(path, 1, 'random', False, None, MIB, verify='sample', samples=8, report=report)
+        assert status == "success"
+        assert 'verifying' in capsys.readouterr().out.split()
+        # The report is written as JSON
+        report = json.loads(json.dumps(report))
+        assert report['status'] == 'success'
+        assert report['passes'][0]['pattern'] == 'random' and report['passes'][0]['seed']
+        assert report['verification']['result'] == 'passed'
+        assert report['verification']['ranges'] == 8
+
+    def test_mismatch(self, temp_dir, capsys):
+        """Test that data which does not match the last pass is a mismatch."""
+        path = make_file(temp_dir, MIB)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'wipe_pass'):
+                status = raw_wipe.raw_wipe(path, 1, 'zero', False, None, MIB, verify='full')
+        assert status == "mismatch"
+
+    def test_discard_not_verified(self, temp_dir, capsys):
+        """Test that discard wipes skip verification."""
+        path = make_file(temp_dir, 8192)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'verify_wipe') as mock_verify:
+                assert raw_wipe.raw_wipe(path, 1, 'discard', False, None, MIB, verify='full') == "success"
+        assert not mock_verify.called
+
+
+class TestWipeDevices:
+    """Tests for wiping several devices at once."""
+
+    def test_parallel_wipe(self, temp_dir, capsys):
+        """Test that every device is wiped, with progress lines prefixed by the device."""
+        paths = []
+        for name in ('a', 'b', 'c'):
+            path = os.path.join(temp_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'\xff' * MIB)
+            paths.append(path)
+        with patch.object(raw_wipe, 'do_umount'):
+            statuses, reports = raw_wipe.wipe_devices(paths, rate=64 * MIB, threads=2, passes=1, wipe_type='random',
+                                                      final_zero=True, size_mb=None, block_size=256 * 1024, verify='full')
+        assert list(statuses) == paths
+        assert set(statuses.values()) == {"success"}
+        assert all(reports[path]['verification']['result'] == 'passed' for path in paths)
+        for path in paths:
+            with open(path, 'rb') as f:
+                assert f.read() == bytes(MIB)
+        lines = capsys.readouterr().out.split('\n')
+        for path in paths:
+            assert f"{path} 1.0" in lines
+        assert all(line.split(' ')[0] in paths for line in lines if line)
+
+    def test_failure_is_isolated(self, temp_dir, capsys):
+        """Test that one failing device does not stop the others."""
+        good = make_file(temp_dir, 8192)
+        missing = os.path.join(temp_dir, 'missing')
+        with patch.object(raw_wipe, 'do_umount'):
+            statuses, reports = raw_wipe.wipe_devices([missing, good], passes=1, wipe_type='zero',
+                                                      final_zero=False, size_mb=None, block_size=MIB)
+        assert statuses == {missing: "failed", good: "success"}
+        assert reports[missing]['status'] == "failed"
+
+    def test_exit_with_status(self, capsys):
+        """Test the summary lines and the exit status."""
+        with pytest.raises(SystemExit) as e:
+            raw_wipe.exit_with_status({'/dev/sdx': "success", '/dev/sdy': "mismatch"})
+        assert e.value.code == 5
+        assert capsys.readouterr().out.split('\n')[1:3] == ['/dev/sdx success', '/dev/sdy mismatch']
+        with pytest.raises(SystemExit) as e:
+            raw_wipe.exit_with_status({'/dev/sdx': "failed", '/dev/sdy': "mismatch"})
+        assert e.value.code == 1
+        with pytest.raises(SystemExit) as e:
+            raw_wipe.exit_with_status({'/dev/sdx': "success"})
+        assert e.value.code == 0
+
+
+class TestSequence:
+    """Tests for pass sequences."""
+
+    def test_parse_sequence(self):
+        """Test hex patterns, wipe types and presets."""
+        assert raw_wipe.parse_sequence('0x00,0xFF,random,0x55AA') == ['0x00', '0xff', 'random', '0x55aa']
+        assert raw_wipe.parse_sequence('zero, random') == ['zero', 'random']
+        assert raw_wipe.parse_sequence('DoD') == ['0x00', '0xff', 'random']
+        assert len(raw_wipe.parse_sequence('dod7')) == 7
+        assert raw_wipe.parse_sequence('0x0') is None
+        assert raw_wipe.parse_sequence('0xZZ') is None
+        assert raw_wipe.parse_sequence('0x00,,0xff') is None
+
+    def test_pattern_buffer(self):
+        """Test that pattern buffers hold whole repeats of the pattern."""
+        buf = raw_wipe.pattern_buffer(b'\x55\xaa\x01', 3 * 512)
+        assert len(buf) == 3 * 512
+        assert buf[:] == b'\x55\xaa\x01' * 512
+
+    def test_sequence_wipe(self, temp_dir, capsys):
+        """Test that every pass of a sequence runs and the last pattern tiles the device."""
+        path = make_file(temp_dir, MIB + 512)
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'wipe_pass', wraps=raw_wipe.wipe_pass) as mock_pass:
+                status = raw_wipe.raw_wipe(path, 1, 'zero', False, None, 64 * 1024, verify='full',
+                                           sequence=['0xff', 'random', '0x0a0b0c'])
+        assert status == "success"
+        assert mock_pass.call_count == 3
+        # Blocks of the three-byte pattern hold whole repeats, aligned to the logical block size
+        size = len(mock_pass.call_args[1]['pattern'])
+        assert size >= 64 * 1024 and size % 3 == 0 and size % 512 == 0
+        with open(path, 'rb') as f:
+            data = f.read()
+        assert data == (b'\x0a\x0b\x0c' * (len(data) // 3 + 1))[:len(data)]
+
+    def test_verify_fixed_pattern(self, temp_dir):
+        """Test that fixed patterns are verified at every phase."""
+        path = make_file(temp_dir, 8192, fill=b'\x55\xaa')
+        assert raw_wipe.verify_wipe(path, [(0, 8192)], 512, pattern=b'\x55\xaa') == []
+        assert raw_wipe.verify_wipe(path, [(1, 8191)], 512, pattern=b'\x55\xaa') == []
+        assert raw_wipe.verify_wipe(path, [(0, 8192)], 512, pattern=b'\xaa\x55') == [0]
+
+
+class Interrupt(Exception):
+    pass
+
+
+class InterruptingBudget:
+    """Stands in for a TokenBucket and interrupts the wipe after a number of blocks."""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def consume(self, n):
+        self.blocks -= 1
+        if self.blocks < 0:
+            raise Interrupt()
+
+
+class TestResume:
+    """Tests for checkpointed and resumed wipes."""
+
+    def wipe(self, path, directory, resume=False, budget=None, report=None, sequence=('0xff', 'random', '0x0a0b0c')):
+        with patch.object(raw_wipe, 'do_umount'):
+            with patch.object(raw_wipe, 'Checkpoint', functools.partial(Checkpoint, interval=0)):
+                return raw_wipe.raw_wipe(path, 1, 'zero', False, None, 64 * 1024, verify='full', report=report,
+                                         sequence=list(sequence), budget=budget,
+                                         resume=resume, checkpoint_dir=directory)
+
+    def test_resume_random_pass(self, temp_dir, capsys):
+        """Test that an interrupted random pass continues with the same keystream and is verified."""
+        path = make_file(temp_dir, MIB, fill=b'\0')
+        directory = os.path.join(temp_dir, 'state')
+        # 16 blocks for the first pass, then 5 of the random pass
+        with pytest.raises(Interrupt):
+            self.wipe(path, directory, budget=InterruptingBudget(21))
+        state = Checkpoint('wipe', path, {}, directory).path
+        with open(state) as f:
+            saved = json.load(f)['state']
+        assert saved['pass_index'] == 1
+        assert saved['offset'] == 5 * 64 * 1024
+
+        report = {}
+        with patch.object(raw_wipe, 'wipe_pass', wraps=raw_wipe.wipe_pass) as mock_pass:
+            assert self.wipe(path, directory, resume=True, report=report) == "success"
+        assert mock_pass.call_args_list[0][1]['start'] == 5 * 64 * 1024
+        assert report['resumed'] == {'pass': 2, 'offset': 5 * 64 * 1024}
+        assert [record['pattern'] for record in report['passes']] == ['0xff', 'random', '0x0a0b0c']
+        assert not os.path.exists(state)
+
+    def test_random_pass_keystream_is_continued(self, temp_dir, capsys):
+        """Test that the resumed part of a random pass continues the interrupted keystream."""
+        path = make_file(temp_dir, MIB, fill=b'\0')
+        directory = os.path.join(temp_dir, 'state')
+        with pytest.raises(Interrupt):
+            self.wipe(path, directory, budget=InterruptingBudget(21), sequence=['0xff', 'random'])
+        # A full verification against the seed fails if the blocks written before the
+        # interruption came from another keystream
+        report = {}
+        assert self.wipe(path, directory, resume=True, report=report, sequence=['0xff', 'random']) == "success"
+        assert report['verification']['result'] == 'passed'
+
+    def test_without_resume_starts_over(self, temp_dir, capsys):
+        """Test that a checkpoint is only used with resume."""
+        path = make_file(temp_dir, MIB, fill=b'\0')
+        directory = os.path.join(temp_dir, 'state')
+        with pytest.raises(Interrupt):
+            self.wipe(path, directory, budget=InterruptingBudget(21))
+        report = {}
+        with patch.object(raw_wipe, 'wipe_pass', wraps=raw_wipe.wipe_pass) as mock_pass:
+            assert self.wipe(path, directory, report=report) == "success"
+        assert mock_pass.call_count == 3
+        assert 'resumed' not in report
@@ -0,0 +1,343 @@
+"""
+Tests for raw_write module.
+"""
+import bz2
+import errno
+import functools
+import gzip
+import io
+import json
+import os
+import pytest
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+pytest.importorskip('parted')
+import raw_write
+from bmap import BmapBuilder, save_bmap
+from checkpoint import Checkpoint
+from encoders import ParallelCompressor, LEVELS
+
+MIB = 1024 ** 2
+SECTOR = 512
+
+
+def make_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def sample_image(size):
+    """Random data with a zero gap in the middle, so that a block map skips part of it."""
+    return os.urandom(size // 2) + bytes(size // 4) + os.urandom(size - size // 2 - size // 4)
+
+
+def fake_device(path):
+    """A parted device for a regular file, sized like the file."""
+    return MagicMock(sectorSize=SECTOR, getLength=lambda: os.path.getsize(path) // SECTOR)
+
+
+@contextmanager
+def file_targets():
+    """Lets raw_write treat regular files as target devices."""
+    with patch.object(raw_write, 'do_umount'):
+        with patch.object(raw_write.parted, 'getDevice', side_effect=fake_device):
+            yield
+
+
+def write(source, targets, **options):
+    """Runs raw_write and returns its exit status."""
+    with file_targets():
+        with pytest.raises(SystemExit) as exit_info:
+            raw_write.raw_write(source, targets, **options)
+    return exit_info.value.code
+
+
+class TestSpaceCheck:
+    """Tests for the check that the image fits on the targets."""
+
+    def test_bmap_size_checked(self, temp_dir, capsys):
+        """Test that the size from a block map rules out a target too small for a bzip2 image."""
+        image = os.urandom(MIB) + bytes(19 * MIB)
+        builder = BmapBuilder()
+        builder.update(image)
+        bmap_path = os.path.join(temp_dir, 'image.bmap')
+        save_bmap(bmap_path, builder.finish())
+        source = make_file(os.path.join(temp_dir, 'image.bz2'), bz2.compress(image))
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(8 * MIB))
+
+        assert write(source, [target], bmap_path=bmap_path) == 3
+        assert capsys.readouterr().out.split() == ['nospace']
+        assert read_file(target) == bytes(8 * MIB)
+
+    def test_raw_image_too_large(self, temp_dir, capsys):
+        """Test that a raw image larger than the target is not written."""
+        source = make_file(os.path.join(temp_dir, 'image.img'), sample_image(2 * MIB))
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(MIB))
+        assert write(source, [target]) == 3
+        assert capsys.readouterr().out.split() == ['nospace']
+
+
+class TestBmap:
+    """Tests for writes driven by a block map."""
+
+    def test_source_shorter_than_bmap(self, temp_dir, capsys):
+        """Test that a raw source truncated against its block map fails the write, even when verified."""
+        image = sample_image(4 * MIB)
+        builder = BmapBuilder()
+        builder.update(image)
+        bmap_path = os.path.join(temp_dir, 'image.bmap')
+        save_bmap(bmap_path, builder.finish())
+        source = make_file(os.path.join(temp_dir, 'image.img'), image[:MIB])
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(4 * MIB))
+
+        assert write(source, [target], bmap_path=bmap_path, verify='sha256') == 4
+        assert capsys.readouterr().out.split()[-1] == 'failed'
+
+
+class TestDirect:
+    """Tests for writes with --direct."""
+
+    def test_falls_back_without_direct_io(self, temp_dir, capsys):
+        """Test that a target refusing O_DIRECT is written through the page cache."""
+        image = sample_image(2 * MIB)
+        source = make_file(os.path.join(temp_dir, 'image.img'), image)
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(2 * MIB))
+        os_open = os.open
+
+        def no_direct(path, flags, *args):
+            if flags & os.O_DIRECT:
+                raise OSError(errno.EINVAL, "Invalid argument")
+            return os_open(path, flags, *args)
+        with patch.object(raw_write.os, 'open', side_effect=no_direct):
+            assert write(source, [target], direct=True) == 0
+        assert capsys.readouterr().out.split()[-1] == '1.0'
+        assert read_file(target) == image
+
+    def test_other_errors_fail(self, temp_dir, capsys):
+        """Test that errors other than EINVAL still fail the target."""
+        source = make_file(os.path.join(temp_dir, 'image.img'), sample_image(MIB))
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(MIB))
+        os_open = os.open
+
+        def busy(path, flags, *args):
+            if flags & os.O_DIRECT:
+                raise OSError(errno.EBUSY, "Device or resource busy")
+            return os_open(path, flags, *args)
+        with patch.object(raw_write.os, 'open', side_effect=busy):
+            assert write(source, [target], direct=True) == 4
+
+
+class KeepOpenBytesIO(io.BytesIO):
+    """BytesIO that keeps its contents readable after close()."""
+
+    def close(self):
+        pass
+
+
+class TestCorruptImage:
+    """Tests for images that no longer match what was compressed."""
+
+    @pytest.mark.parametrize("method", ['lz4', 'zstd'])
+    def test_flipped_byte_fails_write(self, temp_dir, capsys, method):
+        """Test that a flipped byte in a block-compressed image fails the write instead of writing wrong data."""
+        if method == 'zstd' and not raw_write.ZSTD_AVAILABLE:
+            pytest.skip("zstandard not installed")
+        out = KeepOpenBytesIO()
+        with ParallelCompressor(out, method, LEVELS[method][1], threads=2, block_size=MIB) as writer:
+            writer.write(sample_image(4 * MIB))
+        corrupted = bytearray(out.getvalue())
+        corrupted[len(corrupted) // 2] ^= 0x01
+        source = make_file(os.path.join(temp_dir, 'image'), bytes(corrupted))
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(4 * MIB))
+
+        assert write(source, [target]) == 4
+        assert capsys.readouterr().out.split()[-1] == 'failed'
+
+
+    def test_truncated_zstd_fails_write(self, temp_dir, capsys):
+        """Test that a zstd image decoding to fewer bytes than its frames declare fails the write."""
+        if not raw_write.ZSTD_AVAILABLE:
+            pytest.skip("zstandard not installed")
+        out = KeepOpenBytesIO()
+        with ParallelCompressor(out, 'zstd', 3, threads=2, block_size=MIB) as writer:
+            writer.write(sample_image(4 * MIB))
+        source = make_file(os.path.join(temp_dir, 'image.zst'), out.getvalue()[:-1000])
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(4 * MIB))
+
+        # The stream decoder, used on a single CPU, stops at the end of the data without an error
+        with patch.object(raw_write, 'open_parallel_decoder', return_value=None):
+            assert write(source, [target]) == 4
+        assert capsys.readouterr().out.split()[-1] == 'failed'
+
+
+def open_writer(target, source_size=None, **options):
+    """Opens a TargetWriter on a regular file, recording the data written to it."""
+    writer = raw_write.TargetWriter(target, **options)
+    with file_targets():
+        writer.open(source_size, source_size is not None)
+    writer.output_file = MagicMock(wraps=writer.output_file)
+    return writer
+
+
+def write_chunks(writer, image, chunk_size=64 * 1024):
+    """Feeds image to writer in chunks, as the pipeline does, and finishes the write."""
+    writer.start()
+    for offset in range(0, len(image), chunk_size):
+        view = memoryview(image)[offset:offset + chunk_size]
+        end = offset + len(view)
+        writer.consume(([(offset, view, False)], end, end / len(image)))
+    writer.finish((None, None, []))
+
+
+class TestIncremental:
+    """Tests for incremental writes, which only rewrite the chunks that differ."""
+
+    def test_unchanged_target(self, temp_dir, capsys):
+        """Test that a target already holding the image is not written to."""
+        image = sample_image(MIB)
+        target = make_file(os.path.join(temp_dir, 'target'), image)
+        writer = open_writer(target, len(image), incremental=True)
+        write_chunks(writer, image)
+        assert writer.status == "success"
+        assert writer.unchanged == MIB
+        assert not writer.output_file.write.called
+        assert read_file(target) == image
+
+    def test_partially_changed_target(self, temp_dir, capsys):
+        """Test that only the chunks that differ are rewritten and counted as changed."""
+        image = sample_image(MIB)
+        stale = bytearray(image)
+        stale[100] ^= 0xff
+        stale[5 * 64 * 1024 + 7] ^= 0xff
+        target = make_file(os.path.join(temp_dir, 'target'), bytes(stale))
+        writer = open_writer(target, len(image), incremental=True)
+        write_chunks(writer, image)
+        assert writer.status == "success"
+        assert writer.unchanged == MIB - 2 * 64 * 1024
+        assert [len(c[0][0]) for c in writer.output_file.write.call_args_list] == [64 * 1024, 64 * 1024]
+        assert read_file(target) == image
+
+    def test_target_shorter_than_image(self, temp_dir, capsys):
+        """Test that chunks past the end of the target are written, not compared."""
+        image = sample_image(MIB)
+        target = make_file(os.path.join(temp_dir, 'target'), image[:MIB // 2 + 100])
+        writer = open_writer(target, incremental=True)
+        write_chunks(writer, image)
+        assert writer.status == "success"
+        assert writer.unchanged == MIB // 2
+        assert len(writer.output_file.write.call_args_list) == 8
+        assert read_file(target) == image
+
+    def test_raw_write_incremental(self, temp_dir, capsys):
+        """Test an incremental write of a raw image through raw_write."""
+        image = sample_image(3 * MIB)
+        source = make_file(os.path.join(temp_dir, 'image.img'), image)
+        target = make_file(os.path.join(temp_dir, 'target'), image[:MIB] + bytes(2 * MIB))
+        assert write(source, [target], incremental=True) == 0
+        assert capsys.readouterr().out.split()[-1] == '1.0'
+        assert read_file(target) == image
+
+
+class InterruptedWrite(Exception):
+    pass
+
+
+def interrupt_after(chunks):
+    """Makes every target fail after chunks chunks, as if the write had been interrupted there."""
+    consume = raw_write.TargetWriter.consume
+    consumed = []
+
+    def interrupted(writer, item):
+        if len(consumed) == chunks:
+            raise InterruptedWrite()
+        consumed.append(item)
+        consume(writer, item)
+    return patch.object(raw_write.TargetWriter, 'consume', interrupted)
+
+
+class TestResume:
+    """Tests for checkpointed and resumed writes."""
+
+    def write(self, source, target, directory, resume=False):
+        with patch.object(raw_write, 'Checkpoint', functools.partial(Checkpoint, interval=0)):
+            return write(source, [target], resume=resume, checkpoint_dir=directory)
+
+    def resume(self, source, target, directory):
+        """Resumes the write and returns the offsets it wrote to."""
+        with patch.object(raw_write.TargetWriter, 'write_at', autospec=True, side_effect=raw_write.TargetWriter.write_at) as mock_write:
+            assert self.write(source, target, directory, resume=True) == 0
+        return [c[0][1] for c in mock_write.call_args_list]
+
+    def interrupted_gzip_write(self, temp_dir):
+        image = sample_image(4 * MIB)
+        source = make_file(os.path.join(temp_dir, 'image.gz'), gzip.compress(image, compresslevel=1))
+        target = make_file(os.path.join(temp_dir, 'target'), b'\xff' * 4 * MIB)
+        directory = os.path.join(temp_dir, 'state')
+        with interrupt_after(2):
+            assert self.write(source, target, directory) == 4
+        return image, source, target, directory
+
+    def test_resume_compressed_image(self, temp_dir, capsys):
+        """Test that a compressed image is decoded from the start but only written from the checkpoint."""
+        image, source, target, directory = self.interrupted_gzip_write(temp_dir)
+        state = Checkpoint('write', target, {}, directory).path
+        with open(state) as f:
+            assert json.load(f)['state']['offset'] == 2 * MIB
+
+        assert self.resume(source, target, directory) == [2 * MIB, 3 * MIB]
+        assert read_file(target) == image
+        assert not os.path.exists(state)
+
+    def test_resume_raw_image(self, temp_dir, capsys):
+        """Test that a raw image copied by the kernel continues from the checkpoint."""
+        image = sample_image(4 * MIB)
+        source = make_file(os.path.join(temp_dir, 'image.img'), image)
+        target = make_file(os.path.join(temp_dir, 'target'), b'\xff' * 4 * MIB)
+        directory = os.path.join(temp_dir, 'state')
+        kernel_copy = raw_write.kernel_copy
+
+        def interrupted_copy(src_fd, dst_fd, count, offset=0):
+            for i, n in enumerate(kernel_copy(src_fd, dst_fd, count, offset=offset, chunk_size=MIB)):
+                if i == 2:
+                    raise InterruptedWrite()
+                yield n
+        with patch.object(raw_write, 'kernel_copy', interrupted_copy):
+            assert self.write(source, target, directory) == 4
+
+        with patch.object(raw_write, 'kernel_copy', wraps=kernel_copy) as mock_copy:
+            assert self.write(source, target, directory, resume=True) == 0
+        assert mock_copy.call_args[0][2] == 2 * MIB
+        assert mock_copy.call_args[1]['offset'] == 2 * MIB
+        assert read_file(target) == image
+
+    def test_checkpoint_of_other_image_rejected(self, temp_dir, capsys):
+        """Test that a checkpoint saved while writing another image is not resumed."""
+        _, source, target, directory = self.interrupted_gzip_write(temp_dir)
+        mtime = os.stat(source).st_mtime_ns
+        image = sample_image(4 * MIB)
+        make_file(source, gzip.compress(image, compresslevel=1))
+        os.utime(source, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+        assert self.resume(source, target, directory)[0] == 0
+        assert read_file(target) == image
+
+    def test_checkpoint_of_other_target_rejected(self, temp_dir, capsys):
+        """Test that a checkpoint is not resumed on a target that is no longer the same device."""
+        image, source, target, directory = self.interrupted_gzip_write(temp_dir)
+        make_file(target, b'\xff' * 5 * MIB)
+        assert self.resume(source, target, directory)[0] == 0
+        assert read_file(target) == image + b'\xff' * MIB
+
+    def test_without_resume_starts_over(self, temp_dir, capsys):
+        """Test that a checkpoint is only used with resume."""
+        image, source, target, directory = self.interrupted_gzip_write(temp_dir)
+        with patch.object(raw_write.TargetWriter, 'write_at', autospec=True, side_effect=raw_write.TargetWriter.write_at) as mock_write:
+            assert self.write(source, target, directory) == 0
+        assert mock_write.call_args_list[0][0][1] == 0
+        assert read_file(target) == image
@@ -0,0 +1,44 @@
+"""
+Tests for scheduler module.
+"""
+import scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket class."""
+
+    def test_burst_then_rate(self):
+        """Test that a full bucket lets a burst through and then limits to the rate."""
+        clock = FakeClock()
+        bucket = scheduler.TokenBucket(1000, clock=clock, sleep=clock.sleep)
+        bucket.consume(1000)
+        assert clock.now == 0
+        for _ in range(4):
+            bucket.consume(500)
+        assert clock.now == 2.0
+
+    def test_refill_is_capped(self):
+        """Test that an idle bucket does not save up more than burst bytes."""
+        clock = FakeClock()
+        bucket = scheduler.TokenBucket(1000, burst=2000, clock=clock, sleep=clock.sleep)
+        clock.now = 100.0
+        bucket.consume(3000)
+        assert clock.now == 101.0
+
+    def test_large_requests(self):
+        """Test that requests larger than the burst wait for their share."""
+        clock = FakeClock()
+        bucket = scheduler.TokenBucket(100, burst=10, clock=clock, sleep=clock.sleep)
+        bucket.consume(510)
+        assert clock.now == 5.0
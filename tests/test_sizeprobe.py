@@ -0,0 +1,101 @@
+"""
+Tests for sizeprobe module.
+"""
+import gzip
+import lzma
+import os
+import struct
+import pytest
+
+import sizeprobe
+
+
+def write_file(temp_dir, name, data):
+    path = os.path.join(temp_dir, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def zstd_raw_frame(payload, with_size=True):
+    """Builds a zstd frame holding payload in a single raw block."""
+    if with_size:
+        # Single segment, 1-byte frame content size
+        header = struct.pack('<I', sizeprobe.ZSTD_MAGIC) + bytes([0x20, len(payload)])
+    else:
+        # No content size, 1-byte window descriptor
+        header = struct.pack('<I', sizeprobe.ZSTD_MAGIC) + bytes([0x00, 0x00])
+    block = (1 | (len(payload) << 3)).to_bytes(3, 'little')
+    return header + block + payload
+
+
+def lz4_raw_frame(payload, with_size=True):
+    """Builds an lz4 frame holding payload in a single uncompressed block."""
+    flags = 0x40 | (0x08 if with_size else 0)
+    header = struct.pack('<I', sizeprobe.LZ4_MAGIC) + bytes([flags, 0x40])
+    if with_size:
+        header += struct.pack('<Q', len(payload))
+    header += b'\x00'  # Header checksum, not validated by the probe
+    block = struct.pack('<I', len(payload) | 0x80000000) + payload
+    return header + block + struct.pack('<I', 0)
+
+
+class TestProbeUncompressedSize:
+    """Tests for probe_uncompressed_size function."""
+
+    def test_gzip_is_lower_bound(self, temp_dir):
+        """Test that gzip reports ISIZE as a lower bound."""
+        path = write_file(temp_dir, 'image.gz', gzip.compress(b'x' * 5000))
+        assert sizeprobe.probe_uncompressed_size(path, 'gzip') == (5000, False)
+
+    def test_xz_multi_stream(self, temp_dir):
+        """Test that every concatenated xz stream is counted, including padding."""
+        data = lzma.compress(b'a' * 3000) + b'\x00' * 8 + lzma.compress(b'b' * 7000)
+        path = write_file(temp_dir, 'image.xz', data)
+        assert sizeprobe.probe_uncompressed_size(path, 'xz') == (10000, True)
+
+    def test_xz_block_offsets(self, temp_dir):
+        """Test that block records point at the start of each block."""
+        data = lzma.compress(b'a' * 3000)
+        path = write_file(temp_dir, 'image.xz', data)
+        with open(path, 'rb') as f:
+            streams = sizeprobe.xz_streams(f)
+        assert len(streams) == 1
+        stream_offset, _, blocks = streams[0]
+        assert stream_offset == 0
+        assert blocks[0][0] == 12
+        assert blocks[0][2] == 3000
+
+    def test_zstd_frames(self, temp_dir):
+        """Test that frame content sizes are summed across frames and skippable frames."""
+        skippable = struct.pack('<II', 0x184D2A50, 3) + b'abc'
+        data = zstd_raw_frame(b'hello') + skippable + zstd_raw_frame(b'world!')
+        path = write_file(temp_dir, 'image.zst', data)
+        assert sizeprobe.probe_uncompressed_size(path, 'zstd') == (11, True)
+
+    def test_zstd_without_content_size(self, temp_dir):
+        """Test that a frame without a content size makes the size unknown."""
+        path = write_file(temp_dir, 'image.zst', zstd_raw_frame(b'hello', with_size=False))
+        assert sizeprobe.probe_uncompressed_size(path, 'zstd') == (None, False)
+
+    def test_lz4_frames(self, temp_dir):
+        """Test that lz4 content sizes are summed across frames."""
+        data = lz4_raw_frame(b'hello') + lz4_raw_frame(b'abc')
+        path = write_file(temp_dir, 'image.lz4', data)
+        assert sizeprobe.probe_uncompressed_size(path, 'lz4') == (8, True)
+
+    def test_lz4_without_content_size(self, temp_dir):
+        """Test that a frame without a content size makes the size unknown."""
+        path = write_file(temp_dir, 'image.lz4', lz4_raw_frame(b'hello', with_size=False))
+        assert sizeprobe.probe_uncompressed_size(path, 'lz4') == (None, False)
+
+    @pytest.mark.parametrize("method", ['xz', 'zstd', 'lz4'])
+    def test_corrupt_file(self, temp_dir, method):
+        """Test that unparsable files are reported as unknown instead of raising."""
+        path = write_file(temp_dir, 'image', b'not an image at all')
+        assert sizeprobe.probe_uncompressed_size(path, method) == (None, False)
+
+    def test_bzip2_is_unknown(self, temp_dir):
+        """Test that bzip2, which records no size, is reported as unknown."""
+        path = write_file(temp_dir, 'image.bz2', b'BZh9')
+        assert sizeprobe.probe_uncompressed_size(path, 'bzip2') == (None, False)